@@ -4,12 +4,21 @@ Sistema de Gestión de Presupuestos
 """
 
 import sys
+import time
 import traceback
+
+# Referencia para el cronómetro de arranque (--debug): antes de importar la interfaz
+INICIO_ARRANQUE = time.perf_counter()
+
 import tkinter as tk
 from ui.app import AppPresupuestos
+from ui.cronometro import Cronometro
 
 def main():
     """Función principal que inicia la aplicación"""
+    cronometro = Cronometro(activo='--debug' in sys.argv[1:], inicio=INICIO_ARRANQUE)
+    cronometro.fase("importaciones")
+
     try:
         root = tk.Tk()
     except Exception as e:
@@ -18,7 +27,7 @@ def main():
         return
 
     try:
-        app = AppPresupuestos(root)
+        app = AppPresupuestos(root, cronometro=cronometro)
     except Exception as e:
         print("Error iniciando la aplicación:", e)
         traceback.print_exc()
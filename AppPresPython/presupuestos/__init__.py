@@ -3,13 +3,7 @@ Sistema de Gestión de Presupuestos
 Aplicación para gestionar clientes, materiales y presupuestos
 """
 
-from .clientes import cliente_manager
-from .materiales import material_manager
-from .presupuestos import presupuesto_manager
-from .facturas import factura_manager
-from .utils import db
-from .pdf_generator import pdf_generator
-from .email_sender import email_sender
+import importlib
 
 __version__ = "1.0.0"
 __author__ = "Sistema de Presupuestos"
@@ -21,5 +15,25 @@ __all__ = [
     'factura_manager',
     'db',
     'pdf_generator',
-    'email_sender'
+    'email_sender',
+    'crear_contexto'
 ]
+
+# Los submódulos se importan al acceder al atributo: importar el paquete no
+# carga reportlab ni tkinter ni abre la base de datos
+_SUBMODULOS = {
+    'cliente_manager': '.clientes',
+    'material_manager': '.materiales',
+    'presupuesto_manager': '.presupuestos',
+    'factura_manager': '.facturas',
+    'db': '.utils',
+    'pdf_generator': '.pdf_generator',
+    'email_sender': '.email_sender',
+    'crear_contexto': '.contexto',
+}
+
+
+def __getattr__(nombre):
+    if nombre in _SUBMODULOS:
+        return getattr(importlib.import_module(_SUBMODULOS[nombre], __name__), nombre)
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
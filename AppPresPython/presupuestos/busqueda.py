@@ -0,0 +1,137 @@
+"""
+Búsqueda de texto con índices FTS5.
+
+Las tablas *_fts se crean en la migración 'busqueda_texto' (si el SQLite
+instalado incluye FTS5) y se mantienen con triggers. Usan el tokenizador
+unicode61 con remove_diacritics 2, así que 'perez' encuentra 'Pérez'. Cada
+palabra del término se busca como prefijo ("gar"* encuentra 'García').
+Si FTS5 no está disponible los managers recurren a LIKE.
+"""
+import re
+import unicodedata
+from datetime import date
+from typing import List, Optional, Tuple
+
+TOKENIZADOR = "unicode61 remove_diacritics 2"
+
+# (tabla FTS, tabla de contenido, columnas indexadas)
+TABLAS_FTS = [
+    ('clientes_fts', 'clientes', ('nombre', 'telefono', 'email', 'dni')),
+    ('materiales_fts', 'materiales', ('nombre',)),
+]
+
+# Función de relevancia por tabla (columna rank): en clientes el nombre pesa más que el resto
+RELEVANCIA = {
+    'clientes_fts': 'bm25(10.0, 2.0, 2.0, 5.0)',
+}
+
+# Por encima de este número de coincidencias ordenar por relevancia cuesta más que la
+# propia búsqueda (prefijos de una o dos letras): se listan las más recientes primero
+UMBRAL_RELEVANCIA = 2000
+
+_PALABRA = re.compile(r"\w+", re.UNICODE)
+# Marcas diacríticas combinables (tildes, diéresis, virgulilla de la ñ...)
+_DIACRITICOS = re.compile("[\u0300-\u036f]")
+_FECHA = re.compile(r"^(\d{4})(?:-(\d{1,2})(?:-(\d{1,2}))?)?$")
+
+
+def normalizar_texto(texto: Optional[str]) -> str:
+    """Texto en minúsculas y sin acentos, para comparar como lo hace el índice FTS"""
+    texto = texto or ''
+    if texto.isascii():
+        return texto.lower()
+    return _DIACRITICOS.sub('', unicodedata.normalize('NFKD', texto)).casefold()
+
+
+def palabras_normalizadas(texto: Optional[str]) -> List[str]:
+    """Palabras normalizadas de un texto"""
+    return _PALABRA.findall(normalizar_texto(texto))
+
+
+def fts5_disponible(cursor) -> bool:
+    """Comprueba si el SQLite enlazado incluye el módulo FTS5"""
+    try:
+        cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp._prueba_fts5 USING fts5(x)")
+        cursor.execute("DROP TABLE IF EXISTS temp._prueba_fts5")
+        return True
+    except Exception:
+        return False
+
+
+def crear_indices_fts(cursor):
+    """Crea las tablas FTS5 externas, sus triggers de sincronización y las reconstruye"""
+    for tabla_fts, tabla, columnas in TABLAS_FTS:
+        lista = ", ".join(columnas)
+        nuevos = ", ".join(f"new.{columna}" for columna in columnas)
+        viejos = ", ".join(f"old.{columna}" for columna in columnas)
+
+        cursor.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {tabla_fts} USING fts5(
+                {lista}, content='{tabla}', content_rowid='id', tokenize='{TOKENIZADOR}'
+            )
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {tabla_fts}_ai AFTER INSERT ON {tabla} BEGIN
+                INSERT INTO {tabla_fts} (rowid, {lista}) VALUES (new.id, {nuevos});
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {tabla_fts}_ad AFTER DELETE ON {tabla} BEGIN
+                INSERT INTO {tabla_fts} ({tabla_fts}, rowid, {lista}) VALUES ('delete', old.id, {viejos});
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {tabla_fts}_au AFTER UPDATE OF {lista} ON {tabla} BEGIN
+                INSERT INTO {tabla_fts} ({tabla_fts}, rowid, {lista}) VALUES ('delete', old.id, {viejos});
+                INSERT INTO {tabla_fts} (rowid, {lista}) VALUES (new.id, {nuevos});
+            END
+        """)
+        if tabla_fts in RELEVANCIA:
+            cursor.execute(f"INSERT INTO {tabla_fts} ({tabla_fts}, rank) VALUES ('rank', ?)",
+                           (RELEVANCIA[tabla_fts],))
+        cursor.execute(f"INSERT INTO {tabla_fts} ({tabla_fts}) VALUES ('rebuild')")
+
+
+def expresion_fts(termino: Optional[str], columna: Optional[str] = None) -> Optional[str]:
+    """Convierte el texto tecleado en una consulta FTS5 de prefijos (None si no hay palabras)"""
+    palabras = _PALABRA.findall(termino or "")
+    if not palabras:
+        return None
+    expresion = " ".join(f'"{palabra}"*' for palabra in palabras)
+    return f"{columna} : ({expresion})" if columna else expresion
+
+
+def contar_coincidencias(db_manager, tabla_fts: str, expresion: str) -> int:
+    """Número de filas que casan con la expresión, contado solo sobre el índice FTS"""
+    result = db_manager.execute_query(
+        f"SELECT COUNT(*) as total FROM {tabla_fts} WHERE {tabla_fts} MATCH ?", (expresion,)
+    )
+    return result[0]['total'] if result else 0
+
+
+def orden_coincidencias(tabla_fts: str, total: int) -> str:
+    """ORDER BY de una búsqueda FTS: por relevancia si hay pocas coincidencias, recientes primero si no"""
+    if total <= UMBRAL_RELEVANCIA:
+        return f"{tabla_fts}.rank, {tabla_fts}.rowid"
+    return f"{tabla_fts}.rowid DESC"
+
+
+def rango_fecha_termino(termino: Optional[str]) -> Optional[Tuple[str, str]]:
+    """Si el término es un prefijo de fecha (AAAA, AAAA-MM o AAAA-MM-DD) devuelve el rango [inicio, fin)"""
+    coincidencia = _FECHA.match((termino or "").strip())
+    if not coincidencia:
+        return None
+    anio, mes, dia = coincidencia.groups()
+    try:
+        if dia:
+            inicio = date(int(anio), int(mes), int(dia))
+            fin = date.fromordinal(inicio.toordinal() + 1)
+        elif mes:
+            inicio = date(int(anio), int(mes), 1)
+            fin = date(inicio.year + (inicio.month == 12), inicio.month % 12 + 1, 1)
+        else:
+            inicio = date(int(anio), 1, 1)
+            fin = date(int(anio) + 1, 1, 1)
+    except ValueError:
+        return None
+    return inicio.isoformat(), fin.isoformat()
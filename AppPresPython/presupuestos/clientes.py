@@ -1,10 +1,65 @@
-from .utils import db
-from typing import List, Dict, Any, Optional
+from .utils import (db, filtro_rango_fechas, clausula_limite, paginar_por_clave, CacheEnMemoria,
+                    DatabaseManager, ROW_DICT, TAMANO_PAGINA, PAGINA_SIGUIENTE, metrica_en_cache)
+from .busqueda import expresion_fts, contar_coincidencias, orden_coincidencias, normalizar_texto
+from collections import defaultdict
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta
+import re
+
+_SEPARADORES_DNI = re.compile(r"[\s.\-]")
+
+
+def normalizar_dni(dni: Optional[str]) -> str:
+    """DNI/NIF sin espacios, puntos ni guiones y en mayúsculas"""
+    return _SEPARADORES_DNI.sub('', dni or '').upper()
+
+
+class DirectorioClientes:
+    """Copia en memoria de la tabla de clientes con índices por ID, nombre y DNI"""
+    
+    def __init__(self, clientes: List[Dict[str, Any]]):
+        self._ordenados = list(clientes)
+        self._por_id = {c['id']: c for c in self._ordenados}
+        self._por_nombre: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._por_dni: Dict[str, Dict[str, Any]] = {}
+        for cliente in self._ordenados:
+            self._por_nombre[normalizar_texto(cliente['nombre']).strip()].append(cliente)
+            dni = normalizar_dni(cliente.get('dni'))
+            if dni:
+                self._por_dni.setdefault(dni, cliente)
+    
+    def __len__(self) -> int:
+        return len(self._ordenados)
+    
+    def todos(self) -> List[Dict[str, Any]]:
+        """Todos los clientes ordenados por nombre"""
+        return list(self._ordenados)
+    
+    def cliente(self, cliente_id: Optional[int]) -> Optional[Dict[str, Any]]:
+        """Cliente por ID (None si no existe)"""
+        return self._por_id.get(cliente_id)
+    
+    def por_nombre(self, nombre: str) -> List[Dict[str, Any]]:
+        """Clientes con ese nombre exacto, sin distinguir mayúsculas ni acentos"""
+        return list(self._por_nombre.get(normalizar_texto(nombre).strip(), ()))
+    
+    def por_dni(self, dni: str) -> Optional[Dict[str, Any]]:
+        """Cliente con ese DNI/NIF, ignorando espacios, puntos y guiones"""
+        return self._por_dni.get(normalizar_dni(dni))
+
 
 class ClienteManager:
-    def __init__(self):
-        self.db = db
+    def __init__(self, db_manager: Optional[DatabaseManager] = None):
+        self.db = db_manager or db
+        self._directorio = CacheEnMemoria(lambda: DirectorioClientes(self.obtener_clientes()))
+    
+    def directorio(self) -> DirectorioClientes:
+        """Directorio de clientes en memoria; se carga en el primer uso y tras cada cambio"""
+        return self._directorio.obtener()
+    
+    def invalidar_directorio(self):
+        """Descarta el directorio en memoria tras crear, modificar o eliminar clientes"""
+        self._directorio.invalidar()
     
     def crear_cliente(self, nombre: str, telefono: str = "", email: str = "", direccion: str = "", dni: str = "") -> int:
         """Crea un nuevo cliente en la base de datos"""
@@ -12,12 +67,16 @@ class ClienteManager:
             INSERT INTO clientes (nombre, telefono, email, direccion, dni)
             VALUES (?, ?, ?, ?, ?)
         """
-        return self.db.execute_update(query, (nombre, telefono, email, direccion, dni))
+        cliente_id = self.db.execute_update(query, (nombre, telefono, email, direccion, dni))
+        self.invalidar_directorio()
+        return cliente_id
     
-    def obtener_clientes(self) -> List[Dict[str, Any]]:
-        """Obtiene todos los clientes de la base de datos"""
-        query = "SELECT * FROM clientes ORDER BY nombre"
-        return self.db.execute_query(query)
+    def obtener_clientes(self, row_mode: str = ROW_DICT, limite: Optional[int] = None,
+                         desplazamiento: int = 0) -> List[Dict[str, Any]]:
+        """Obtiene todos los clientes de la base de datos (o una página con limite/desplazamiento)"""
+        limite_sql, params_limite = clausula_limite(limite, desplazamiento)
+        query = f"SELECT * FROM clientes ORDER BY nombre, id {limite_sql}"
+        return self.db.execute_query(query, tuple(params_limite), row_mode=row_mode)
     
     def obtener_cliente_por_id(self, cliente_id: int) -> Optional[Dict[str, Any]]:
         """Obtiene un cliente específico por su ID"""
@@ -25,15 +84,65 @@ class ClienteManager:
         results = self.db.execute_query(query, (cliente_id,))
         return results[0] if results else None
     
-    def buscar_clientes(self, termino: str) -> List[Dict[str, Any]]:
-        """Busca clientes por nombre, teléfono, email o DNI"""
-        query = """
+    def _filtro_busqueda(self, termino: str) -> Tuple[str, List[Any]]:
+        """Condición WHERE para el término: índice FTS5 si existe, LIKE si no"""
+        expresion = expresion_fts(termino)
+        if expresion and self.db.tiene_busqueda_fts():
+            return "id IN (SELECT rowid FROM clientes_fts WHERE clientes_fts MATCH ?)", [expresion]
+        termino_busqueda = f"%{termino}%"
+        return "(nombre LIKE ? OR telefono LIKE ? OR email LIKE ? OR dni LIKE ?)", [termino_busqueda] * 4
+    
+    def buscar_clientes(self, termino: str, row_mode: str = ROW_DICT, limite: Optional[int] = None,
+                        desplazamiento: int = 0) -> List[Dict[str, Any]]:
+        """Busca clientes por nombre, teléfono, email o DNI (por relevancia si hay índice FTS5)"""
+        limite_sql, params_limite = clausula_limite(limite, desplazamiento)
+        expresion = expresion_fts(termino)
+        if expresion and self.db.tiene_busqueda_fts():
+            orden = orden_coincidencias('clientes_fts', contar_coincidencias(self.db, 'clientes_fts', expresion))
+            query = f"""
+                SELECT c.* FROM clientes_fts
+                JOIN clientes c ON c.id = clientes_fts.rowid
+                WHERE clientes_fts MATCH ?
+                ORDER BY {orden}
+                {limite_sql}
+            """
+            return self.db.execute_query(query, (expresion, *params_limite), row_mode=row_mode)
+        
+        condicion, params = self._filtro_busqueda(termino)
+        query = f"""
             SELECT * FROM clientes 
-            WHERE nombre LIKE ? OR telefono LIKE ? OR email LIKE ? OR dni LIKE ?
-            ORDER BY nombre
+            WHERE {condicion}
+            ORDER BY nombre, id
+            {limite_sql}
         """
-        termino_busqueda = f"%{termino}%"
-        return self.db.execute_query(query, (termino_busqueda, termino_busqueda, termino_busqueda, termino_busqueda))
+        return self.db.execute_query(query, (*params, *params_limite), row_mode=row_mode)
+    
+    def contar_clientes(self, termino: Optional[str] = None) -> int:
+        """Cuenta los clientes del listado, opcionalmente filtrados por el término de búsqueda"""
+        expresion = expresion_fts(termino)
+        if expresion and self.db.tiene_busqueda_fts():
+            return contar_coincidencias(self.db, 'clientes_fts', expresion)
+        if termino:
+            condicion, params = self._filtro_busqueda(termino)
+            result = self.db.execute_query(f"SELECT COUNT(*) as total FROM clientes WHERE {condicion}", tuple(params))
+        else:
+            result = self.db.execute_query("SELECT COUNT(*) as total FROM clientes")
+        return result[0]['total'] if result else 0
+    
+    def listar_clientes_pagina(self, cursor: Optional[str] = None, tamano: int = TAMANO_PAGINA,
+                               direccion: str = PAGINA_SIGUIENTE, termino: Optional[str] = None,
+                               row_mode: str = ROW_DICT) -> Dict[str, Any]:
+        """Página de clientes por cursor (nombre, id) en orden alfabético.
+        
+        Devuelve {'filas', 'siguiente', 'anterior'} con los tokens para pedir la página contigua.
+        """
+        where_clauses = []
+        params: List[Any] = []
+        if termino:
+            condicion, params = self._filtro_busqueda(termino)
+            where_clauses.append(condicion)
+        return paginar_por_clave(self.db, "SELECT * FROM clientes", where_clauses, params,
+                                 ['nombre', 'id'], cursor, tamano, direccion, row_mode=row_mode)
     
     def actualizar_cliente(self, cliente_id: int, nombre: str, telefono: str = "", 
                           email: str = "", direccion: str = "", dni: str = "") -> bool:
@@ -45,19 +154,22 @@ class ClienteManager:
         """
         try:
             self.db.execute_update(query, (nombre, telefono, email, direccion, dni, cliente_id))
-            return True
         except:
             return False
+        self.invalidar_directorio()
+        return True
     
     def eliminar_cliente(self, cliente_id: int) -> bool:
         """Elimina un cliente de la base de datos"""
         query = "DELETE FROM clientes WHERE id = ?"
         try:
             self.db.execute_update(query, (cliente_id,))
-            return True
         except:
             return False
+        self.invalidar_directorio()
+        return True
     
+    @metrica_en_cache('estadisticas_clientes', por_dia=True)
     def obtener_estadisticas_clientes(self) -> Dict[str, Any]:
         """Obtiene estadísticas de clientes"""
         # Total de clientes activos (con al menos una factura o presupuesto)
@@ -75,12 +187,13 @@ class ClienteManager:
         
         # Clientes nuevos este mes
         fecha_inicio_mes = datetime.now().replace(day=1).strftime("%Y-%m-%d")
-        query_nuevos = """
+        clausulas_fecha, params_fecha = filtro_rango_fechas('fecha_creacion', fecha_inicio=fecha_inicio_mes)
+        query_nuevos = f"""
             SELECT COUNT(*) as total_nuevos
             FROM clientes
-            WHERE DATE(fecha_creacion) >= DATE(?)
+            WHERE {' AND '.join(clausulas_fecha)}
         """
-        result_nuevos = self.db.execute_query(query_nuevos, (fecha_inicio_mes,))
+        result_nuevos = self.db.execute_query(query_nuevos, tuple(params_fecha))
         clientes_nuevos_mes = result_nuevos[0]['total_nuevos'] if result_nuevos else 0
         
         # Clientes con facturas pendientes
@@ -0,0 +1,66 @@
+"""
+Contexto de aplicación: una base de datos y los managers que trabajan sobre ella.
+
+Todo se construye bajo demanda, así que crear un contexto no toca el disco.
+Permite abrir varias bases de datos en el mismo proceso (tests, herramientas
+de línea de comandos, importaciones) sin depender de las instancias globales.
+"""
+
+from typing import Optional
+
+from .utils import DatabaseManager
+from .clientes import ClienteManager
+from .materiales import MaterialManager
+from .presupuestos import PresupuestoManager
+from .facturas import FacturaManager
+
+
+class ContextoAplicacion:
+    def __init__(self, db_path: str = "presupuestos.db", perfil_almacenamiento: Optional[str] = None):
+        self.db_path = db_path
+        self.perfil_almacenamiento = perfil_almacenamiento
+        self._db: Optional[DatabaseManager] = None
+        self._clientes: Optional[ClienteManager] = None
+        self._materiales: Optional[MaterialManager] = None
+        self._presupuestos: Optional[PresupuestoManager] = None
+        self._facturas: Optional[FacturaManager] = None
+    
+    @property
+    def db(self) -> DatabaseManager:
+        if self._db is None:
+            self._db = DatabaseManager(self.db_path, self.perfil_almacenamiento)
+        return self._db
+    
+    @property
+    def clientes(self) -> ClienteManager:
+        if self._clientes is None:
+            self._clientes = ClienteManager(self.db)
+        return self._clientes
+    
+    @property
+    def materiales(self) -> MaterialManager:
+        if self._materiales is None:
+            self._materiales = MaterialManager(self.db)
+        return self._materiales
+    
+    @property
+    def presupuestos(self) -> PresupuestoManager:
+        if self._presupuestos is None:
+            self._presupuestos = PresupuestoManager(self.db)
+        return self._presupuestos
+    
+    @property
+    def facturas(self) -> FacturaManager:
+        if self._facturas is None:
+            self._facturas = FacturaManager(self.db, self.presupuestos)
+        return self._facturas
+    
+    def cerrar(self):
+        """Cierra las conexiones abiertas por este contexto"""
+        if self._db is not None:
+            self._db.close_all()
+
+
+def crear_contexto(db_path: str = "presupuestos.db", perfil_almacenamiento: Optional[str] = None) -> ContextoAplicacion:
+    """Crea un contexto de aplicación para la base de datos indicada"""
+    return ContextoAplicacion(db_path, perfil_almacenamiento)
@@ -0,0 +1,75 @@
+"""
+Aritmética monetaria en punto fijo.
+
+Los importes se manejan internamente como enteros de céntimos. Las
+conversiones desde float pasan por un contexto Decimal compartido y se
+cachean, de modo que cada valor distinto se convierte una sola vez.
+"""
+from decimal import Decimal, Context, ROUND_HALF_UP, ROUND_DOWN
+from functools import lru_cache
+from typing import Union
+
+Numero = Union[int, float, str, Decimal]
+
+# Contexto compartido: redondeo comercial (mitad hacia arriba)
+CONTEXTO = Context(prec=28, rounding=ROUND_HALF_UP)
+_UNIDAD = Decimal(1)
+_CENTIMO = Decimal('0.01')
+_CIEN = Decimal(100)
+
+TAMANO_CACHE = 8192
+
+
+def _decimal(valor: Numero) -> Decimal:
+    """Convierte a Decimal usando la representación corta del float"""
+    if isinstance(valor, Decimal):
+        return valor
+    if valor is None:
+        return Decimal(0)
+    if isinstance(valor, int):
+        return Decimal(valor)
+    return CONTEXTO.create_decimal(repr(float(valor)))
+
+
+@lru_cache(maxsize=TAMANO_CACHE)
+def a_centimos(valor: Numero) -> int:
+    """Convierte un importe en euros a céntimos, redondeando a la mitad hacia arriba"""
+    return int((_decimal(valor) * _CIEN).quantize(_UNIDAD, context=CONTEXTO))
+
+
+def a_euros(centimos: int) -> float:
+    """Convierte céntimos a euros (float con 2 decimales exactos en su repr)"""
+    return centimos / 100
+
+
+@lru_cache(maxsize=TAMANO_CACHE)
+def importe_linea_centimos(cantidad: Numero, precio_unitario: Numero) -> int:
+    """Importe bruto de una línea (cantidad x precio) en céntimos"""
+    importe = CONTEXTO.multiply(_decimal(cantidad), _decimal(precio_unitario))
+    return int((importe * _CIEN).quantize(_UNIDAD, context=CONTEXTO))
+
+
+def importe_linea(cantidad: Numero, precio_unitario: Numero) -> float:
+    """Importe bruto de una línea redondeado al céntimo"""
+    return a_euros(importe_linea_centimos(cantidad, precio_unitario))
+
+
+@lru_cache(maxsize=TAMANO_CACHE)
+def porcentaje_centimos(centimos: int, porcentaje: Numero) -> int:
+    """Aplica un porcentaje a un importe en céntimos y redondea al céntimo"""
+    resultado = CONTEXTO.divide(CONTEXTO.multiply(Decimal(centimos), _decimal(porcentaje)), _CIEN)
+    return int(resultado.quantize(_UNIDAD, context=CONTEXTO))
+
+
+def prorratear_centimos(centimos: int, numerador: int, denominador: int) -> int:
+    """Escala un importe por numerador/denominador redondeando al céntimo"""
+    if not denominador:
+        return 0
+    resultado = CONTEXTO.divide(CONTEXTO.multiply(Decimal(centimos), Decimal(numerador)), Decimal(denominador))
+    return int(resultado.quantize(_UNIDAD, context=CONTEXTO))
+
+
+@lru_cache(maxsize=TAMANO_CACHE)
+def formatear_truncado(valor: Numero) -> str:
+    """Formatea un valor con exactamente 2 decimales truncando (sin redondear)"""
+    return format(_decimal(valor).quantize(_CENTIMO, rounding=ROUND_DOWN), '.2f')
@@ -1,11 +1,22 @@
-from .utils import db
-from .presupuestos import presupuesto_manager
+from .utils import (db, filtro_rango_fechas, dividir_en_bloques, clausula_limite, paginar_por_clave,
+                    DatabaseManager, ROW_DICT, TAMANO_PAGINA, PAGINA_SIGUIENTE, metrica_en_cache)
+from .presupuestos import presupuesto_manager, PresupuestoManager
+from .totales import calcular_totales, calcular_totales_lote, calcular_lineas
+from .busqueda import expresion_fts, rango_fecha_termino
+from .resumenes import estadisticas_resumen, leer_resumen
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
 
+def _pendiente(grupo: Dict[str, Any]) -> float:
+    """Importe pendiente de un grupo 'No Pagada' del resumen: sin las facturas con estado_pago NULL"""
+    return round(grupo['suma_total'] - grupo['suma_total_sin_estado'], 2)
+
+
 class FacturaManager:
-    def __init__(self):
-        self.db = db
+    def __init__(self, db_manager: Optional[DatabaseManager] = None,
+                 presupuestos: Optional[PresupuestoManager] = None):
+        self.db = db_manager or db
+        self.presupuestos = presupuestos or presupuesto_manager
         self.iva_porcentaje = 21.0  # 21% de IVA
     
     def generar_numero_factura(self) -> str:
@@ -60,40 +71,43 @@ class FacturaManager:
             retencion_irpf
         )
         
-        # Crear factura
-        query = """
-            INSERT INTO facturas (numero_factura, cliente_id, presupuesto_id, fecha_vencimiento, 
-                                subtotal, iva, total, iva_habilitado, metodo_pago, estado_pago, notas,
-                                descuento_global_porcentaje, descuento_global_fijo, descuento_antes_iva,
-                                retencion_irpf)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        factura_id = self.db.execute_update(query, (
-            numero_factura, cliente_id, presupuesto_id, fecha_vencimiento,
-            totales['subtotal'], totales['iva'], totales['total'], 1 if iva_habilitado else 0,
-            metodo_pago, estado_pago, notas, descuento_global_porcentaje, descuento_global_fijo,
-            1 if descuento_antes_iva else 0, retencion_irpf
-        ))
-        
-        # Crear items de la factura
-        for item in items:
-            item_subtotal = item['cantidad'] * item['precio_unitario']
-            
-            # Aplicar descuentos por item
-            item_descuento = 0.0
-            if item.get('descuento_porcentaje', 0) > 0:
-                item_descuento = item_subtotal * (item['descuento_porcentaje'] / 100)
-            elif item.get('descuento_fijo', 0) > 0:
-                item_descuento = min(item['descuento_fijo'], item_subtotal)
-            
-            # Calcular subtotal después de descuentos
-            item_subtotal_final = item_subtotal - item_descuento
-            
-            # Calcular cuota de IVA por línea (21% si aplica IVA)
-            cuota_iva = 0.0
-            item_iva_porcentaje = item.get('iva_porcentaje', self.iva_porcentaje)
-            if item.get('aplica_iva', True) and iva_habilitado and item_iva_porcentaje:
-                cuota_iva = item_subtotal_final * (item_iva_porcentaje / 100)
+        # Cabecera e items en una sola transacción
+        with self.db.transaction():
+            # Crear factura
+            query = """
+                INSERT INTO facturas (numero_factura, cliente_id, presupuesto_id, fecha_vencimiento, 
+                                    subtotal, iva, total, iva_habilitado, metodo_pago, estado_pago, notas,
+                                    descuento_global_porcentaje, descuento_global_fijo, descuento_antes_iva,
+                                    retencion_irpf)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """
+            factura_id = self.db.execute_update(query, (
+                numero_factura, cliente_id, presupuesto_id, fecha_vencimiento,
+                totales['subtotal'], totales['iva'], totales['total'], 1 if iva_habilitado else 0,
+                metodo_pago, estado_pago, notas, descuento_global_porcentaje, descuento_global_fijo,
+                1 if descuento_antes_iva else 0, retencion_irpf
+            ))
+        
+            # Crear items de la factura en un único executemany
+            # Neto y cuota de IVA por línea desde el motor de totales
+            lineas = calcular_lineas(items, self.iva_porcentaje, iva_habilitado)
+            filas_items = [
+                (
+                    factura_id,
+                    item.get('material_id'),
+                    item.get('tarea_manual', ''),
+                    item['cantidad'],
+                    item['precio_unitario'],
+                    linea['neto'],
+                    item.get('visible_pdf', 1),
+                    item.get('es_tarea_manual', 0),
+                    item.get('aplica_iva', 1),
+                    item.get('descuento_porcentaje', 0),
+                    item.get('descuento_fijo', 0),
+                    linea['cuota_iva']
+                )
+                for item, linea in zip(items, lineas)
+            ]
             
             item_query = """
                 INSERT INTO factura_items (factura_id, material_id, tarea_manual, cantidad, 
@@ -101,20 +115,7 @@ class FacturaManager:
                                          aplica_iva, descuento_porcentaje, descuento_fijo, cuota_iva)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """
-            self.db.execute_update(item_query, (
-                factura_id,
-                item.get('material_id'),
-                item.get('tarea_manual', ''),
-                item['cantidad'],
-                item['precio_unitario'],
-                item_subtotal_final,
-                item.get('visible_pdf', 1),
-                item.get('es_tarea_manual', 0),
-                item.get('aplica_iva', 1),
-                item.get('descuento_porcentaje', 0),
-                item.get('descuento_fijo', 0),
-                cuota_iva
-            ))
+            self.db.execute_many(item_query, filas_items)
         
         return factura_id
     
@@ -126,7 +127,7 @@ class FacturaManager:
                                        notas: str = '') -> int:
         """Crea una factura a partir de un presupuesto existente"""
         # Obtener el presupuesto
-        presupuesto = presupuesto_manager.obtener_presupuesto_por_id(presupuesto_id)
+        presupuesto = self.presupuestos.obtener_presupuesto_por_id(presupuesto_id)
         
         if not presupuesto:
             raise ValueError(f"Presupuesto {presupuesto_id} no encontrado")
@@ -146,85 +147,71 @@ class FacturaManager:
         
         return factura_id
     
-    def obtener_facturas(self, anio: Optional[int] = None, mes: Optional[int] = None) -> List[Dict[str, Any]]:
-        """Obtiene facturas con filtros opcionales por año y mes"""
+    def _filtros_listado(self, termino: Optional[str] = None, anio: Optional[int] = None,
+                         mes: Optional[int] = None, estado_pago: Optional[str] = None):
+        """Condiciones WHERE y parámetros comunes a los listados de facturas"""
         where_clauses = []
         params: List[Any] = []
 
-        if anio is not None:
-            where_clauses.append("strftime('%Y', f.fecha_creacion) = ?")
-            params.append(str(anio))
+        expresion = expresion_fts(termino, 'nombre')
+        if expresion and self.db.tiene_busqueda_fts():
+            # Cliente por su índice FTS, número de factura por subcadena (como antes) o fecha por rango
+            alternativas = ["f.cliente_id IN (SELECT rowid FROM clientes_fts WHERE clientes_fts MATCH ?)",
+                            "f.numero_factura LIKE ?"]
+            params.extend([expresion, f"%{termino.strip()}%"])
+            rango = rango_fecha_termino(termino)
+            if rango:
+                alternativas.append("(f.fecha_creacion >= ? AND f.fecha_creacion < ?)")
+                params.extend(rango)
+            where_clauses.append(f"({' OR '.join(alternativas)})")
+        elif termino:
+            where_clauses.append("(c.nombre LIKE ? OR f.numero_factura LIKE ? OR f.fecha_creacion LIKE ?)")
+            termino_busqueda = f"%{termino}%"
+            params.extend([termino_busqueda, termino_busqueda, termino_busqueda])
 
-        if mes is not None:
-            where_clauses.append("strftime('%m', f.fecha_creacion) = ?")
-            params.append(f"{int(mes):02d}")
+        clausulas_fecha, params_fecha = filtro_rango_fechas('f.fecha_creacion', anio=anio, mes=mes)
+        where_clauses.extend(clausulas_fecha)
+        params.extend(params_fecha)
 
-        where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+        if estado_pago:
+            where_clauses.append("COALESCE(f.estado_pago, 'No Pagada') = ?")
+            params.append(estado_pago)
 
-        query = f"""
-            SELECT f.*, c.nombre as cliente_nombre, c.telefono, c.email
-            FROM facturas f
-            JOIN clientes c ON f.cliente_id = c.id
-            {where_sql}
-            ORDER BY f.fecha_creacion DESC
-        """
-        return self.db.execute_query(query, tuple(params))
+        return where_clauses, params
+
+    def obtener_facturas(self, anio: Optional[int] = None, mes: Optional[int] = None,
+                         row_mode: str = ROW_DICT, estado_pago: Optional[str] = None,
+                         limite: Optional[int] = None, desplazamiento: int = 0) -> List[Dict[str, Any]]:
+        """Obtiene facturas con filtros opcionales por año, mes y estado de pago (row_mode=ROW_RECORD para listados)"""
+        return self.buscar_facturas(None, anio, mes, row_mode, estado_pago, limite, desplazamiento)
     
     def obtener_factura_por_id(self, factura_id: int) -> Optional[Dict[str, Any]]:
         """Obtiene una factura específica con sus items"""
-        # Obtener factura
-        query = """
-            SELECT f.*, c.nombre as cliente_nombre, c.telefono, c.email, c.direccion, c.dni
-            FROM facturas f
-            JOIN clientes c ON f.cliente_id = c.id
-            WHERE f.id = ?
-        """
-        factura = self.db.execute_query(query, (factura_id,))
-        if not factura:
-            return None
+        facturas = self.obtener_facturas_con_items([factura_id])
+        return facturas[0] if facturas else None
+    
+    def obtener_facturas_con_items(self, factura_ids: List[int]) -> List[Dict[str, Any]]:
+        """Obtiene varias facturas con sus items en dos consultas (cabeceras e items).
         
-        # Obtener items de la factura
-        items_query = """
-            SELECT fi.*, m.nombre as material_nombre, m.unidad_medida
-            FROM factura_items fi
-            LEFT JOIN materiales m ON fi.material_id = m.id
-            WHERE fi.factura_id = ?
-            ORDER BY fi.id
+        Devuelve las facturas en el orden de los IDs recibidos; las que no existen se omiten.
         """
-        items = self.db.execute_query(items_query, (factura_id,))
+        ids = list(dict.fromkeys(factura_ids))
+        facturas: Dict[int, Dict[str, Any]] = {}
+        
+        for bloque in dividir_en_bloques(ids):
+            marcadores = ", ".join("?" * len(bloque))
+            query = f"""
+                SELECT f.*, c.nombre as cliente_nombre, c.telefono, c.email, c.direccion, c.dni
+                FROM facturas f
+                JOIN clientes c ON f.cliente_id = c.id
+                WHERE f.id IN ({marcadores})
+            """
+            for factura in self.db.execute_query(query, tuple(bloque)):
+                facturas[factura['id']] = factura
         
-        factura_data = factura[0]
-        factura_data['iva_porcentaje'] = self.iva_porcentaje
-        factura_data['iva_habilitado'] = bool(factura_data.get('iva_habilitado', 1))
-        factura_data['descuento_antes_iva'] = bool(factura_data.get('descuento_antes_iva', 1))
-
-        # Normalizar items con metadatos de IVA
-        for item in items:
-            item['aplica_iva'] = bool(item.get('aplica_iva', 1))
-            item['iva_porcentaje'] = item.get('iva_porcentaje', self.iva_porcentaje if item['aplica_iva'] else 0.0)
-            item['subtotal_linea'] = item['subtotal']
-            item['cuota_iva'] = item.get('cuota_iva', 0.0) or 0.0
-
-        factura_data['items'] = items
-
-        # Recalcular totales y desglose de IVA para el PDF
-        totales = self.calcular_totales_completo(
-            items,
-            factura_data.get('descuento_global_porcentaje', 0) or 0,
-            factura_data.get('descuento_global_fijo', 0) or 0,
-            factura_data['descuento_antes_iva'],
-            factura_data['iva_habilitado'],
-            factura_data.get('retencion_irpf')
-        )
-
-        factura_data['iva_breakdown'] = totales.get('iva_breakdown', {})
-        factura_data['base_imponible_calculada'] = totales.get('base_imponible', 0.0)
-        factura_data['base_exenta'] = totales.get('base_exenta', 0.0)
-        factura_data['retencion_irpf_importe'] = totales.get('retencion_irpf', 0.0)
-        factura_data['descuento_global_calculado'] = totales.get('descuento_global', 0.0)
-        factura_data['descuentos_items_calculados'] = totales.get('descuentos_items', 0.0)
-
-        return factura_data
+        encontradas = [fid for fid in ids if fid in facturas]
+        items_por_factura = self._obtener_items_facturas(encontradas)
+        return self._completar_facturas([facturas[fid] for fid in encontradas], items_por_factura)
     
     def obtener_factura_por_numero(self, numero_factura: str) -> Optional[Dict[str, Any]]:
         """Obtiene una factura por su número de factura"""
@@ -238,75 +225,105 @@ class FacturaManager:
         if not factura:
             return None
         
-        # Obtener items
-        items_query = """
-            SELECT fi.*, m.nombre as material_nombre, m.unidad_medida
-            FROM factura_items fi
-            LEFT JOIN materiales m ON fi.material_id = m.id
-            WHERE fi.factura_id = ?
-            ORDER BY fi.id
-        """
-        items = self.db.execute_query(items_query, (factura[0]['id'],))
-        
-        factura_data = factura[0]
-        factura_data['iva_porcentaje'] = self.iva_porcentaje
-        factura_data['iva_habilitado'] = bool(factura_data.get('iva_habilitado', 1))
-        factura_data['descuento_antes_iva'] = bool(factura_data.get('descuento_antes_iva', 1))
-
-        for item in items:
-            item['aplica_iva'] = bool(item.get('aplica_iva', 1))
-            item['iva_porcentaje'] = item.get('iva_porcentaje', self.iva_porcentaje if item['aplica_iva'] else 0.0)
-            item['subtotal_linea'] = item['subtotal']
-            item['cuota_iva'] = item.get('cuota_iva', 0.0) or 0.0
-
-        factura_data['items'] = items
-
-        totales = self.calcular_totales_completo(
-            items,
-            factura_data.get('descuento_global_porcentaje', 0) or 0,
-            factura_data.get('descuento_global_fijo', 0) or 0,
-            factura_data['descuento_antes_iva'],
-            factura_data['iva_habilitado'],
-            factura_data.get('retencion_irpf')
-        )
-
-        factura_data['iva_breakdown'] = totales.get('iva_breakdown', {})
-        factura_data['base_imponible_calculada'] = totales.get('base_imponible', 0.0)
-        factura_data['base_exenta'] = totales.get('base_exenta', 0.0)
-        factura_data['retencion_irpf_importe'] = totales.get('retencion_irpf', 0.0)
-        factura_data['descuento_global_calculado'] = totales.get('descuento_global', 0.0)
-        factura_data['descuentos_items_calculados'] = totales.get('descuentos_items', 0.0)
-
-        return factura_data
+        factura_id = factura[0]['id']
+        items_por_factura = self._obtener_items_facturas([factura_id])
+        return self._completar_facturas(factura, items_por_factura)[0]
     
-    def buscar_facturas(self, termino: str, anio: Optional[int] = None, mes: Optional[int] = None) -> List[Dict[str, Any]]:
-        """Busca facturas por cliente, número de factura o fecha con filtros opcionales"""
-        where_clauses = [
-            "(c.nombre LIKE ? OR f.numero_factura LIKE ? OR f.fecha_creacion LIKE ?)"
-        ]
-        params: List[Any] = []
-
-        termino_busqueda = f"%{termino}%"
-        params.extend([termino_busqueda, termino_busqueda, termino_busqueda])
-
-        if anio is not None:
-            where_clauses.append("strftime('%Y', f.fecha_creacion) = ?")
-            params.append(str(anio))
-
-        if mes is not None:
-            where_clauses.append("strftime('%m', f.fecha_creacion) = ?")
-            params.append(f"{int(mes):02d}")
+    def _obtener_items_facturas(self, factura_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+        """Obtiene los items de varias facturas agrupados por factura"""
+        items_por_factura: Dict[int, List[Dict[str, Any]]] = {fid: [] for fid in factura_ids}
+        for bloque in dividir_en_bloques(factura_ids):
+            marcadores = ", ".join("?" * len(bloque))
+            items_query = f"""
+                SELECT fi.*, m.nombre as material_nombre, m.unidad_medida
+                FROM factura_items fi
+                LEFT JOIN materiales m ON fi.material_id = m.id
+                WHERE fi.factura_id IN ({marcadores})
+                ORDER BY fi.factura_id, fi.id
+            """
+            for item in self.db.execute_query(items_query, tuple(bloque)):
+                items_por_factura[item['factura_id']].append(item)
+        return items_por_factura
+    
+    def _completar_facturas(self, facturas: List[Dict[str, Any]],
+                            items_por_factura: Dict[int, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Normaliza las facturas y sus items y añade el desglose de totales para el PDF"""
+        for factura_data in facturas:
+            factura_data['iva_porcentaje'] = self.iva_porcentaje
+            factura_data['iva_habilitado'] = bool(factura_data.get('iva_habilitado', 1))
+            factura_data['descuento_antes_iva'] = bool(factura_data.get('descuento_antes_iva', 1))
+            
+            # Normalizar items con metadatos de IVA
+            items = items_por_factura[factura_data['id']]
+            for item in items:
+                item['aplica_iva'] = bool(item.get('aplica_iva', 1))
+                item['iva_porcentaje'] = item.get('iva_porcentaje', self.iva_porcentaje if item['aplica_iva'] else 0.0)
+                item['subtotal_linea'] = item['subtotal']
+                item['cuota_iva'] = item.get('cuota_iva', 0.0) or 0.0
+            
+            factura_data['items'] = items
+        
+        # Recalcular totales y desglose de IVA para el PDF en un solo lote
+        totales_lote = calcular_totales_lote(facturas, self.iva_porcentaje)
+        for factura_data, totales in zip(facturas, totales_lote):
+            factura_data['iva_breakdown'] = totales.get('iva_breakdown', {})
+            factura_data['base_imponible_calculada'] = totales.get('base_imponible', 0.0)
+            factura_data['base_exenta'] = totales.get('base_exenta', 0.0)
+            factura_data['retencion_irpf_importe'] = totales.get('retencion_irpf', 0.0)
+            factura_data['descuento_global_calculado'] = totales.get('descuento_global', 0.0)
+            factura_data['descuentos_items_calculados'] = totales.get('descuentos_items', 0.0)
+        
+        return facturas
+    
+    def buscar_facturas(self, termino: Optional[str], anio: Optional[int] = None, mes: Optional[int] = None,
+                        row_mode: str = ROW_DICT, estado_pago: Optional[str] = None,
+                        limite: Optional[int] = None, desplazamiento: int = 0) -> List[Dict[str, Any]]:
+        """Busca facturas por cliente, número de factura o fecha con filtros opcionales (row_mode=ROW_RECORD para listados)"""
+        where_clauses, params = self._filtros_listado(termino, anio, mes, estado_pago)
+        where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+        limite_sql, params_limite = clausula_limite(limite, desplazamiento)
 
-        where_sql = " AND ".join(where_clauses)
+        query = f"""
+            SELECT f.*, c.nombre as cliente_nombre, c.telefono, c.email
+            FROM facturas f
+            JOIN clientes c ON f.cliente_id = c.id
+            {where_sql}
+            ORDER BY f.fecha_creacion DESC, f.id DESC
+            {limite_sql}
+        """
+        return self.db.execute_query(query, tuple(params + params_limite), row_mode=row_mode)
 
+    def contar_facturas(self, termino: Optional[str] = None, anio: Optional[int] = None,
+                        mes: Optional[int] = None, estado_pago: Optional[str] = None) -> int:
+        """Cuenta las facturas que devolvería el listado con los mismos filtros"""
+        where_clauses, params = self._filtros_listado(termino, anio, mes, estado_pago)
+        where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
         query = f"""
+            SELECT COUNT(*) as total
+            FROM facturas f
+            JOIN clientes c ON f.cliente_id = c.id
+            {where_sql}
+        """
+        result = self.db.execute_query(query, tuple(params))
+        return result[0]['total'] if result else 0
+
+    def listar_facturas_pagina(self, cursor: Optional[str] = None, tamano: int = TAMANO_PAGINA,
+                               direccion: str = PAGINA_SIGUIENTE, termino: Optional[str] = None,
+                               anio: Optional[int] = None, mes: Optional[int] = None,
+                               estado_pago: Optional[str] = None, row_mode: str = ROW_DICT) -> Dict[str, Any]:
+        """Página de facturas por cursor (fecha_creacion, id), de la más reciente a la más antigua.
+        
+        Devuelve {'filas', 'siguiente', 'anterior'} con los tokens para pedir la página contigua.
+        """
+        where_clauses, params = self._filtros_listado(termino, anio, mes, estado_pago)
+        consulta_base = """
             SELECT f.*, c.nombre as cliente_nombre, c.telefono, c.email
             FROM facturas f
             JOIN clientes c ON f.cliente_id = c.id
-            WHERE {where_sql}
-            ORDER BY f.fecha_creacion DESC
         """
-        return self.db.execute_query(query, tuple(params))
+        return paginar_por_clave(self.db, consulta_base, where_clauses, params,
+                                 ['f.fecha_creacion', 'f.id'], cursor, tamano, direccion,
+                                 descendente=True, row_mode=row_mode)
 
     def obtener_anios_facturas(self) -> List[str]:
         """Obtiene la lista de años disponibles en los registros de facturas"""
@@ -324,9 +341,9 @@ class FacturaManager:
         where_clauses = ["fecha_creacion IS NOT NULL"]
         params: List[Any] = []
 
-        if anio is not None:
-            where_clauses.append("strftime('%Y', fecha_creacion) = ?")
-            params.append(str(anio))
+        clausulas_fecha, params_fecha = filtro_rango_fechas('fecha_creacion', anio=anio)
+        where_clauses.extend(clausulas_fecha)
+        params.extend(params_fecha)
 
         where_sql = " WHERE " + " AND ".join(where_clauses) if where_clauses else ""
 
@@ -387,19 +404,20 @@ class FacturaManager:
     def eliminar_factura(self, factura_id: int) -> bool:
         """Elimina una factura y sus items"""
         try:
-            # Eliminar items primero
-            items_query = "DELETE FROM factura_items WHERE factura_id = ?"
-            self.db.execute_update(items_query, (factura_id,))
-            
-            # Eliminar factura
-            factura_query = "DELETE FROM facturas WHERE id = ?"
-            self.db.execute_update(factura_query, (factura_id,))
+            with self.db.transaction():
+                # Eliminar items primero
+                items_query = "DELETE FROM factura_items WHERE factura_id = ?"
+                self.db.execute_update(items_query, (factura_id,))
+                
+                # Eliminar factura
+                factura_query = "DELETE FROM facturas WHERE id = ?"
+                self.db.execute_update(factura_query, (factura_id,))
             
             return True
         except:
             return False
     
-    def obtener_facturas_por_estado(self, estado_pago: str) -> List[Dict[str, Any]]:
+    def obtener_facturas_por_estado(self, estado_pago: str, row_mode: str = ROW_DICT) -> List[Dict[str, Any]]:
         """Obtiene facturas filtradas por estado de pago"""
         query = """
             SELECT f.*, c.nombre as cliente_nombre, c.telefono, c.email
@@ -408,7 +426,7 @@ class FacturaManager:
             WHERE f.estado_pago = ?
             ORDER BY f.fecha_creacion DESC
         """
-        return self.db.execute_query(query, (estado_pago,))
+        return self.db.execute_query(query, (estado_pago,), row_mode=row_mode)
     
     def calcular_totales(self, items: List[Dict[str, Any]]) -> Dict[str, float]:
         """Calcula subtotal, IVA y total para una lista de items (método legacy)"""
@@ -418,216 +436,50 @@ class FacturaManager:
                                  descuento_global_fijo: float = 0, descuento_antes_iva: bool = True,
                                  iva_habilitado: bool = True, retencion_irpf: float = None) -> Dict[str, float]:
         """Calcula totales completos con descuentos por item y globales, incluyendo retención IRPF"""
-        subtotal = 0.0
-        descuentos_items = 0.0
-        iva_breakdown_raw: Dict[float, Dict[str, float]] = {}
-        base_exenta_raw = 0.0
-        
-        # Verificar si hay items y si alguno tiene IVA habilitado
-        items_con_iva = [item for item in items if item.get('aplica_iva', True)]
-        
-        # Si no hay items con IVA habilitado, forzar iva_habilitado a False
-        if not items_con_iva and items:
-            iva_habilitado = False
-        
-        # Calcular subtotal y descuentos por item
-        for item in items:
-            cantidad = item.get('cantidad', 0)
-            precio_unitario = item.get('precio_unitario', 0.0)
-            item_subtotal = cantidad * precio_unitario
-            
-            # Aplicar descuentos por item (porcentaje tiene prioridad)
-            item_descuento = 0.0
-            if item.get('descuento_porcentaje', 0) > 0:
-                item_descuento = item_subtotal * (item['descuento_porcentaje'] / 100)
-            elif item.get('descuento_fijo', 0) > 0:
-                item_descuento = min(item['descuento_fijo'], item_subtotal)
-            
-            neto_linea = item_subtotal - item_descuento
-            subtotal += neto_linea
-            descuentos_items += item_descuento
-            
-            # Calcular IVA solo para items que lo tienen habilitado
-            item_iva_porcentaje = float(item.get('iva_porcentaje', self.iva_porcentaje))
-            aplica_iva = item.get('aplica_iva', True) and iva_habilitado and item_iva_porcentaje > 0
-            if aplica_iva:
-                if item_iva_porcentaje not in iva_breakdown_raw:
-                    iva_breakdown_raw[item_iva_porcentaje] = {'base': 0.0}
-                iva_breakdown_raw[item_iva_porcentaje]['base'] += neto_linea
-            else:
-                base_exenta_raw += neto_linea
-        
-        # Aplicar descuento global
-        descuento_global = 0.0
-        if descuento_global_porcentaje > 0:
-            descuento_global = subtotal * (descuento_global_porcentaje / 100)
-        elif descuento_global_fijo > 0:
-            descuento_global = min(descuento_global_fijo, subtotal)
-        
-        subtotal_neto = subtotal - descuento_global
-        factor_ajuste = (subtotal_neto / subtotal) if subtotal > 0 else 0
-        aplicar_factor = descuento_antes_iva
-        
-        iva_breakdown: Dict[float, Dict[str, float]] = {}
-        iva_total = 0.0
-        base_exenta = base_exenta_raw
-        
-        for porcentaje, datos in iva_breakdown_raw.items():
-            base_original = datos['base']
-            base_ajustada = base_original
-            
-            if aplicar_factor:
-                base_ajustada = base_original * factor_ajuste
-            
-            cuota = 0.0
-            if iva_habilitado and porcentaje > 0:
-                cuota = base_ajustada * (porcentaje / 100)
-                iva_total += cuota
-            
-            iva_breakdown[porcentaje] = {
-                'base': base_ajustada if iva_habilitado else 0.0,
-                'cuota': cuota if iva_habilitado else 0.0
-            }
-        
-        if aplicar_factor:
-            base_exenta = base_exenta_raw * factor_ajuste
-        
-        if not iva_habilitado:
-            iva_total = 0.0
-            iva_breakdown = {}
-        
-        base_imponible = subtotal_neto
-        iva = iva_total
-        
-        # Calcular retención IRPF sobre la base imponible (antes de IVA según AEAT)
-        retencion_irpf_importe = 0.0
-        if retencion_irpf is not None and retencion_irpf > 0:
-            retencion_irpf_importe = base_imponible * (retencion_irpf / 100)
-        
-        # Total final: base imponible + IVA - retención IRPF
-        total = base_imponible + iva - retencion_irpf_importe
-        
-        return {
-            'subtotal': subtotal,
-            'descuentos_items': descuentos_items,
-            'descuento_global': descuento_global,
-            'base_imponible': base_imponible,
-            'iva': iva,
-            'retencion_irpf': retencion_irpf_importe,
-            'retencion_irpf_porcentaje': retencion_irpf if retencion_irpf else 0,
-            'total': total,
-            'iva_porcentaje': self.iva_porcentaje,
-            'descuento_antes_iva': descuento_antes_iva,
-            'iva_breakdown': iva_breakdown,
-            'base_exenta': base_exenta
-        }
+        return calcular_totales(items, descuento_global_porcentaje, descuento_global_fijo,
+                                descuento_antes_iva, iva_habilitado, retencion_irpf,
+                                iva_porcentaje=self.iva_porcentaje)
     
     def calcular_fecha_vencimiento(self, dias: int) -> str:
         """Calcula fecha de vencimiento sumando días a la fecha actual"""
         fecha_vencimiento = datetime.now() + timedelta(days=dias)
         return fecha_vencimiento.strftime("%Y-%m-%d")
     
+    @metrica_en_cache('estadisticas_facturas')
     def obtener_estadisticas_facturas(self, fecha_inicio: str = None, fecha_fin: str = None) -> Dict[str, Any]:
         """Obtiene estadísticas de facturas con filtros de fecha opcionales"""
-        # Construir query base
-        where_clauses = []
-        params = []
-        
-        if fecha_inicio:
-            where_clauses.append("DATE(f.fecha_creacion) >= ?")
-            params.append(fecha_inicio)
-        
-        if fecha_fin:
-            where_clauses.append("DATE(f.fecha_creacion) <= ?")
-            params.append(fecha_fin)
-        
-        where_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
-        
-        # Total emitidas
-        query_total = f"""
-            SELECT COUNT(*) as total
-            FROM facturas f
-            {where_sql}
-        """
-        result_total = self.db.execute_query(query_total, tuple(params))
-        total_emitidas = result_total[0]['total'] if result_total else 0
-        
-        # Contadores por estado de pago
-        query_estados = f"""
-            SELECT 
-                COALESCE(estado_pago, 'No Pagada') as estado_pago,
-                COUNT(*) as cantidad
-            FROM facturas f
-            {where_sql}
-            GROUP BY COALESCE(estado_pago, 'No Pagada')
-        """
-        result_estados = self.db.execute_query(query_estados, tuple(params))
-        
-        # Inicializar contadores
-        no_pagadas = 0
-        pagadas = 0
-        
-        for row in result_estados:
-            estado = row['estado_pago']
-            cantidad = row['cantidad']
-            if estado == 'No Pagada':
-                no_pagadas = cantidad
-            elif estado == 'Pagada':
-                pagadas = cantidad
-        
-        # Cálculos monetarios
-        query_valores = f"""
-            SELECT 
-                COALESCE(SUM(CASE WHEN estado_pago = 'Pagada' THEN total ELSE 0 END), 0) as total_facturado,
-                COALESCE(SUM(CASE WHEN estado_pago = 'No Pagada' THEN total ELSE 0 END), 0) as total_pendiente_cobro,
-                COALESCE(AVG(total), 0) as promedio_factura,
-                COALESCE(MAX(total), 0) as factura_max,
-                COALESCE(MIN(total), 0) as factura_min,
-                COALESCE(SUM(descuento_global_porcentaje * total / 100), 0) + 
-                COALESCE(SUM(descuento_global_fijo), 0) as total_descuentos,
-                COALESCE(SUM(retencion_irpf * subtotal / 100), 0) as total_retencion_irpf
-            FROM facturas f
-            {where_sql}
-        """
-        result_valores = self.db.execute_query(query_valores, tuple(params))
-        valores = result_valores[0] if result_valores else {}
-        total_facturado = valores.get('total_facturado', 0) or 0
-        total_pendiente_cobro = valores.get('total_pendiente_cobro', 0) or 0
-        promedio_factura = valores.get('promedio_factura', 0) or 0
-        factura_max = valores.get('factura_max', 0) or 0
-        factura_min = valores.get('factura_min', 0) or 0
-        total_descuentos = valores.get('total_descuentos', 0) or 0
-        total_retencion_irpf = valores.get('total_retencion_irpf', 0) or 0
+        stats = estadisticas_resumen(self.db, 'factura', fecha_inicio, fecha_fin)
+        pagadas = stats['por_estado'].get('Pagada', {})
+        no_pagadas = stats['por_estado'].get('No Pagada', {})
+        total_emitidas = stats['cantidad']
         
         # Datos agrupados por mes para evolución
-        query_mensual = f"""
-            SELECT 
-                strftime('%Y-%m', f.fecha_creacion) as mes,
-                COUNT(*) as cantidad,
-                COALESCE(SUM(CASE WHEN estado_pago = 'Pagada' THEN total ELSE 0 END), 0) as valor_pagado,
-                COALESCE(SUM(CASE WHEN estado_pago = 'No Pagada' THEN total ELSE 0 END), 0) as valor_pendiente,
-                COALESCE(estado_pago, 'No Pagada') as estado_pago
-            FROM facturas f
-            {where_sql}
-            GROUP BY strftime('%Y-%m', f.fecha_creacion), COALESCE(estado_pago, 'No Pagada')
-            ORDER BY mes
-        """
-        result_mensual = self.db.execute_query(query_mensual, tuple(params))
+        evolucion_mensual = [
+            {
+                'mes': g['mes'],
+                'cantidad': g['cantidad'],
+                'valor_pagado': g['suma_total'] if g['estado'] == 'Pagada' else 0,
+                'valor_pendiente': _pendiente(g) if g['estado'] == 'No Pagada' else 0,
+                'estado_pago': g['estado'],
+            }
+            for g in stats['mensual']
+        ]
         
         return {
             'total_emitidas': total_emitidas,
-            'no_pagadas': no_pagadas,
-            'pagadas': pagadas,
-            'total_facturado': total_facturado,
-            'total_pendiente_cobro': total_pendiente_cobro,
-            'promedio_factura': promedio_factura,
-            'factura_max': factura_max,
-            'factura_min': factura_min,
-            'total_descuentos': total_descuentos,
-            'total_retencion_irpf': total_retencion_irpf,
-            'evolucion_mensual': result_mensual
+            'no_pagadas': no_pagadas.get('cantidad', 0),
+            'pagadas': pagadas.get('cantidad', 0),
+            'total_facturado': pagadas.get('suma_total', 0),
+            'total_pendiente_cobro': _pendiente(no_pagadas) if no_pagadas else 0,
+            'promedio_factura': stats['suma_total'] / total_emitidas if total_emitidas else 0,
+            'factura_max': stats['maximo_total'],
+            'factura_min': stats['minimo_total'],
+            'total_descuentos': stats['suma_descuentos'],
+            'total_retencion_irpf': stats['suma_retencion_irpf'],
+            'evolucion_mensual': evolucion_mensual
         }
 
+    @metrica_en_cache('facturas_vencidas', por_dia=True)
     def obtener_facturas_vencidas(self) -> Dict[str, Any]:
         """Obtiene facturas vencidas (fecha_vencimiento < fecha_actual y estado_pago = 'No Pagada')"""
         fecha_actual = datetime.now().strftime("%Y-%m-%d")
@@ -643,11 +495,12 @@ class FacturaManager:
                 julianday(?) - julianday(f.fecha_vencimiento) as dias_vencidos
             FROM facturas f
             JOIN clientes c ON f.cliente_id = c.id
-            WHERE f.fecha_vencimiento IS NOT NULL 
-                AND DATE(f.fecha_vencimiento) < DATE(?)
-                AND f.estado_pago = 'No Pagada'
+            WHERE f.estado_pago = 'No Pagada'
+                AND f.fecha_vencimiento IS NOT NULL 
+                AND f.fecha_vencimiento < ?
             ORDER BY f.fecha_vencimiento ASC
         """
+        # El rango sobre la columna sin funciones permite usar idx_facturas_estado_vencimiento
         facturas = self.db.execute_query(query, (fecha_actual, fecha_actual))
         
         monto_total_vencido = sum(f.get('total', 0) or 0 for f in facturas)
@@ -658,10 +511,10 @@ class FacturaManager:
             'monto_total_vencido': monto_total_vencido
         }
     
+    @metrica_en_cache('facturas_proximas_vencer', por_dia=True)
     def obtener_facturas_proximas_vencer(self, dias: int = 30) -> Dict[str, Any]:
         """Obtiene facturas que vencen en los próximos N días"""
         fecha_actual = datetime.now().strftime("%Y-%m-%d")
-        fecha_limite = (datetime.now() + timedelta(days=dias)).strftime("%Y-%m-%d")
         
         query = """
             SELECT 
@@ -674,13 +527,15 @@ class FacturaManager:
                 julianday(f.fecha_vencimiento) - julianday(?) as dias_restantes
             FROM facturas f
             JOIN clientes c ON f.cliente_id = c.id
-            WHERE f.fecha_vencimiento IS NOT NULL 
-                AND DATE(f.fecha_vencimiento) >= DATE(?)
-                AND DATE(f.fecha_vencimiento) <= DATE(?)
-                AND f.estado_pago = 'No Pagada'
+            WHERE f.estado_pago = 'No Pagada'
+                AND f.fecha_vencimiento IS NOT NULL 
+                AND f.fecha_vencimiento >= ?
+                AND f.fecha_vencimiento < ?
             ORDER BY f.fecha_vencimiento ASC
         """
-        facturas = self.db.execute_query(query, (fecha_actual, fecha_actual, fecha_limite))
+        # El rango sobre la columna sin funciones permite usar idx_facturas_estado_vencimiento
+        fecha_limite_exclusiva = (datetime.now() + timedelta(days=dias + 1)).strftime("%Y-%m-%d")
+        facturas = self.db.execute_query(query, (fecha_actual, fecha_actual, fecha_limite_exclusiva))
         
         # Agrupar por días restantes
         grupos = {}
@@ -701,18 +556,15 @@ class FacturaManager:
             'grupos_por_dias': grupos
         }
     
+    @metrica_en_cache('dias_promedio_cobro', por_dia=True)
     def obtener_dias_promedio_cobro(self, fecha_inicio: str = None, fecha_fin: str = None) -> float:
         """Calcula días promedio de cobro para facturas pagadas"""
         where_clauses = ["f.estado_pago = 'Pagada'"]
         params = []
         
-        if fecha_inicio:
-            where_clauses.append("DATE(f.fecha_creacion) >= ?")
-            params.append(fecha_inicio)
-        
-        if fecha_fin:
-            where_clauses.append("DATE(f.fecha_creacion) <= ?")
-            params.append(fecha_fin)
+        clausulas_fecha, params_fecha = filtro_rango_fechas('f.fecha_creacion', fecha_inicio=fecha_inicio, fecha_fin=fecha_fin)
+        where_clauses.extend(clausulas_fecha)
+        params.extend(params_fecha)
         
         # Construir WHERE clause
         if where_clauses:
@@ -734,18 +586,15 @@ class FacturaManager:
             return float(result[0]['dias_promedio'])
         return 0.0
     
+    @metrica_en_cache('top_clientes_facturas')
     def obtener_top_clientes_facturas(self, fecha_inicio: str = None, fecha_fin: str = None, limite: int = 10) -> List[Dict[str, Any]]:
         """Obtiene los top clientes por facturación total"""
         where_clauses = []
         params = []
         
-        if fecha_inicio:
-            where_clauses.append("DATE(f.fecha_creacion) >= ?")
-            params.append(fecha_inicio)
-        
-        if fecha_fin:
-            where_clauses.append("DATE(f.fecha_creacion) <= ?")
-            params.append(fecha_fin)
+        clausulas_fecha, params_fecha = filtro_rango_fechas('f.fecha_creacion', fecha_inicio=fecha_inicio, fecha_fin=fecha_fin)
+        where_clauses.extend(clausulas_fecha)
+        params.extend(params_fecha)
         
         where_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
         
@@ -767,23 +616,27 @@ class FacturaManager:
         params.append(limite)
         return self.db.execute_query(query, tuple(params))
     
+    @metrica_en_cache('evolucion_facturacion_mensual', por_dia=True)
     def obtener_evolucion_facturacion_mensual(self, meses: int = 12) -> List[Dict[str, Any]]:
         """Obtiene evolución mensual de facturación (últimos N meses)"""
         fecha_limite = (datetime.now() - timedelta(days=meses*30)).strftime("%Y-%m-%d")
         
-        query = """
-            SELECT 
-                strftime('%Y-%m', f.fecha_creacion) as mes,
-                COUNT(*) as cantidad_facturas,
-                COALESCE(SUM(CASE WHEN f.estado_pago = 'Pagada' THEN f.total ELSE 0 END), 0) as facturacion_pagada,
-                COALESCE(SUM(CASE WHEN f.estado_pago = 'No Pagada' THEN f.total ELSE 0 END), 0) as facturacion_pendiente,
-                COALESCE(SUM(f.total), 0) as facturacion_total
-            FROM facturas f
-            WHERE DATE(f.fecha_creacion) >= DATE(?)
-            GROUP BY strftime('%Y-%m', f.fecha_creacion)
-            ORDER BY mes ASC
-        """
-        return self.db.execute_query(query, (fecha_limite,))
+        evolucion: Dict[str, Dict[str, Any]] = {}
+        for g in leer_resumen(self.db, 'factura', fecha_inicio=fecha_limite):
+            mes = evolucion.setdefault(g['mes'], {
+                'mes': g['mes'],
+                'cantidad_facturas': 0,
+                'facturacion_pagada': 0,
+                'facturacion_pendiente': 0,
+                'facturacion_total': 0,
+            })
+            mes['cantidad_facturas'] += g['cantidad']
+            mes['facturacion_total'] += g['suma_total']
+            if g['estado'] == 'Pagada':
+                mes['facturacion_pagada'] += g['suma_total']
+            elif g['estado'] == 'No Pagada':
+                mes['facturacion_pendiente'] += _pendiente(g)
+        return list(evolucion.values())
 
 # Instancia global del manager de facturas
 factura_manager = FacturaManager()
@@ -1,9 +1,102 @@
-from .utils import db
-from typing import List, Dict, Any, Optional
+from .utils import (db, filtro_rango_fechas, clausula_limite, paginar_por_clave, CacheEnMemoria,
+                    DatabaseManager, ROW_DICT, TAMANO_PAGINA, PAGINA_SIGUIENTE, metrica_en_cache)
+from .busqueda import (expresion_fts, contar_coincidencias, orden_coincidencias, normalizar_texto,
+                       palabras_normalizadas)
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import List, Dict, Any, Optional, Tuple, Set
+
+
+class CatalogoMateriales:
+    """Copia en memoria de la tabla de materiales con índices para filtrar sin consultar la base de datos.
+    
+    - por id: diccionario id -> material
+    - por nombre: lista en el orden del listado (nombre, id)
+    - palabras: lista ordenada (palabra, posición) para buscar prefijos con bisect
+    - texto: nombres normalizados unidos por saltos de línea, para buscar subcadenas
+      con str.find y traducir cada coincidencia a su posición con bisect
+    """
+    
+    def __init__(self, materiales: List[Dict[str, Any]]):
+        self._ordenados = list(materiales)
+        self._por_id = {m['id']: m for m in self._ordenados}
+        nombres = [normalizar_texto(m['nombre']).replace('\n', ' ') for m in self._ordenados]
+        self._palabras: List[Tuple[str, int]] = sorted(
+            (palabra, posicion)
+            for posicion, nombre in enumerate(nombres)
+            for palabra in set(palabras_normalizadas(nombre))
+        )
+        self._texto = '\n'.join(nombres)
+        # Desplazamiento en self._texto donde empieza cada nombre
+        self._inicios = [0] + list(accumulate(len(nombre) + 1 for nombre in nombres))[:-1]
+    
+    def __len__(self) -> int:
+        return len(self._ordenados)
+    
+    def todos(self) -> List[Dict[str, Any]]:
+        """Todos los materiales ordenados por nombre"""
+        return list(self._ordenados)
+    
+    def material(self, material_id: int) -> Optional[Dict[str, Any]]:
+        """Material por ID (None si no existe)"""
+        return self._por_id.get(material_id)
+    
+    def _prefijo(self, prefijo: str) -> Set[int]:
+        posiciones = set()
+        inicio = bisect_left(self._palabras, (prefijo,))
+        for palabra, posicion in self._palabras[inicio:]:
+            if not palabra.startswith(prefijo):
+                break
+            posiciones.add(posicion)
+        return posiciones
+    
+    def _subcadena(self, texto: str) -> Set[int]:
+        posiciones = set()
+        indice = self._texto.find(texto)
+        while indice != -1:
+            posicion = bisect_right(self._inicios, indice) - 1
+            posiciones.add(posicion)
+            # Continuar desde el nombre siguiente: basta una coincidencia por nombre
+            siguiente = posicion + 1
+            if siguiente >= len(self._inicios):
+                break
+            indice = self._texto.find(texto, self._inicios[siguiente])
+        return posiciones
+    
+    def buscar(self, termino: Optional[str]) -> List[Dict[str, Any]]:
+        """Materiales cuyo nombre contiene todas las palabras del término, sin distinguir acentos.
+        
+        Las palabras de una o dos letras se buscan como inicio de palabra; las
+        más largas, en cualquier parte del nombre.
+        """
+        buscadas = palabras_normalizadas(termino)
+        if not buscadas:
+            return self.todos()
+        posiciones: Optional[Set[int]] = None
+        for palabra in sorted(buscadas, key=len, reverse=True):
+            encontradas = self._subcadena(palabra) if len(palabra) >= 3 else self._prefijo(palabra)
+            posiciones = encontradas if posiciones is None else posiciones & encontradas
+            if not posiciones:
+                return []
+        return [self._ordenados[posicion] for posicion in sorted(posiciones)]
+
 
 class MaterialManager:
-    def __init__(self):
-        self.db = db
+    def __init__(self, db_manager: Optional[DatabaseManager] = None):
+        self.db = db_manager or db
+        self._catalogo = CacheEnMemoria(lambda: CatalogoMateriales(self.obtener_materiales()))
+    
+    def catalogo(self) -> CatalogoMateriales:
+        """Catálogo de materiales en memoria; se carga en el primer uso y tras cada cambio"""
+        return self._catalogo.obtener()
+    
+    def invalidar_catalogo(self):
+        """Descarta el catálogo en memoria tras crear, modificar o eliminar materiales"""
+        self._catalogo.invalidar()
+    
+    def filtrar_materiales(self, termino: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Filtra los materiales en memoria (para combos y autocompletado)"""
+        return self.catalogo().buscar(termino)
     
     def crear_material(self, nombre: str, unidad_medida: str, precio_unitario: float) -> int:
         """Crea un nuevo material en la base de datos"""
@@ -11,12 +104,16 @@ class MaterialManager:
             INSERT INTO materiales (nombre, unidad_medida, precio_unitario)
             VALUES (?, ?, ?)
         """
-        return self.db.execute_update(query, (nombre, unidad_medida, precio_unitario))
+        material_id = self.db.execute_update(query, (nombre, unidad_medida, precio_unitario))
+        self.invalidar_catalogo()
+        return material_id
     
-    def obtener_materiales(self) -> List[Dict[str, Any]]:
-        """Obtiene todos los materiales de la base de datos"""
-        query = "SELECT * FROM materiales ORDER BY nombre"
-        return self.db.execute_query(query)
+    def obtener_materiales(self, row_mode: str = ROW_DICT, limite: Optional[int] = None,
+                           desplazamiento: int = 0) -> List[Dict[str, Any]]:
+        """Obtiene todos los materiales de la base de datos (o una página con limite/desplazamiento)"""
+        limite_sql, params_limite = clausula_limite(limite, desplazamiento)
+        query = f"SELECT * FROM materiales ORDER BY nombre, id {limite_sql}"
+        return self.db.execute_query(query, tuple(params_limite), row_mode=row_mode)
     
     def obtener_material_por_id(self, material_id: int) -> Optional[Dict[str, Any]]:
         """Obtiene un material específico por su ID"""
@@ -24,15 +121,64 @@ class MaterialManager:
         results = self.db.execute_query(query, (material_id,))
         return results[0] if results else None
     
-    def buscar_materiales(self, termino: str) -> List[Dict[str, Any]]:
-        """Busca materiales por nombre"""
-        query = """
+    def _filtro_busqueda(self, termino: str) -> Tuple[str, List[Any]]:
+        """Condición WHERE para el término: índice FTS5 si existe, LIKE si no"""
+        expresion = expresion_fts(termino)
+        if expresion and self.db.tiene_busqueda_fts():
+            return "id IN (SELECT rowid FROM materiales_fts WHERE materiales_fts MATCH ?)", [expresion]
+        return "nombre LIKE ?", [f"%{termino}%"]
+    
+    def buscar_materiales(self, termino: str, row_mode: str = ROW_DICT, limite: Optional[int] = None,
+                          desplazamiento: int = 0) -> List[Dict[str, Any]]:
+        """Busca materiales por nombre (por relevancia si hay índice FTS5)"""
+        limite_sql, params_limite = clausula_limite(limite, desplazamiento)
+        expresion = expresion_fts(termino)
+        if expresion and self.db.tiene_busqueda_fts():
+            orden = orden_coincidencias('materiales_fts', contar_coincidencias(self.db, 'materiales_fts', expresion))
+            query = f"""
+                SELECT m.* FROM materiales_fts
+                JOIN materiales m ON m.id = materiales_fts.rowid
+                WHERE materiales_fts MATCH ?
+                ORDER BY {orden}
+                {limite_sql}
+            """
+            return self.db.execute_query(query, (expresion, *params_limite), row_mode=row_mode)
+        
+        condicion, params = self._filtro_busqueda(termino)
+        query = f"""
             SELECT * FROM materiales 
-            WHERE nombre LIKE ?
-            ORDER BY nombre
+            WHERE {condicion}
+            ORDER BY nombre, id
+            {limite_sql}
         """
-        termino_busqueda = f"%{termino}%"
-        return self.db.execute_query(query, (termino_busqueda,))
+        return self.db.execute_query(query, (*params, *params_limite), row_mode=row_mode)
+    
+    def contar_materiales(self, termino: Optional[str] = None) -> int:
+        """Cuenta los materiales del listado, opcionalmente filtrados por el término de búsqueda"""
+        expresion = expresion_fts(termino)
+        if expresion and self.db.tiene_busqueda_fts():
+            return contar_coincidencias(self.db, 'materiales_fts', expresion)
+        if termino:
+            condicion, params = self._filtro_busqueda(termino)
+            result = self.db.execute_query(f"SELECT COUNT(*) as total FROM materiales WHERE {condicion}", tuple(params))
+        else:
+            result = self.db.execute_query("SELECT COUNT(*) as total FROM materiales")
+        return result[0]['total'] if result else 0
+    
+    def listar_materiales_pagina(self, cursor: Optional[str] = None, tamano: int = TAMANO_PAGINA,
+                                 direccion: str = PAGINA_SIGUIENTE, termino: Optional[str] = None,
+                                 row_mode: str = ROW_DICT) -> Dict[str, Any]:
+        """Página de materiales por cursor (nombre, id) en orden alfabético.
+        
+        Devuelve {'filas', 'siguiente', 'anterior'} con los tokens para pedir la página contigua.
+        """
+        where_clauses = []
+        params: List[Any] = []
+        if termino:
+            condicion, params = self._filtro_busqueda(termino)
+            where_clauses.append(condicion)
+        return paginar_por_clave(self.db, "SELECT * FROM materiales", where_clauses, params,
+                                 ['nombre', 'id'], cursor, tamano, direccion, row_mode=row_mode)
     
     def actualizar_material(self, material_id: int, nombre: str, unidad_medida: str, 
                            precio_unitario: float) -> bool:
@@ -44,18 +190,20 @@ class MaterialManager:
         """
         try:
             self.db.execute_update(query, (nombre, unidad_medida, precio_unitario, material_id))
-            return True
         except:
             return False
+        self.invalidar_catalogo()
+        return True
     
     def eliminar_material(self, material_id: int) -> bool:
         """Elimina un material de la base de datos"""
         query = "DELETE FROM materiales WHERE id = ?"
         try:
             self.db.execute_update(query, (material_id,))
-            return True
         except:
             return False
+        self.invalidar_catalogo()
+        return True
     
     def obtener_materiales_mas_utilizados(self, limite: int = 5) -> List[Dict[str, Any]]:
         """Obtiene los materiales más utilizados en presupuestos y facturas"""
@@ -81,18 +229,15 @@ class MaterialManager:
             print(f"Error obteniendo materiales más utilizados: {e}")
             return []
     
+    @metrica_en_cache('top_materiales')
     def obtener_top_materiales(self, fecha_inicio: str = None, fecha_fin: str = None, limite: int = 10) -> Dict[str, List[Dict[str, Any]]]:
         """Obtiene top materiales por cantidad e ingresos"""
         where_clauses = []
         params = []
         
-        if fecha_inicio:
-            where_clauses.append("DATE(f.fecha_creacion) >= ?")
-            params.append(fecha_inicio)
-        
-        if fecha_fin:
-            where_clauses.append("DATE(f.fecha_creacion) <= ?")
-            params.append(fecha_fin)
+        clausulas_fecha, params_fecha = filtro_rango_fechas('f.fecha_creacion', fecha_inicio=fecha_inicio, fecha_fin=fecha_fin)
+        where_clauses.extend(clausulas_fecha)
+        params.extend(params_fecha)
         
         # Construir WHERE clause
         if where_clauses:
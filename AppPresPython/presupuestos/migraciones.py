@@ -0,0 +1,297 @@
+"""
+Migraciones versionadas del esquema de la base de datos.
+
+La versión aplicada se guarda en ``PRAGMA user_version``: al arrancar solo se
+lee ese número y, si está al día, no se hace nada más. Cada paso se ejecuta en
+su propia transacción, es idempotente y queda anotado en ``schema_migraciones``.
+"""
+
+import sqlite3
+from typing import Callable, List, Tuple
+
+from .busqueda import fts5_disponible, crear_indices_fts
+from .resumenes import crear_resumen_mensual
+
+# Índices secundarios gestionados: (nombre, tabla, columnas)
+INDICES = [
+    ('idx_presupuesto_items_presupuesto', 'presupuesto_items', 'presupuesto_id'),
+    ('idx_presupuesto_items_material', 'presupuesto_items', 'material_id'),
+    ('idx_factura_items_factura', 'factura_items', 'factura_id'),
+    ('idx_factura_items_material', 'factura_items', 'material_id'),
+    ('idx_presupuestos_cliente', 'presupuestos', 'cliente_id'),
+    ('idx_presupuestos_fecha', 'presupuestos', 'fecha_creacion'),
+    ('idx_facturas_cliente', 'facturas', 'cliente_id'),
+    ('idx_facturas_presupuesto', 'facturas', 'presupuesto_id'),
+    ('idx_facturas_fecha', 'facturas', 'fecha_creacion'),
+    ('idx_facturas_estado_vencimiento', 'facturas', 'estado_pago, fecha_vencimiento'),
+    ('idx_clientes_nombre', 'clientes', 'nombre'),
+    ('idx_clientes_fecha', 'clientes', 'fecha_creacion'),
+    ('idx_materiales_nombre', 'materiales', 'nombre'),
+]
+
+# Columnas añadidas en versiones anteriores de la aplicación: (tabla, columna, definición)
+COLUMNAS_LEGACY = [
+    ('clientes', 'dni', 'TEXT'),
+    ('presupuestos', 'iva_habilitado', 'INTEGER DEFAULT 1'),
+    ('presupuestos', 'estado', "TEXT DEFAULT 'Pendiente'"),
+    ('presupuestos', 'descuento_global_porcentaje', 'REAL DEFAULT 0'),
+    ('presupuestos', 'descuento_global_fijo', 'REAL DEFAULT 0'),
+    ('presupuestos', 'descuento_antes_iva', 'INTEGER DEFAULT 1'),
+    ('presupuesto_items', 'descuento_porcentaje', 'REAL DEFAULT 0'),
+    ('presupuesto_items', 'descuento_fijo', 'REAL DEFAULT 0'),
+    ('factura_items', 'aplica_iva', 'INTEGER DEFAULT 1'),
+    ('factura_items', 'descuento_porcentaje', 'REAL DEFAULT 0'),
+    ('factura_items', 'descuento_fijo', 'REAL DEFAULT 0'),
+    ('factura_items', 'cuota_iva', 'REAL DEFAULT 0'),
+    ('facturas', 'descuento_global_porcentaje', 'REAL DEFAULT 0'),
+    ('facturas', 'descuento_global_fijo', 'REAL DEFAULT 0'),
+    ('facturas', 'descuento_antes_iva', 'INTEGER DEFAULT 1'),
+    ('facturas', 'retencion_irpf', 'REAL DEFAULT NULL'),
+]
+
+
+def _columnas(cursor, tabla: str) -> dict:
+    """Devuelve {nombre_columna: notnull} de una tabla"""
+    cursor.execute(f"PRAGMA table_info({tabla})")
+    return {col[1]: col[3] for col in cursor.fetchall()}
+
+
+def _crear_esquema_base(cursor):
+    """Crea las tablas con su estructura actual si no existen"""
+    # Tabla de clientes
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS clientes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            telefono TEXT,
+            email TEXT,
+            direccion TEXT,
+            dni TEXT,
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Tabla de materiales
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS materiales (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            unidad_medida TEXT NOT NULL,
+            precio_unitario REAL NOT NULL,
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Tabla de presupuestos
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS presupuestos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cliente_id INTEGER NOT NULL,
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            subtotal REAL NOT NULL,
+            iva REAL NOT NULL,
+            total REAL NOT NULL,
+            iva_habilitado INTEGER DEFAULT 1,
+            estado TEXT DEFAULT 'Pendiente',
+            descuento_global_porcentaje REAL DEFAULT 0,
+            descuento_global_fijo REAL DEFAULT 0,
+            descuento_antes_iva INTEGER DEFAULT 1,
+            FOREIGN KEY (cliente_id) REFERENCES clientes (id)
+        )
+    ''')
+    
+    # Tabla de items de presupuesto
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS presupuesto_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            presupuesto_id INTEGER NOT NULL,
+            material_id INTEGER,
+            tarea_manual TEXT,
+            cantidad REAL NOT NULL,
+            precio_unitario REAL NOT NULL,
+            subtotal REAL NOT NULL,
+            visible_pdf INTEGER DEFAULT 1,
+            es_tarea_manual INTEGER DEFAULT 0,
+            aplica_iva INTEGER DEFAULT 1,
+            descuento_porcentaje REAL DEFAULT 0,
+            descuento_fijo REAL DEFAULT 0,
+            FOREIGN KEY (presupuesto_id) REFERENCES presupuestos (id),
+            FOREIGN KEY (material_id) REFERENCES materiales (id)
+        )
+    ''')
+    
+    # Tabla de facturas
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS facturas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            numero_factura TEXT UNIQUE NOT NULL,
+            cliente_id INTEGER NOT NULL,
+            presupuesto_id INTEGER,
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            fecha_vencimiento DATE,
+            subtotal REAL NOT NULL,
+            iva REAL NOT NULL,
+            total REAL NOT NULL,
+            iva_habilitado INTEGER DEFAULT 1,
+            metodo_pago TEXT DEFAULT 'Transferencia',
+            estado_pago TEXT DEFAULT 'No Pagada',
+            notas TEXT,
+            descuento_global_porcentaje REAL DEFAULT 0,
+            descuento_global_fijo REAL DEFAULT 0,
+            descuento_antes_iva INTEGER DEFAULT 1,
+            retencion_irpf REAL DEFAULT NULL,
+            FOREIGN KEY (cliente_id) REFERENCES clientes (id),
+            FOREIGN KEY (presupuesto_id) REFERENCES presupuestos (id)
+        )
+    ''')
+    
+    # Tabla de items de factura
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS factura_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            factura_id INTEGER NOT NULL,
+            material_id INTEGER,
+            tarea_manual TEXT,
+            cantidad REAL NOT NULL,
+            precio_unitario REAL NOT NULL,
+            subtotal REAL NOT NULL,
+            visible_pdf INTEGER DEFAULT 1,
+            es_tarea_manual INTEGER DEFAULT 0,
+            aplica_iva INTEGER DEFAULT 1,
+            descuento_porcentaje REAL DEFAULT 0,
+            descuento_fijo REAL DEFAULT 0,
+            cuota_iva REAL DEFAULT 0,
+            FOREIGN KEY (factura_id) REFERENCES facturas (id),
+            FOREIGN KEY (material_id) REFERENCES materiales (id)
+        )
+    ''')
+
+
+def _reconstruir_presupuesto_items(cursor):
+    """Recrea presupuesto_items si viene de una versión con material_id NOT NULL o sin tareas manuales"""
+    columnas = _columnas(cursor, 'presupuesto_items')
+    necesarias = ('tarea_manual', 'visible_pdf', 'es_tarea_manual', 'aplica_iva')
+    if not columnas.get('material_id') and all(c in columnas for c in necesarias):
+        return
+    
+    print("Recreando tabla presupuesto_items para soportar nuevas funcionalidades...")
+    cursor.execute('''
+        CREATE TABLE presupuesto_items_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            presupuesto_id INTEGER NOT NULL,
+            material_id INTEGER,
+            tarea_manual TEXT,
+            cantidad REAL NOT NULL,
+            precio_unitario REAL NOT NULL,
+            subtotal REAL NOT NULL,
+            visible_pdf INTEGER DEFAULT 1,
+            es_tarea_manual INTEGER DEFAULT 0,
+            aplica_iva INTEGER DEFAULT 1,
+            descuento_porcentaje REAL DEFAULT 0,
+            descuento_fijo REAL DEFAULT 0,
+            FOREIGN KEY (presupuesto_id) REFERENCES presupuestos (id),
+            FOREIGN KEY (material_id) REFERENCES materiales (id)
+        )
+    ''')
+    
+    # Copiar las columnas que existan; el resto toma su valor por defecto
+    por_defecto = {
+        'tarea_manual': "''",
+        'visible_pdf': '1',
+        'es_tarea_manual': '0',
+        'aplica_iva': '1',
+        'descuento_porcentaje': '0',
+        'descuento_fijo': '0',
+    }
+    destino = ['id', 'presupuesto_id', 'material_id', 'cantidad', 'precio_unitario', 'subtotal'] + list(por_defecto)
+    origen = [
+        (f"COALESCE({col}, {por_defecto[col]})" if col in columnas else por_defecto[col])
+        if col in por_defecto else col
+        for col in destino
+    ]
+    cursor.execute(f"""
+        INSERT INTO presupuesto_items_new ({', '.join(destino)})
+        SELECT {', '.join(origen)} FROM presupuesto_items
+    """)
+    
+    cursor.execute("DROP TABLE presupuesto_items")
+    cursor.execute("ALTER TABLE presupuesto_items_new RENAME TO presupuesto_items")
+    print("Tabla presupuesto_items actualizada correctamente")
+
+
+def _actualizar_tablas_legacy(cursor):
+    """Lleva las bases de datos creadas por versiones antiguas al esquema actual"""
+    _reconstruir_presupuesto_items(cursor)
+    
+    columnas_por_tabla = {}
+    for tabla, columna, definicion in COLUMNAS_LEGACY:
+        if tabla not in columnas_por_tabla:
+            columnas_por_tabla[tabla] = _columnas(cursor, tabla)
+        if columna not in columnas_por_tabla[tabla]:
+            print(f"Agregando columna {columna} a la tabla {tabla}...")
+            cursor.execute(f"ALTER TABLE {tabla} ADD COLUMN {columna} {definicion}")
+            columnas_por_tabla[tabla][columna] = 0
+
+
+def _crear_indices(cursor):
+    """Crea los índices secundarios sobre claves foráneas y fechas"""
+    for nombre, tabla, columnas in INDICES:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {nombre} ON {tabla} ({columnas})")
+
+
+def _crear_busqueda_texto(cursor):
+    """Crea los índices de texto completo (FTS5) si el SQLite instalado lo incluye"""
+    if not fts5_disponible(cursor):
+        print("SQLite sin soporte FTS5: las búsquedas usarán LIKE")
+        return
+    crear_indices_fts(cursor)
+
+
+# Pasos ordenados: (versión, nombre, función). Añadir siempre al final con versión nueva.
+MIGRACIONES: List[Tuple[int, str, Callable]] = [
+    (1, 'esquema_base', _crear_esquema_base),
+    (2, 'columnas_legacy', _actualizar_tablas_legacy),
+    (3, 'indices_secundarios', _crear_indices),
+    (4, 'busqueda_texto', _crear_busqueda_texto),
+    (5, 'resumen_mensual', crear_resumen_mensual),
+]
+VERSION_ESQUEMA = MIGRACIONES[-1][0]
+
+
+def obtener_version(conn: sqlite3.Connection) -> int:
+    """Versión de esquema guardada en la base de datos"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def aplicar_migraciones(db) -> int:
+    """Aplica las migraciones pendientes y devuelve la versión final del esquema"""
+    conn = db.get_connection()
+    version = obtener_version(conn)
+    if version >= VERSION_ESQUEMA:
+        return version
+    
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migraciones (
+            nombre TEXT PRIMARY KEY,
+            fecha_aplicacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    for numero, nombre, paso in MIGRACIONES:
+        if numero <= version:
+            continue
+        try:
+            with db.transaction():
+                cursor = conn.cursor()
+                paso(cursor)
+                cursor.execute(
+                    "INSERT OR IGNORE INTO schema_migraciones (nombre) VALUES (?)",
+                    (f"{numero:03d}_{nombre}",)
+                )
+                cursor.execute(f"PRAGMA user_version = {int(numero)}")
+        except Exception as e:
+            print(f"Error aplicando la migración {numero:03d}_{nombre}: {e}")
+            raise
+        version = numero
+    
+    return version
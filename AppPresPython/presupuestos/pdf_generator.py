@@ -11,7 +11,8 @@ import os
 import re
 from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional
-from decimal import Decimal, ROUND_DOWN
+
+from .dinero import formatear_truncado
 
 
 def _get_default_logo_path() -> str:
@@ -37,20 +38,8 @@ class PDFGenerator:
         Returns:
             String con el precio formateado con exactamente 2 decimales
         """
-        if value is None:
-            value = 0.0
-        
-        # Convertir a Decimal para evitar problemas de precisión de punto flotante
-        try:
-            decimal_value = Decimal(str(value))
-        except:
-            decimal_value = Decimal(str(float(value)))
-        
-        # Truncar a 2 decimales sin redondear (usando ROUND_DOWN)
-        decimal_value = decimal_value.quantize(Decimal('0.01'), rounding=ROUND_DOWN)
-        
-        # Formatear siempre con 2 decimales
-        str_value = format(decimal_value, '.2f')
+        # Conversión cacheada: cada valor distinto se convierte a Decimal una sola vez
+        str_value = formatear_truncado(value if value is not None else 0.0)
         
         return f"{str_value}€" if include_euro else str_value
     
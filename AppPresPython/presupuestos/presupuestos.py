@@ -1,10 +1,15 @@
-from .utils import db
+from .utils import (db, filtro_rango_fechas, dividir_en_bloques, clausula_limite, paginar_por_clave,
+                    DatabaseManager, ROW_DICT, TAMANO_PAGINA, PAGINA_SIGUIENTE, metrica_en_cache)
+from .totales import calcular_totales
+from .dinero import importe_linea
+from .busqueda import expresion_fts, rango_fecha_termino
+from .resumenes import estadisticas_resumen
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 
 class PresupuestoManager:
-    def __init__(self):
-        self.db = db
+    def __init__(self, db_manager: Optional[DatabaseManager] = None):
+        self.db = db_manager or db
         self.iva_porcentaje = 21.0  # 21% de IVA
     
     def crear_presupuesto(self, cliente_id: int, items: List[Dict[str, Any]], iva_habilitado: bool = True,
@@ -14,102 +19,136 @@ class PresupuestoManager:
         # Calcular totales con nuevos campos
         totales = self.calcular_totales_completo(items, descuento_global_porcentaje, descuento_global_fijo, descuento_antes_iva, iva_habilitado)
         
-        # Crear presupuesto
-        query = """
-            INSERT INTO presupuestos (cliente_id, subtotal, iva, total, iva_habilitado, 
-                                    descuento_global_porcentaje, descuento_global_fijo, descuento_antes_iva)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        presupuesto_id = self.db.execute_update(query, (
-            cliente_id, totales['subtotal'], totales['iva'], totales['total'], 
-            1 if iva_habilitado else 0, descuento_global_porcentaje, descuento_global_fijo,
-            1 if descuento_antes_iva else 0
-        ))
+        # Cabecera e items en una sola transacción
+        with self.db.transaction():
+            # Crear presupuesto
+            query = """
+                INSERT INTO presupuestos (cliente_id, subtotal, iva, total, iva_habilitado, 
+                                        descuento_global_porcentaje, descuento_global_fijo, descuento_antes_iva)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """
+            presupuesto_id = self.db.execute_update(query, (
+                cliente_id, totales['subtotal'], totales['iva'], totales['total'], 
+                1 if iva_habilitado else 0, descuento_global_porcentaje, descuento_global_fijo,
+                1 if descuento_antes_iva else 0
+            ))
         
-        # Crear items del presupuesto
-        for item in items:
-            item_subtotal = item['cantidad'] * item['precio_unitario']
+            # Crear items del presupuesto en un único executemany
             item_query = """
                 INSERT INTO presupuesto_items (presupuesto_id, material_id, tarea_manual, cantidad, precio_unitario, subtotal, 
                                               visible_pdf, es_tarea_manual, aplica_iva, descuento_porcentaje, descuento_fijo)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """
-            self.db.execute_update(item_query, (
-                presupuesto_id, 
-                item.get('material_id'), 
-                item.get('tarea_manual', ''),
-                item['cantidad'], 
-                item['precio_unitario'], 
-                item_subtotal,
-                item.get('visible_pdf', 1),
-                item.get('es_tarea_manual', 0),
-                item.get('aplica_iva', 1),
-                item.get('descuento_porcentaje', 0),
-                item.get('descuento_fijo', 0)
-            ))
+            self.db.execute_many(item_query, [
+                (
+                    presupuesto_id, 
+                    item.get('material_id'), 
+                    item.get('tarea_manual', ''),
+                    item['cantidad'], 
+                    item['precio_unitario'], 
+                    importe_linea(item['cantidad'], item['precio_unitario']),
+                    item.get('visible_pdf', 1),
+                    item.get('es_tarea_manual', 0),
+                    item.get('aplica_iva', 1),
+                    item.get('descuento_porcentaje', 0),
+                    item.get('descuento_fijo', 0)
+                )
+                for item in items
+            ])
         
         return presupuesto_id
     
-    def obtener_presupuestos(self, anio: Optional[int] = None, mes: Optional[int] = None) -> List[Dict[str, Any]]:
-        """Obtiene presupuestos con filtros opcionales por año y mes"""
+    def _filtros_listado(self, termino: Optional[str] = None, anio: Optional[int] = None,
+                         mes: Optional[int] = None, estado: Optional[str] = None):
+        """Condiciones WHERE y parámetros comunes a los listados de presupuestos"""
         where_clauses = []
         params: List[Any] = []
 
-        if anio is not None:
-            where_clauses.append("strftime('%Y', p.fecha_creacion) = ?")
-            params.append(str(anio))
+        expresion = expresion_fts(termino, 'nombre')
+        if expresion and self.db.tiene_busqueda_fts():
+            # Cliente por su índice FTS, ID por subcadena (como antes) o fecha por rango
+            alternativas = ["p.cliente_id IN (SELECT rowid FROM clientes_fts WHERE clientes_fts MATCH ?)"]
+            params.append(expresion)
+            if termino.strip().isdigit():
+                alternativas.append("CAST(p.id AS TEXT) LIKE ?")
+                params.append(f"%{termino.strip()}%")
+            rango = rango_fecha_termino(termino)
+            if rango:
+                alternativas.append("(p.fecha_creacion >= ? AND p.fecha_creacion < ?)")
+                params.extend(rango)
+            where_clauses.append(f"({' OR '.join(alternativas)})")
+        elif termino:
+            where_clauses.append("(c.nombre LIKE ? OR CAST(p.id AS TEXT) LIKE ? OR p.fecha_creacion LIKE ?)")
+            termino_busqueda = f"%{termino}%"
+            params.extend([termino_busqueda, termino_busqueda, termino_busqueda])
 
-        if mes is not None:
-            where_clauses.append("strftime('%m', p.fecha_creacion) = ?")
-            params.append(f"{int(mes):02d}")
+        clausulas_fecha, params_fecha = filtro_rango_fechas('p.fecha_creacion', anio=anio, mes=mes)
+        where_clauses.extend(clausulas_fecha)
+        params.extend(params_fecha)
 
-        where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+        if estado:
+            where_clauses.append("COALESCE(p.estado, 'Pendiente') = ?")
+            params.append(estado)
 
-        query = f"""
-            SELECT p.*, c.nombre as cliente_nombre, c.telefono, c.email
-            FROM presupuestos p
-            JOIN clientes c ON p.cliente_id = c.id
-            {where_sql}
-            ORDER BY p.fecha_creacion DESC
-        """
-        return self.db.execute_query(query, tuple(params))
+        return where_clauses, params
+
+    def obtener_presupuestos(self, anio: Optional[int] = None, mes: Optional[int] = None,
+                             row_mode: str = ROW_DICT, estado: Optional[str] = None,
+                             limite: Optional[int] = None, desplazamiento: int = 0) -> List[Dict[str, Any]]:
+        """Obtiene presupuestos con filtros opcionales por año, mes y estado (row_mode=ROW_RECORD para listados)"""
+        return self.buscar_presupuestos(None, anio, mes, row_mode, estado, limite, desplazamiento)
     
     def obtener_presupuesto_por_id(self, presupuesto_id: int) -> Optional[Dict[str, Any]]:
         """Obtiene un presupuesto específico con sus items"""
-        # Obtener presupuesto
-        query = """
-            SELECT p.*, c.nombre as cliente_nombre, c.telefono, c.email, c.direccion
-            FROM presupuestos p
-            JOIN clientes c ON p.cliente_id = c.id
-            WHERE p.id = ?
-        """
-        presupuesto = self.db.execute_query(query, (presupuesto_id,))
-        if not presupuesto:
-            return None
+        presupuestos = self.obtener_presupuestos_con_items([presupuesto_id])
+        return presupuestos[0] if presupuestos else None
+    
+    def obtener_presupuestos_con_items(self, presupuesto_ids: List[int]) -> List[Dict[str, Any]]:
+        """Obtiene varios presupuestos con sus items en dos consultas (cabeceras e items).
         
-        # Obtener items del presupuesto
-        items_query = """
-            SELECT pi.*, m.nombre as material_nombre, m.unidad_medida
-            FROM presupuesto_items pi
-            LEFT JOIN materiales m ON pi.material_id = m.id
-            WHERE pi.presupuesto_id = ?
-            ORDER BY pi.id
+        Devuelve los presupuestos en el orden de los IDs recibidos; los que no existen se omiten.
         """
-        items = self.db.execute_query(items_query, (presupuesto_id,))
+        ids = list(dict.fromkeys(presupuesto_ids))
+        presupuestos: Dict[int, Dict[str, Any]] = {}
+        
+        for bloque in dividir_en_bloques(ids):
+            marcadores = ", ".join("?" * len(bloque))
+            query = f"""
+                SELECT p.*, c.nombre as cliente_nombre, c.telefono, c.email, c.direccion
+                FROM presupuestos p
+                JOIN clientes c ON p.cliente_id = c.id
+                WHERE p.id IN ({marcadores})
+            """
+            for presupuesto in self.db.execute_query(query, tuple(bloque)):
+                presupuesto['items'] = []
+                presupuestos[presupuesto['id']] = presupuesto
+        
+        encontrados = [pid for pid in ids if pid in presupuestos]
+        for bloque in dividir_en_bloques(encontrados):
+            marcadores = ", ".join("?" * len(bloque))
+            items_query = f"""
+                SELECT pi.*, m.nombre as material_nombre, m.unidad_medida
+                FROM presupuesto_items pi
+                LEFT JOIN materiales m ON pi.material_id = m.id
+                WHERE pi.presupuesto_id IN ({marcadores})
+                ORDER BY pi.presupuesto_id, pi.id
+            """
+            for item in self.db.execute_query(items_query, tuple(bloque)):
+                presupuestos[item['presupuesto_id']]['items'].append(item)
         
-        presupuesto[0]['items'] = items
-        return presupuesto[0]
+        return [presupuestos[pid] for pid in encontrados]
     
     def eliminar_presupuesto(self, presupuesto_id: int) -> bool:
         """Elimina un presupuesto y sus items"""
         try:
-            # Eliminar items primero
-            items_query = "DELETE FROM presupuesto_items WHERE presupuesto_id = ?"
-            self.db.execute_update(items_query, (presupuesto_id,))
-            
-            # Eliminar presupuesto
-            presupuesto_query = "DELETE FROM presupuestos WHERE id = ?"
-            self.db.execute_update(presupuesto_query, (presupuesto_id,))
+            with self.db.transaction():
+                # Eliminar items primero
+                items_query = "DELETE FROM presupuesto_items WHERE presupuesto_id = ?"
+                self.db.execute_update(items_query, (presupuesto_id,))
+                
+                # Eliminar presupuesto
+                presupuesto_query = "DELETE FROM presupuestos WHERE id = ?"
+                self.db.execute_update(presupuesto_query, (presupuesto_id,))
             
             return True
         except:
@@ -122,74 +161,13 @@ class PresupuestoManager:
     def calcular_totales_completo(self, items: List[Dict[str, Any]], descuento_global_porcentaje: float = 0,
                                  descuento_global_fijo: float = 0, descuento_antes_iva: bool = True,
                                  iva_habilitado: bool = True) -> Dict[str, float]:
-        """Calcula totales completos con descuentos por item y globales"""
-        subtotal = 0.0
-        descuentos_items = 0.0
-        iva_base = 0.0
+        """Calcula totales completos con descuentos por item y globales.
         
-        # Verificar si hay items y si alguno tiene IVA habilitado
-        items_con_iva = [item for item in items if item.get('aplica_iva', True)]
-        
-        # Si no hay items con IVA habilitado, forzar iva_habilitado a False
-        if not items_con_iva and items:
-            iva_habilitado = False
-        
-        # Calcular subtotal y descuentos por item
-        for item in items:
-            item_subtotal = item['cantidad'] * item['precio_unitario']
-            
-            # Aplicar descuentos por item (porcentaje tiene prioridad)
-            item_descuento = 0.0
-            if item.get('descuento_porcentaje', 0) > 0:
-                item_descuento = item_subtotal * (item['descuento_porcentaje'] / 100)
-            elif item.get('descuento_fijo', 0) > 0:
-                item_descuento = min(item['descuento_fijo'], item_subtotal)
-            
-            subtotal += item_subtotal - item_descuento
-            descuentos_items += item_descuento
-            
-            # Calcular IVA solo para items que lo tienen habilitado
-            if item.get('aplica_iva', True) and iva_habilitado:
-                iva_base += (item_subtotal - item_descuento) * (self.iva_porcentaje / 100)
-        
-        # Calcular IVA primero (sin descuento global aplicado aún)
-        iva = iva_base
-        
-        # Aplicar descuento global según configuración
-        descuento_global = 0.0
-        if descuento_antes_iva:
-            # Descuento se aplica antes de calcular IVA
-            if descuento_global_porcentaje > 0:
-                descuento_global = subtotal * (descuento_global_porcentaje / 100)
-            elif descuento_global_fijo > 0:
-                descuento_global = min(descuento_global_fijo, subtotal)
-            
-            # Recalcular IVA sobre la base después del descuento
-            base_iva = subtotal - descuento_global
-            if subtotal > 0:
-                iva = iva_base * (base_iva / subtotal)
-            else:
-                iva = 0.0
-            total = base_iva + iva
-        else:
-            # Descuento se aplica después de calcular IVA (sobre subtotal + IVA)
-            total_sin_descuento = subtotal + iva
-            if descuento_global_porcentaje > 0:
-                descuento_global = total_sin_descuento * (descuento_global_porcentaje / 100)
-            elif descuento_global_fijo > 0:
-                descuento_global = min(descuento_global_fijo, total_sin_descuento)
-            
-            total = total_sin_descuento - descuento_global
-        
-        return {
-            'subtotal': subtotal,
-            'descuentos_items': descuentos_items,
-            'descuento_global': descuento_global,
-            'iva': iva,
-            'total': total,
-            'iva_porcentaje': self.iva_porcentaje,
-            'descuento_antes_iva': descuento_antes_iva
-        }
+        Si el descuento global va después del IVA se aplica sobre subtotal + IVA.
+        """
+        return calcular_totales(items, descuento_global_porcentaje, descuento_global_fijo,
+                                descuento_antes_iva, iva_habilitado,
+                                iva_porcentaje=self.iva_porcentaje, descuento_sobre_total=True)
     
     def actualizar_visibilidad_item(self, item_id: int, visible: bool) -> bool:
         """Actualiza la visibilidad de un item en el PDF"""
@@ -211,34 +189,55 @@ class PresupuestoManager:
         """
         return self.db.execute_query(query, (presupuesto_id,))
     
-    def buscar_presupuestos(self, termino: str, anio: Optional[int] = None, mes: Optional[int] = None) -> List[Dict[str, Any]]:
-        """Busca presupuestos por cliente, ID o fecha con filtros opcionales"""
-        where_clauses = [
-            "(c.nombre LIKE ? OR CAST(p.id AS TEXT) LIKE ? OR p.fecha_creacion LIKE ?)"
-        ]
-        params: List[Any] = []
-
-        termino_busqueda = f"%{termino}%"
-        params.extend([termino_busqueda, termino_busqueda, termino_busqueda])
-
-        if anio is not None:
-            where_clauses.append("strftime('%Y', p.fecha_creacion) = ?")
-            params.append(str(anio))
-
-        if mes is not None:
-            where_clauses.append("strftime('%m', p.fecha_creacion) = ?")
-            params.append(f"{int(mes):02d}")
+    def buscar_presupuestos(self, termino: Optional[str], anio: Optional[int] = None, mes: Optional[int] = None,
+                            row_mode: str = ROW_DICT, estado: Optional[str] = None,
+                            limite: Optional[int] = None, desplazamiento: int = 0) -> List[Dict[str, Any]]:
+        """Busca presupuestos por cliente, ID o fecha con filtros opcionales (row_mode=ROW_RECORD para listados)"""
+        where_clauses, params = self._filtros_listado(termino, anio, mes, estado)
+        where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+        limite_sql, params_limite = clausula_limite(limite, desplazamiento)
 
-        where_sql = " AND ".join(where_clauses)
+        query = f"""
+            SELECT p.*, c.nombre as cliente_nombre, c.telefono, c.email
+            FROM presupuestos p
+            JOIN clientes c ON p.cliente_id = c.id
+            {where_sql}
+            ORDER BY p.fecha_creacion DESC, p.id DESC
+            {limite_sql}
+        """
+        return self.db.execute_query(query, tuple(params + params_limite), row_mode=row_mode)
 
+    def contar_presupuestos(self, termino: Optional[str] = None, anio: Optional[int] = None,
+                            mes: Optional[int] = None, estado: Optional[str] = None) -> int:
+        """Cuenta los presupuestos que devolvería el listado con los mismos filtros"""
+        where_clauses, params = self._filtros_listado(termino, anio, mes, estado)
+        where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
         query = f"""
+            SELECT COUNT(*) as total
+            FROM presupuestos p
+            JOIN clientes c ON p.cliente_id = c.id
+            {where_sql}
+        """
+        result = self.db.execute_query(query, tuple(params))
+        return result[0]['total'] if result else 0
+
+    def listar_presupuestos_pagina(self, cursor: Optional[str] = None, tamano: int = TAMANO_PAGINA,
+                                   direccion: str = PAGINA_SIGUIENTE, termino: Optional[str] = None,
+                                   anio: Optional[int] = None, mes: Optional[int] = None,
+                                   estado: Optional[str] = None, row_mode: str = ROW_DICT) -> Dict[str, Any]:
+        """Página de presupuestos por cursor (fecha_creacion, id), de la más reciente a la más antigua.
+        
+        Devuelve {'filas', 'siguiente', 'anterior'} con los tokens para pedir la página contigua.
+        """
+        where_clauses, params = self._filtros_listado(termino, anio, mes, estado)
+        consulta_base = """
             SELECT p.*, c.nombre as cliente_nombre, c.telefono, c.email
             FROM presupuestos p
             JOIN clientes c ON p.cliente_id = c.id
-            WHERE {where_sql}
-            ORDER BY p.fecha_creacion DESC
         """
-        return self.db.execute_query(query, tuple(params))
+        return paginar_por_clave(self.db, consulta_base, where_clauses, params,
+                                 ['p.fecha_creacion', 'p.id'], cursor, tamano, direccion,
+                                 descendente=True, row_mode=row_mode)
 
     def obtener_anios_presupuestos(self) -> List[str]:
         """Obtiene la lista de años disponibles en los registros de presupuestos"""
@@ -256,9 +255,9 @@ class PresupuestoManager:
         where_clauses = ["fecha_creacion IS NOT NULL"]
         params: List[Any] = []
 
-        if anio is not None:
-            where_clauses.append("strftime('%Y', fecha_creacion) = ?")
-            params.append(str(anio))
+        clausulas_fecha, params_fecha = filtro_rango_fechas('fecha_creacion', anio=anio)
+        where_clauses.extend(clausulas_fecha)
+        params.extend(params_fecha)
 
         where_sql = " WHERE " + " AND ".join(where_clauses) if where_clauses else ""
 
@@ -281,144 +280,46 @@ class PresupuestoManager:
         except:
             return False
     
+    @metrica_en_cache('estadisticas_presupuestos')
     def obtener_estadisticas_presupuestos(self, fecha_inicio: str = None, fecha_fin: str = None) -> Dict[str, Any]:
         """Obtiene estadísticas de presupuestos con filtros de fecha opcionales"""
-        # Construir query base
-        where_clauses = []
-        params = []
-        
-        if fecha_inicio:
-            where_clauses.append("DATE(p.fecha_creacion) >= ?")
-            params.append(fecha_inicio)
-        
-        if fecha_fin:
-            where_clauses.append("DATE(p.fecha_creacion) <= ?")
-            params.append(fecha_fin)
-        
-        where_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
-        
-        # Total emitidos
-        query_total = f"""
-            SELECT COUNT(*) as total
-            FROM presupuestos p
-            {where_sql}
-        """
-        result_total = self.db.execute_query(query_total, tuple(params))
-        total_emitidos = result_total[0]['total'] if result_total else 0
-        
-        # Contadores por estado
-        query_estados = f"""
-            SELECT 
-                COALESCE(estado, 'Pendiente') as estado,
-                COUNT(*) as cantidad
-            FROM presupuestos p
-            {where_sql}
-            GROUP BY COALESCE(estado, 'Pendiente')
-        """
-        result_estados = self.db.execute_query(query_estados, tuple(params))
-        
-        # Inicializar contadores
-        pendientes = 0
-        aprobados = 0
-        rechazados = 0
-        
-        for row in result_estados:
-            estado = row['estado']
-            cantidad = row['cantidad']
-            if estado == 'Pendiente':
-                pendientes = cantidad
-            elif estado == 'Aprobado':
-                aprobados = cantidad
-            elif estado == 'Rechazado':
-                rechazados = cantidad
-        
-        # Cálculos monetarios
-        query_valores = f"""
-            SELECT 
-                COALESCE(SUM(total), 0) as total_valor_emitidos,
-                COALESCE(AVG(total), 0) as promedio_presupuesto,
-                COALESCE(MAX(total), 0) as presupuesto_max,
-                COALESCE(MIN(total), 0) as presupuesto_min,
-                COALESCE(SUM(descuento_global_porcentaje * total / 100), 0) + 
-                COALESCE(SUM(descuento_global_fijo), 0) as total_descuentos
-            FROM presupuestos p
-            {where_sql}
-        """
-        result_valores = self.db.execute_query(query_valores, tuple(params))
-        valores = result_valores[0] if result_valores else {}
-        total_valor_emitidos = valores.get('total_valor_emitidos', 0) or 0
-        promedio_presupuesto = valores.get('promedio_presupuesto', 0) or 0
-        presupuesto_max = valores.get('presupuesto_max', 0) or 0
-        presupuesto_min = valores.get('presupuesto_min', 0) or 0
-        total_descuentos = valores.get('total_descuentos', 0) or 0
-        
-        # Valores por estado
-        query_valor_estados = f"""
-            SELECT 
-                COALESCE(estado, 'Pendiente') as estado,
-                COALESCE(SUM(total), 0) as valor_total
-            FROM presupuestos p
-            {where_sql}
-            GROUP BY COALESCE(estado, 'Pendiente')
-        """
-        result_valor_estados = self.db.execute_query(query_valor_estados, tuple(params))
-        
-        total_valor_pendientes = 0
-        total_valor_aprobados = 0
-        total_valor_rechazados = 0
-        
-        for row in result_valor_estados:
-            estado = row['estado']
-            valor = row['valor_total'] or 0
-            if estado == 'Pendiente':
-                total_valor_pendientes = valor
-            elif estado == 'Aprobado':
-                total_valor_aprobados = valor
-            elif estado == 'Rechazado':
-                total_valor_rechazados = valor
+        stats = estadisticas_resumen(self.db, 'presupuesto', fecha_inicio, fecha_fin)
+        pendientes = stats['por_estado'].get('Pendiente', {})
+        aprobados = stats['por_estado'].get('Aprobado', {})
+        rechazados = stats['por_estado'].get('Rechazado', {})
+        total_emitidos = stats['cantidad']
         
         # Datos agrupados por mes para evolución
-        query_mensual = f"""
-            SELECT 
-                strftime('%Y-%m', p.fecha_creacion) as mes,
-                COUNT(*) as cantidad,
-                COALESCE(SUM(total), 0) as valor_total,
-                COALESCE(estado, 'Pendiente') as estado
-            FROM presupuestos p
-            {where_sql}
-            GROUP BY strftime('%Y-%m', p.fecha_creacion), COALESCE(estado, 'Pendiente')
-            ORDER BY mes
-        """
-        result_mensual = self.db.execute_query(query_mensual, tuple(params))
+        evolucion_mensual = [
+            {'mes': g['mes'], 'cantidad': g['cantidad'], 'valor_total': g['suma_total'], 'estado': g['estado']}
+            for g in stats['mensual']
+        ]
         
         return {
             'total_emitidos': total_emitidos,
-            'pendientes': pendientes,
-            'aprobados': aprobados,
-            'rechazados': rechazados,
-            'total_valor_emitidos': total_valor_emitidos,
-            'total_valor_pendientes': total_valor_pendientes,
-            'total_valor_aprobados': total_valor_aprobados,
-            'total_valor_rechazados': total_valor_rechazados,
-            'promedio_presupuesto': promedio_presupuesto,
-            'presupuesto_max': presupuesto_max,
-            'presupuesto_min': presupuesto_min,
-            'total_descuentos': total_descuentos,
-            'evolucion_mensual': result_mensual
+            'pendientes': pendientes.get('cantidad', 0),
+            'aprobados': aprobados.get('cantidad', 0),
+            'rechazados': rechazados.get('cantidad', 0),
+            'total_valor_emitidos': stats['suma_total'],
+            'total_valor_pendientes': pendientes.get('suma_total', 0),
+            'total_valor_aprobados': aprobados.get('suma_total', 0),
+            'total_valor_rechazados': rechazados.get('suma_total', 0),
+            'promedio_presupuesto': stats['suma_total'] / total_emitidos if total_emitidos else 0,
+            'presupuesto_max': stats['maximo_total'],
+            'presupuesto_min': stats['minimo_total'],
+            'total_descuentos': stats['suma_descuentos'],
+            'evolucion_mensual': evolucion_mensual
         }
-
+    
+    @metrica_en_cache('tasa_conversion_presupuestos')
     def obtener_tasa_conversion_presupuestos(self, fecha_inicio: str = None, fecha_fin: str = None) -> Dict[str, Any]:
         """Calcula la tasa de conversión de presupuestos a facturas"""
         where_clauses = []
         params = []
         
-        if fecha_inicio:
-            where_clauses.append("DATE(p.fecha_creacion) >= ?")
-            params.append(fecha_inicio)
-        
-        if fecha_fin:
-            where_clauses.append("DATE(p.fecha_creacion) <= ?")
-            params.append(fecha_fin)
+        clausulas_fecha, params_fecha = filtro_rango_fechas('p.fecha_creacion', fecha_inicio=fecha_inicio, fecha_fin=fecha_fin)
+        where_clauses.extend(clausulas_fecha)
+        params.extend(params_fecha)
         
         # Construir WHERE clause
         if where_clauses:
@@ -458,18 +359,15 @@ class PresupuestoManager:
             'tasa_conversion': tasa_conversion
         }
     
+    @metrica_en_cache('top_clientes_presupuestos')
     def obtener_top_clientes_presupuestos(self, fecha_inicio: str = None, fecha_fin: str = None, limite: int = 10) -> List[Dict[str, Any]]:
         """Obtiene los top clientes por valor de presupuestos"""
         where_clauses = []
         params = []
         
-        if fecha_inicio:
-            where_clauses.append("DATE(p.fecha_creacion) >= ?")
-            params.append(fecha_inicio)
-        
-        if fecha_fin:
-            where_clauses.append("DATE(p.fecha_creacion) <= ?")
-            params.append(fecha_fin)
+        clausulas_fecha, params_fecha = filtro_rango_fechas('p.fecha_creacion', fecha_inicio=fecha_inicio, fecha_fin=fecha_fin)
+        where_clauses.extend(clausulas_fecha)
+        params.extend(params_fecha)
         
         where_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
         
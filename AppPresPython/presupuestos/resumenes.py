@@ -0,0 +1,361 @@
+"""
+Resumen mensual materializado de facturas y presupuestos.
+
+La tabla resumen_mensual guarda, por tipo de documento, mes ('AAAA-MM') y
+estado, el número de documentos y las sumas que usan las métricas. Los
+documentos sin estado cuentan en el estado por defecto, pero su importe se
+guarda también aparte (suma_total_sin_estado) porque los importes pendientes
+solo suman los documentos con el estado anotado. Los
+importes se guardan en céntimos enteros para que los ajustes sucesivos no
+acumulen error de redondeo; al leerlos se devuelven en euros. Los
+triggers la mantienen al día en cada alta, baja o modificación: sumas y
+contadores se ajustan con la diferencia y el mínimo/máximo solo se recalcula
+(sobre ese mes) cuando se elimina el documento que lo marcaba.
+
+Las métricas leen los meses completos del resumen y solo recorren las tablas
+de documentos para los días sueltos al principio y al final del rango.
+
+Reconstrucción manual: ``python -m presupuestos.resumenes [ruta.db]``
+"""
+
+import sys
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+TABLA_RESUMEN = 'resumen_mensual'
+
+# tipo -> (tabla, expresión del estado normalizado, expresión de la retención IRPF)
+TIPOS = {
+    'factura': ('facturas', "COALESCE({p}estado_pago, 'No Pagada')", "{p}retencion_irpf * {p}subtotal / 100"),
+    'presupuesto': ('presupuestos', "COALESCE({p}estado, 'Pendiente')", "0"),
+}
+
+# Columna de estado tal cual (NULL = sin estado anotado)
+COLUMNA_ESTADO = {'factura': 'estado_pago', 'presupuesto': 'estado'}
+
+# Columnas cuyo cambio altera el resumen
+COLUMNAS_RESUMEN = {
+    'factura': ('fecha_creacion', 'estado_pago', 'total', 'subtotal', 'descuento_global_porcentaje',
+                'descuento_global_fijo', 'retencion_irpf'),
+    'presupuesto': ('fecha_creacion', 'estado', 'total', 'descuento_global_porcentaje', 'descuento_global_fijo'),
+}
+
+
+# Columnas del resumen guardadas en céntimos
+COLUMNAS_IMPORTE = ('suma_total', 'suma_total_sin_estado', 'suma_descuentos', 'suma_retencion_irpf',
+                    'minimo_total', 'maximo_total')
+
+
+def _centimos(expresion: str) -> str:
+    """Expresión SQL que pasa un importe en euros a céntimos enteros"""
+    return f"CAST(ROUND(({expresion}) * 100) AS INTEGER)"
+
+
+def _descuento(p: str = '') -> str:
+    return f"COALESCE({p}descuento_global_porcentaje * {p}total / 100, 0) + COALESCE({p}descuento_global_fijo, 0)"
+
+
+def _total_sin_estado(tipo: str, p: str = '') -> str:
+    """Total del documento si no tiene estado anotado, 0 si lo tiene"""
+    return f"CASE WHEN {p}{COLUMNA_ESTADO[tipo]} IS NULL THEN COALESCE({p}total, 0) ELSE 0 END"
+
+
+def _agregados(tipo: str) -> str:
+    """Columnas agregadas del resumen calculadas sobre la tabla de documentos"""
+    _, _, retencion = TIPOS[tipo]
+    return f"""
+        COUNT(*) as cantidad,
+        COALESCE(SUM({_centimos('total')}), 0) as suma_total,
+        COALESCE(SUM({_centimos(_total_sin_estado(tipo))}), 0) as suma_total_sin_estado,
+        COALESCE(SUM({_centimos(_descuento())}), 0) as suma_descuentos,
+        COALESCE(SUM({_centimos(retencion.format(p=''))}), 0) as suma_retencion_irpf,
+        {_centimos('MIN(total)')} as minimo_total,
+        {_centimos('MAX(total)')} as maximo_total
+    """
+
+
+def _rango_mes(referencia: str) -> str:
+    """Predicado del mes natural de la fila referencia (NEW/OLD) sobre fecha_creacion"""
+    return (f"fecha_creacion >= date({referencia}.fecha_creacion, 'start of month') "
+            f"AND fecha_creacion < date({referencia}.fecha_creacion, 'start of month', '+1 month')")
+
+
+def _sumar(tipo: str) -> str:
+    """Sentencia de trigger que añade la fila NEW a su grupo"""
+    _, estado, retencion = TIPOS[tipo]
+    return f"""
+        INSERT INTO {TABLA_RESUMEN} (tipo, mes, estado, cantidad, suma_total, suma_total_sin_estado,
+                                     suma_descuentos, suma_retencion_irpf, minimo_total, maximo_total)
+        SELECT '{tipo}', strftime('%Y-%m', NEW.fecha_creacion), {estado.format(p='NEW.')}, 1,
+               {_centimos('COALESCE(NEW.total, 0)')}, {_centimos(_total_sin_estado(tipo, 'NEW.'))},
+               {_centimos(_descuento('NEW.'))},
+               {_centimos(f"COALESCE({retencion.format(p='NEW.')}, 0)")},
+               {_centimos('NEW.total')}, {_centimos('NEW.total')}
+        WHERE NEW.fecha_creacion IS NOT NULL
+        ON CONFLICT (tipo, mes, estado) DO UPDATE SET
+            cantidad = cantidad + 1,
+            suma_total = suma_total + excluded.suma_total,
+            suma_total_sin_estado = suma_total_sin_estado + excluded.suma_total_sin_estado,
+            suma_descuentos = suma_descuentos + excluded.suma_descuentos,
+            suma_retencion_irpf = suma_retencion_irpf + excluded.suma_retencion_irpf,
+            minimo_total = MIN(COALESCE(minimo_total, excluded.minimo_total), excluded.minimo_total),
+            maximo_total = MAX(COALESCE(maximo_total, excluded.maximo_total), excluded.maximo_total);
+    """
+
+
+def _restar(tipo: str) -> str:
+    """Sentencias de trigger que quitan la fila OLD de su grupo"""
+    tabla, estado, retencion = TIPOS[tipo]
+    grupo = (f"tipo = '{tipo}' AND mes = strftime('%Y-%m', OLD.fecha_creacion) "
+             f"AND estado = {estado.format(p='OLD.')}")
+    # Subconsulta sobre el mes de OLD: solo se evalúa si OLD marcaba el mínimo o el máximo
+    mismo_grupo = f"{_rango_mes('OLD')} AND {estado.format(p='')} = {estado.format(p='OLD.')}"
+    return f"""
+        UPDATE {TABLA_RESUMEN} SET
+            cantidad = cantidad - 1,
+            suma_total = suma_total - {_centimos('COALESCE(OLD.total, 0)')},
+            suma_total_sin_estado = suma_total_sin_estado - {_centimos(_total_sin_estado(tipo, 'OLD.'))},
+            suma_descuentos = suma_descuentos - {_centimos(_descuento('OLD.'))},
+            suma_retencion_irpf = suma_retencion_irpf - {_centimos(f"COALESCE({retencion.format(p='OLD.')}, 0)")},
+            minimo_total = CASE WHEN {_centimos('OLD.total')} > minimo_total THEN minimo_total
+                                ELSE {_centimos(f"SELECT MIN(total) FROM {tabla} WHERE {mismo_grupo}")} END,
+            maximo_total = CASE WHEN {_centimos('OLD.total')} < maximo_total THEN maximo_total
+                                ELSE {_centimos(f"SELECT MAX(total) FROM {tabla} WHERE {mismo_grupo}")} END
+        WHERE {grupo};
+        DELETE FROM {TABLA_RESUMEN} WHERE {grupo} AND cantidad <= 0;
+    """
+
+
+def crear_resumen_mensual(cursor):
+    """Crea la tabla de resumen mensual, sus triggers y la rellena con el histórico"""
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABLA_RESUMEN} (
+            tipo TEXT NOT NULL,
+            mes TEXT NOT NULL,
+            estado TEXT NOT NULL,
+            cantidad INTEGER NOT NULL DEFAULT 0,
+            suma_total INTEGER NOT NULL DEFAULT 0,
+            suma_total_sin_estado INTEGER NOT NULL DEFAULT 0,
+            suma_descuentos INTEGER NOT NULL DEFAULT 0,
+            suma_retencion_irpf INTEGER NOT NULL DEFAULT 0,
+            minimo_total INTEGER,
+            maximo_total INTEGER,
+            PRIMARY KEY (tipo, mes, estado)
+        ) WITHOUT ROWID
+    """)
+    for tipo, (tabla, _, _) in TIPOS.items():
+        columnas = ", ".join(COLUMNAS_RESUMEN[tipo])
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {TABLA_RESUMEN}_{tabla}_ai AFTER INSERT ON {tabla} BEGIN
+                {_sumar(tipo)}
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {TABLA_RESUMEN}_{tabla}_ad AFTER DELETE ON {tabla} BEGIN
+                {_restar(tipo)}
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {TABLA_RESUMEN}_{tabla}_au AFTER UPDATE OF {columnas} ON {tabla} BEGIN
+                {_restar(tipo)}
+                {_sumar(tipo)}
+            END
+        """)
+    _rellenar(cursor)
+
+
+def _rellenar(cursor):
+    for tipo, (tabla, estado, _) in TIPOS.items():
+        cursor.execute(f"DELETE FROM {TABLA_RESUMEN} WHERE tipo = ?", (tipo,))
+        cursor.execute(f"""
+            INSERT INTO {TABLA_RESUMEN} (tipo, mes, estado, cantidad, suma_total, suma_total_sin_estado,
+                                         suma_descuentos, suma_retencion_irpf, minimo_total, maximo_total)
+            SELECT '{tipo}', strftime('%Y-%m', fecha_creacion), {estado.format(p='')}, {_agregados(tipo)}
+            FROM {tabla}
+            WHERE fecha_creacion IS NOT NULL
+            GROUP BY 2, 3
+        """)
+
+
+def reconstruir_resumen_mensual(db_manager):
+    """Recalcula el resumen mensual completo desde facturas y presupuestos"""
+    with db_manager.transaction():
+        _rellenar(db_manager.get_connection().cursor())
+
+
+def _inicio_mes(dia: date) -> date:
+    return dia.replace(day=1)
+
+
+def _mes_siguiente(dia: date) -> date:
+    return date(dia.year + (dia.month == 12), dia.month % 12 + 1, 1)
+
+
+def _dia(fecha: Optional[str]) -> Optional[date]:
+    if not fecha:
+        return None
+    try:
+        return datetime.strptime(fecha[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def _tramos(fecha_inicio: Optional[str], fecha_fin: Optional[str]):
+    """Divide [fecha_inicio, fecha_fin] en meses completos y días sueltos.
+
+    Devuelve (usar_resumen, primer mes completo, mes tras el último completo,
+    tramos sueltos [inicio, fin)); los meses van como 'AAAA-MM' y None
+    significa sin límite.
+    """
+    inicio = _dia(fecha_inicio)
+    fin = _dia(fecha_fin)
+    fin = fin + timedelta(days=1) if fin else None
+
+    primer_mes = inicio if inicio is None or inicio.day == 1 else _mes_siguiente(inicio)
+    tras_ultimo = _inicio_mes(fin) if fin else None
+    if primer_mes and tras_ultimo and primer_mes >= tras_ultimo:
+        # El rango no cubre ningún mes completo: todo son días sueltos
+        return False, None, None, [(inicio, fin)]
+
+    sueltos: List[Tuple[date, date]] = []
+    if inicio is not None and inicio != primer_mes:
+        sueltos.append((inicio, primer_mes))
+    if fin is not None and fin != tras_ultimo:
+        sueltos.append((tras_ultimo, fin))
+    return (True,
+            primer_mes.strftime('%Y-%m') if primer_mes else None,
+            tras_ultimo.strftime('%Y-%m') if tras_ultimo else None,
+            sueltos)
+
+
+COLUMNAS_LECTURA = ('mes', 'estado', 'cantidad', 'suma_total', 'suma_total_sin_estado', 'suma_descuentos',
+                    'suma_retencion_irpf', 'minimo_total', 'maximo_total')
+
+
+def _columnas_en_euros() -> str:
+    """Lista de COLUMNAS_LECTURA con los importes pasados de céntimos a euros"""
+    return ', '.join(f"{columna} / 100.0 as {columna}" if columna in COLUMNAS_IMPORTE else columna
+                     for columna in COLUMNAS_LECTURA)
+
+
+def _consulta_grupos(tipo: str, fecha_inicio: Optional[str], fecha_fin: Optional[str]) -> Tuple[str, List[Any]]:
+    """SELECT compuesto con una fila por (mes, estado) del rango y sus parámetros.
+
+    Los importes salen en céntimos.
+
+    Los meses completos salen de la tabla de resumen; los días sueltos de los
+    extremos se agregan al vuelo sobre la tabla de documentos con su índice
+    de fecha. Todo va en una única consulta (UNION ALL).
+    """
+    tabla, estado, _ = TIPOS[tipo]
+    usar_resumen, primer_mes, tras_ultimo, sueltos = _tramos(fecha_inicio, fecha_fin)
+
+    partes: List[str] = []
+    params: List[Any] = []
+    if usar_resumen:
+        clausulas = ["tipo = ?"]
+        params.append(tipo)
+        if primer_mes:
+            clausulas.append("mes >= ?")
+            params.append(primer_mes)
+        if tras_ultimo:
+            clausulas.append("mes < ?")
+            params.append(tras_ultimo)
+        partes.append(f"""
+            SELECT {', '.join(COLUMNAS_LECTURA)} FROM {TABLA_RESUMEN}
+            WHERE {' AND '.join(clausulas)}
+        """)
+
+    for inicio, fin in sueltos:
+        clausulas = ["fecha_creacion IS NOT NULL"]
+        if inicio:
+            clausulas.append("fecha_creacion >= ?")
+            params.append(inicio.isoformat())
+        if fin:
+            clausulas.append("fecha_creacion < ?")
+            params.append(fin.isoformat())
+        partes.append(f"""
+            SELECT strftime('%Y-%m', fecha_creacion) as mes, {estado.format(p='')} as estado,
+                   {_agregados(tipo)}
+            FROM {tabla}
+            WHERE {' AND '.join(clausulas)}
+            GROUP BY 1, 2
+        """)
+
+    return " UNION ALL ".join(partes), params
+
+
+def leer_resumen(db_manager, tipo: str, fecha_inicio: Optional[str] = None,
+                 fecha_fin: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Filas (mes, estado, cantidad, sumas, mínimo, máximo) del rango, ordenadas por mes.
+
+    fecha_inicio y fecha_fin son inclusivas ('AAAA-MM-DD').
+    """
+    grupos, params = _consulta_grupos(tipo, fecha_inicio, fecha_fin)
+    return db_manager.execute_query(f"""
+        WITH grupos AS ({grupos})
+        SELECT {_columnas_en_euros()} FROM grupos
+        ORDER BY mes, estado
+    """, tuple(params))
+
+
+def estadisticas_resumen(db_manager, tipo: str, fecha_inicio: Optional[str] = None,
+                         fecha_fin: Optional[str] = None) -> Dict[str, Any]:
+    """Todas las cifras de las métricas de un tipo de documento en una sola consulta.
+
+    Devuelve los totales del rango (cantidad, sumas, mínimo y máximo), los
+    totales por estado en 'por_estado' y las filas (mes, estado) en 'mensual'.
+    Los totales se calculan con funciones de ventana sobre los grupos.
+    """
+    grupos, params = _consulta_grupos(tipo, fecha_inicio, fecha_fin)
+    filas = db_manager.execute_query(f"""
+        WITH grupos AS ({grupos})
+        SELECT {_columnas_en_euros()},
+               SUM(cantidad) OVER () as cantidad_rango,
+               SUM(suma_total) OVER () / 100.0 as suma_total_rango,
+               SUM(suma_descuentos) OVER () / 100.0 as suma_descuentos_rango,
+               SUM(suma_retencion_irpf) OVER () / 100.0 as suma_retencion_irpf_rango,
+               MIN(minimo_total) OVER () / 100.0 as minimo_total_rango,
+               MAX(maximo_total) OVER () / 100.0 as maximo_total_rango,
+               SUM(cantidad) OVER (PARTITION BY estado) as cantidad_estado,
+               SUM(suma_total) OVER (PARTITION BY estado) / 100.0 as suma_total_estado,
+               SUM(suma_total_sin_estado) OVER (PARTITION BY estado) / 100.0 as suma_total_sin_estado_estado
+        FROM grupos
+        ORDER BY mes, estado
+    """, tuple(params))
+
+    primera = filas[0] if filas else {}
+    return {
+        'cantidad': primera.get('cantidad_rango') or 0,
+        'suma_total': primera.get('suma_total_rango') or 0,
+        'suma_descuentos': primera.get('suma_descuentos_rango') or 0,
+        'suma_retencion_irpf': primera.get('suma_retencion_irpf_rango') or 0,
+        'minimo_total': primera.get('minimo_total_rango') or 0,
+        'maximo_total': primera.get('maximo_total_rango') or 0,
+        'por_estado': {
+            fila['estado']: {'cantidad': fila['cantidad_estado'], 'suma_total': fila['suma_total_estado'],
+                             'suma_total_sin_estado': fila['suma_total_sin_estado_estado']}
+            for fila in filas
+        },
+        'mensual': [{columna: fila[columna] for columna in COLUMNAS_LECTURA} for fila in filas],
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Reconstruye el resumen mensual de la base de datos indicada (o la de la aplicación)"""
+    from .utils import DatabaseManager, db
+
+    argv = sys.argv[1:] if argv is None else argv
+    db_manager = DatabaseManager(argv[0]) if argv else db
+    try:
+        reconstruir_resumen_mensual(db_manager)
+    except Exception as e:
+        print(f"Error reconstruyendo el resumen mensual: {e}")
+        return 1
+    total = db_manager.execute_query(f"SELECT COUNT(*) as total FROM {TABLA_RESUMEN}")
+    print(f"Resumen mensual reconstruido en {db_manager.db_path}: {total[0]['total']} grupos")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
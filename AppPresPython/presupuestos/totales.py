@@ -0,0 +1,320 @@
+"""
+Motor de totales compartido por presupuestos y facturas.
+
+Los items se pasan a columnas (array('q') de céntimos) y las operaciones por
+línea se hacen columna a columna; después se agregan por documento. La API
+por lotes procesa miles de documentos en una única pasada sobre las columnas.
+Cada línea se redondea al céntimo una vez y los agregados se suman en enteros,
+así que los totales son deterministas.
+"""
+from array import array
+from typing import List, Dict, Any, Optional, Iterable
+
+from .dinero import (a_centimos, a_euros, importe_linea_centimos, porcentaje_centimos,
+                     prorratear_centimos)
+
+IVA_GENERAL = 21.0
+
+
+class LineasColumnares:
+    """Columnas de importes por línea (en céntimos) de un conjunto de items"""
+
+    __slots__ = ('documento', 'neto', 'descuento', 'iva_porcentaje', 'aplica_iva')
+
+    def __init__(self):
+        self.documento = array('l')
+        self.neto = array('q')
+        self.descuento = array('q')
+        self.iva_porcentaje = array('d')
+        self.aplica_iva = array('b')
+
+    def __len__(self) -> int:
+        return len(self.neto)
+
+
+def _descuento_linea(bruto: int, porcentaje: float, fijo: int) -> int:
+    """Descuento de una línea en céntimos (el porcentaje tiene prioridad sobre el fijo)"""
+    if porcentaje > 0:
+        return porcentaje_centimos(bruto, porcentaje)
+    if fijo > 0:
+        return min(fijo, bruto)
+    return 0
+
+
+def _columnas(items: Iterable[Dict[str, Any]], iva_porcentaje: float, documento: int,
+              destino: Optional[LineasColumnares] = None) -> LineasColumnares:
+    """Extrae las columnas de entrada y calcula neto y descuento por línea"""
+    lineas = destino if destino is not None else LineasColumnares()
+    items = list(items)
+    if not items:
+        return lineas
+
+    bruto = array('q', [
+        importe_linea_centimos(item.get('cantidad', 0) or 0, item.get('precio_unitario', 0.0) or 0.0)
+        for item in items
+    ])
+    desc_pct = array('d', [float(item.get('descuento_porcentaje', 0) or 0) for item in items])
+    desc_fijo = array('q', [a_centimos(item.get('descuento_fijo', 0) or 0) for item in items])
+
+    descuento = array('q', map(_descuento_linea, bruto, desc_pct, desc_fijo))
+
+    lineas.documento.extend([documento] * len(items))
+    lineas.neto.extend(map(int.__sub__, bruto, descuento))
+    lineas.descuento.extend(descuento)
+    lineas.iva_porcentaje.extend([float(item.get('iva_porcentaje', iva_porcentaje)) for item in items])
+    lineas.aplica_iva.extend([1 if item.get('aplica_iva', True) else 0 for item in items])
+    return lineas
+
+
+def calcular_lineas(items: List[Dict[str, Any]], iva_porcentaje: float = IVA_GENERAL,
+                    iva_habilitado: bool = True) -> List[Dict[str, float]]:
+    """Devuelve neto, descuento y cuota de IVA de cada línea, redondeados al céntimo"""
+    lineas = _columnas(items, iva_porcentaje, 0)
+    return [
+        {
+            'neto': a_euros(neto),
+            'descuento': a_euros(descuento),
+            'iva_porcentaje': pct,
+            'cuota_iva': a_euros(porcentaje_centimos(neto, pct)) if aplica and iva_habilitado and pct > 0 else 0.0
+        }
+        for neto, descuento, pct, aplica in zip(lineas.neto, lineas.descuento,
+                                               lineas.iva_porcentaje, lineas.aplica_iva)
+    ]
+
+
+def _agregados_vacios() -> Dict[str, Any]:
+    """Agregados (en céntimos) de un documento sin líneas"""
+    return {
+        'lineas': 0,
+        'lineas_con_iva': 0,
+        'subtotal': 0,
+        'descuentos_items': 0,
+        'bases_por_tipo': {},
+        'base_sin_iva': 0,
+    }
+
+
+def _agregar(lineas: LineasColumnares, num_documentos: int) -> List[Dict[str, Any]]:
+    """Suma las columnas por documento (subtotal, descuentos y bases por tipo)"""
+    agregados = [_agregados_vacios() for _ in range(num_documentos)]
+    for doc, neto, descuento, pct, aplica in zip(lineas.documento, lineas.neto, lineas.descuento,
+                                                 lineas.iva_porcentaje, lineas.aplica_iva):
+        agregado = agregados[doc]
+        agregado['lineas'] += 1
+        agregado['subtotal'] += neto
+        agregado['descuentos_items'] += descuento
+        if aplica:
+            agregado['lineas_con_iva'] += 1
+        if aplica and pct > 0:
+            bases = agregado['bases_por_tipo']
+            bases[pct] = bases.get(pct, 0) + neto
+        else:
+            agregado['base_sin_iva'] += neto
+    return agregados
+
+
+def cerrar_totales(agregado: Dict[str, Any], descuento_global_porcentaje: float = 0,
+                   descuento_global_fijo: float = 0, descuento_antes_iva: bool = True,
+                   iva_habilitado: bool = True, retencion_irpf: Optional[float] = None,
+                   iva_porcentaje: float = IVA_GENERAL,
+                   descuento_sobre_total: bool = False) -> Dict[str, Any]:
+    """Aplica descuento global, IVA e IRPF sobre los agregados de un documento.
+
+    Con descuento_sobre_total=True y descuento_antes_iva=False el descuento
+    global se calcula sobre subtotal + IVA (regla de los presupuestos); en
+    caso contrario se calcula sobre el subtotal (regla de las facturas).
+    """
+    subtotal = agregado['subtotal']
+
+    # Si no hay items con IVA habilitado, forzar iva_habilitado a False
+    if agregado['lineas'] and not agregado['lineas_con_iva']:
+        iva_habilitado = False
+
+    if iva_habilitado:
+        bases_raw = agregado['bases_por_tipo']
+        base_exenta_raw = agregado['base_sin_iva']
+    else:
+        bases_raw = {}
+        base_exenta_raw = agregado['base_sin_iva'] + sum(agregado['bases_por_tipo'].values())
+
+    def _descuento(importe: int) -> int:
+        if descuento_global_porcentaje > 0:
+            return porcentaje_centimos(importe, descuento_global_porcentaje)
+        if descuento_global_fijo > 0:
+            return min(a_centimos(descuento_global_fijo), importe)
+        return 0
+
+    if descuento_antes_iva:
+        descuento_global = _descuento(subtotal)
+        base_imponible = subtotal - descuento_global
+        # Las bases se prorratean con el mismo factor que el subtotal
+        prorrateo = (base_imponible, subtotal) if subtotal > 0 else (0, 1)
+    else:
+        prorrateo = (1, 1)
+
+    iva_breakdown: Dict[float, Dict[str, float]] = {}
+    iva = 0
+    for porcentaje, base in bases_raw.items():
+        base_ajustada = prorratear_centimos(base, *prorrateo)
+        cuota = porcentaje_centimos(base_ajustada, porcentaje)
+        iva += cuota
+        iva_breakdown[porcentaje] = {'base': a_euros(base_ajustada), 'cuota': a_euros(cuota)}
+    base_exenta = prorratear_centimos(base_exenta_raw, *prorrateo)
+
+    if not descuento_antes_iva:
+        if descuento_sobre_total:
+            descuento_global = _descuento(subtotal + iva)
+            base_imponible = subtotal
+        else:
+            descuento_global = _descuento(subtotal)
+            base_imponible = subtotal - descuento_global
+
+    # Retención IRPF sobre la base imponible (antes de IVA según AEAT)
+    retencion_irpf_importe = 0
+    if retencion_irpf is not None and retencion_irpf > 0:
+        retencion_irpf_importe = porcentaje_centimos(base_imponible, retencion_irpf)
+
+    if not descuento_antes_iva and descuento_sobre_total:
+        total = subtotal + iva - descuento_global - retencion_irpf_importe
+    else:
+        total = base_imponible + iva - retencion_irpf_importe
+
+    return {
+        'subtotal': a_euros(subtotal),
+        'descuentos_items': a_euros(agregado['descuentos_items']),
+        'descuento_global': a_euros(descuento_global),
+        'base_imponible': a_euros(base_imponible),
+        'iva': a_euros(iva),
+        'retencion_irpf': a_euros(retencion_irpf_importe),
+        'retencion_irpf_porcentaje': retencion_irpf if retencion_irpf else 0,
+        'total': a_euros(total),
+        'iva_porcentaje': iva_porcentaje,
+        'descuento_antes_iva': descuento_antes_iva,
+        'iva_breakdown': iva_breakdown,
+        'base_exenta': a_euros(base_exenta)
+    }
+
+
+def calcular_totales(items: List[Dict[str, Any]], descuento_global_porcentaje: float = 0,
+                     descuento_global_fijo: float = 0, descuento_antes_iva: bool = True,
+                     iva_habilitado: bool = True, retencion_irpf: Optional[float] = None,
+                     iva_porcentaje: float = IVA_GENERAL,
+                     descuento_sobre_total: bool = False) -> Dict[str, Any]:
+    """Calcula los totales completos de un documento"""
+    agregado = _agregar(_columnas(items, iva_porcentaje, 0), 1)[0]
+    return cerrar_totales(agregado, descuento_global_porcentaje, descuento_global_fijo,
+                          descuento_antes_iva, iva_habilitado, retencion_irpf,
+                          iva_porcentaje, descuento_sobre_total)
+
+
+def calcular_totales_lote(documentos: List[Dict[str, Any]], iva_porcentaje: float = IVA_GENERAL,
+                          descuento_sobre_total: bool = False) -> List[Dict[str, Any]]:
+    """Calcula los totales de muchos documentos en una sola pasada columnar.
+
+    Cada documento es un dict con 'items' y, opcionalmente, las mismas claves
+    que las cabeceras de la base de datos: descuento_global_porcentaje,
+    descuento_global_fijo, descuento_antes_iva, iva_habilitado y retencion_irpf.
+    """
+    lineas = LineasColumnares()
+    for indice, documento in enumerate(documentos):
+        _columnas(documento.get('items') or [], iva_porcentaje, indice, lineas)
+    agregados = _agregar(lineas, len(documentos))
+
+    return [
+        cerrar_totales(
+            agregado,
+            documento.get('descuento_global_porcentaje') or 0,
+            documento.get('descuento_global_fijo') or 0,
+            bool(documento.get('descuento_antes_iva', True)),
+            bool(documento.get('iva_habilitado', True)),
+            documento.get('retencion_irpf'),
+            iva_porcentaje,
+            descuento_sobre_total
+        )
+        for documento, agregado in zip(documentos, agregados)
+    ]
+
+
+class AcumuladorTotales:
+    """Agregados de un documento en edición, actualizados línea a línea.
+
+    Guarda la aportación de cada línea, indexada por la identidad del item
+    (como las filas de SincronizadorFilas), para poder restarla al editarla o
+    eliminarla: cada cambio cuesta O(1) y los totales se obtienen con
+    cerrar_totales() sin recorrer los items.
+    """
+
+    def __init__(self, iva_porcentaje: float = IVA_GENERAL, descuento_sobre_total: bool = False):
+        self.iva_porcentaje = iva_porcentaje
+        self.descuento_sobre_total = descuento_sobre_total
+        self.reiniciar()
+
+    def __len__(self) -> int:
+        return len(self._aportaciones)
+
+    @property
+    def lineas_con_iva(self) -> int:
+        return self._agregado['lineas_con_iva']
+
+    def _aportacion(self, item: Dict[str, Any]) -> tuple:
+        """Neto, descuento, tipo de IVA y aplica_iva de una línea"""
+        bruto = importe_linea_centimos(item.get('cantidad', 0) or 0, item.get('precio_unitario', 0.0) or 0.0)
+        descuento = _descuento_linea(bruto, float(item.get('descuento_porcentaje', 0) or 0),
+                                     a_centimos(item.get('descuento_fijo', 0) or 0))
+        return (bruto - descuento, descuento, float(item.get('iva_porcentaje', self.iva_porcentaje)),
+                bool(item.get('aplica_iva', True)))
+
+    def _aplicar(self, aportacion: tuple, signo: int):
+        neto, descuento, pct, aplica = aportacion
+        agregado = self._agregado
+        agregado['lineas'] += signo
+        agregado['subtotal'] += signo * neto
+        agregado['descuentos_items'] += signo * descuento
+        if aplica:
+            agregado['lineas_con_iva'] += signo
+        if aplica and pct > 0:
+            bases = agregado['bases_por_tipo']
+            self._lineas_por_tipo[pct] = self._lineas_por_tipo.get(pct, 0) + signo
+            if self._lineas_por_tipo[pct]:
+                bases[pct] = bases.get(pct, 0) + signo * neto
+            else:
+                # Sin líneas de ese tipo: que no aparezca en el desglose
+                del self._lineas_por_tipo[pct]
+                bases.pop(pct, None)
+        else:
+            agregado['base_sin_iva'] += signo * neto
+
+    def reiniciar(self, items: Optional[Iterable[Dict[str, Any]]] = None):
+        """Vacía el acumulador y, opcionalmente, lo carga con una lista de items"""
+        self._agregado = _agregados_vacios()
+        self._lineas_por_tipo: Dict[float, int] = {}
+        # id(item) -> (item, aportación); la referencia al item evita que su id se reutilice
+        self._aportaciones: Dict[int, tuple] = {}
+        for item in items or []:
+            self.agregar(item)
+
+    def agregar(self, item: Dict[str, Any]):
+        """Añade una línea (si ya estaba, recalcula su aportación)"""
+        anterior = self._aportaciones.get(id(item))
+        if anterior is not None:
+            self._aplicar(anterior[1], -1)
+        aportacion = self._aportacion(item)
+        self._aportaciones[id(item)] = (item, aportacion)
+        self._aplicar(aportacion, 1)
+
+    def eliminar(self, item: Dict[str, Any]):
+        """Quita la línea de ese item"""
+        _, aportacion = self._aportaciones.pop(id(item))
+        self._aplicar(aportacion, -1)
+
+    def reemplazar(self, item: Dict[str, Any]):
+        """Recalcula la línea de ese item tras editarlo"""
+        self.agregar(item)
+
+    def totales(self, descuento_global_porcentaje: float = 0, descuento_global_fijo: float = 0,
+                descuento_antes_iva: bool = True, iva_habilitado: bool = True,
+                retencion_irpf: Optional[float] = None) -> Dict[str, Any]:
+        """Totales completos del documento con los agregados actuales"""
+        return cerrar_totales(self._agregado, descuento_global_porcentaje, descuento_global_fijo,
+                              descuento_antes_iva, iva_habilitado, retencion_irpf,
+                              self.iva_porcentaje, self.descuento_sobre_total)
@@ -1,325 +1,596 @@
 import sqlite3
 import os
-from typing import List, Dict, Any
+import json
+import copy
+import base64
+import atexit
+import threading
+import inspect
+from collections import namedtuple, OrderedDict
+from functools import wraps
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterator, Hashable
+
+from .migraciones import aplicar_migraciones
+from .busqueda import TABLAS_FTS
+
+CONFIG_FILE = "config/config.json"
+
+# Perfiles de almacenamiento ("perfil_almacenamiento" en config/config.json)
+PERFILES_ALMACENAMIENTO = {
+    # Journal clásico y fsync completo: el más conservador, válido en carpetas de red
+    'safe': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'cache_size': -8000,
+        'temp_store': 'DEFAULT',
+        'mmap_size': 0,
+    },
+    # WAL: lecturas concurrentes mientras se escribe y commits mucho más rápidos
+    'fast': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -32000,
+        'temp_store': 'MEMORY',
+        'mmap_size': 268435456,
+    },
+    # Importaciones masivas: no espera al disco en cada commit
+    'bulk-import': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'cache_size': -128000,
+        'temp_store': 'MEMORY',
+        'mmap_size': 268435456,
+    },
+}
+PERFIL_POR_DEFECTO = 'safe'
+
+
+def cargar_perfil_almacenamiento(config_file: str = CONFIG_FILE) -> str:
+    """Lee el perfil de almacenamiento de la configuración general"""
+    perfil = PERFIL_POR_DEFECTO
+    try:
+        if os.path.exists(config_file):
+            with open(config_file, 'r', encoding='utf-8') as f:
+                perfil = json.load(f).get('perfil_almacenamiento', PERFIL_POR_DEFECTO)
+    except (OSError, ValueError) as e:
+        print(f"Error leyendo el perfil de almacenamiento: {e}")
+    if perfil not in PERFILES_ALMACENAMIENTO:
+        raise ValueError(f"Perfil de almacenamiento desconocido: {perfil}")
+    return perfil
+
+
+def _siguiente_dia(fecha: str) -> Optional[str]:
+    try:
+        dia = datetime.strptime(fecha[:10], "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+    return (dia + timedelta(days=1)).isoformat()
+
+
+def filtro_rango_fechas(columna: str, anio: Optional[int] = None, mes: Optional[int] = None,
+                        fecha_inicio: Optional[str] = None,
+                        fecha_fin: Optional[str] = None) -> Tuple[List[str], List[Any]]:
+    """Construye predicados de fecha sargables sobre una columna TIMESTAMP/DATE.
+    
+    Convierte año/mes y fecha_inicio/fecha_fin (ambas inclusivas, 'YYYY-MM-DD') en
+    rangos semiabiertos ``columna >= ? AND columna < ?`` sobre el valor sin funciones,
+    de modo que SQLite puede usar el índice de la columna. Devuelve
+    (cláusulas WHERE, parámetros) para añadir a las de la consulta.
+    """
+    clausulas: List[str] = []
+    params: List[Any] = []
+    
+    if anio is not None:
+        anio = int(anio)
+        if mes is not None:
+            mes = int(mes)
+            inicio = date(anio, mes, 1)
+            fin = date(anio + 1, 1, 1) if mes == 12 else date(anio, mes + 1, 1)
+        else:
+            inicio = date(anio, 1, 1)
+            fin = date(anio + 1, 1, 1)
+        clausulas.append(f"{columna} >= ? AND {columna} < ?")
+        params.extend([inicio.isoformat(), fin.isoformat()])
+    elif mes is not None:
+        # Un mes de cualquier año no es un rango contiguo: no hay forma sargable
+        clausulas.append(f"strftime('%m', {columna}) = ?")
+        params.append(f"{int(mes):02d}")
+    
+    if fecha_inicio:
+        clausulas.append(f"{columna} >= ?")
+        params.append(fecha_inicio[:10])
+    
+    if fecha_fin:
+        dia_siguiente = _siguiente_dia(fecha_fin)
+        if dia_siguiente:
+            clausulas.append(f"{columna} < ?")
+            params.append(dia_siguiente)
+        else:
+            clausulas.append(f"DATE({columna}) <= DATE(?)")
+            params.append(fecha_fin)
+    
+    return clausulas, params
+
+
+# Máximo de parámetros por cláusula IN (SQLite antiguo limita a 999 variables)
+TAMANO_BLOQUE_IN = 500
+
+
+def dividir_en_bloques(valores: List[Any], tamano: int = TAMANO_BLOQUE_IN) -> List[List[Any]]:
+    """Divide una lista de valores en bloques aptos para una cláusula IN (?, ?, ...)"""
+    valores = list(valores)
+    return [valores[i:i + tamano] for i in range(0, len(valores), tamano)]
+
+
+def clausula_limite(limite: Optional[int] = None, desplazamiento: int = 0) -> Tuple[str, List[Any]]:
+    """Construye 'LIMIT ? OFFSET ?' para listados paginados (vacío si no hay límite)"""
+    if limite is None:
+        return "", []
+    return "LIMIT ? OFFSET ?", [int(limite), max(0, int(desplazamiento or 0))]
+
+
+# Modos de resultado de execute_query
+ROW_DICT = 'dict'      # un dict por fila (por defecto)
+ROW_TUPLE = 'tuple'    # tuplas simples, en el orden de las columnas del SELECT
+ROW_RECORD = 'record'  # registros compactos de solo lectura con acceso por nombre
+
+
+class _RegistroBase(tuple):
+    """Fila de solo lectura respaldada por una tupla (sin dict por instancia).
+    
+    Admite ``fila['columna']`` y ``fila.get('columna')`` igual que un dict,
+    para que el código de listados funcione con cualquiera de los dos.
+    """
+    __slots__ = ()
+    
+    def __getitem__(self, clave):
+        if isinstance(clave, str):
+            try:
+                return getattr(self, clave)
+            except AttributeError:
+                raise KeyError(clave) from None
+        return tuple.__getitem__(self, clave)
+    
+    def get(self, clave, default=None):
+        return getattr(self, clave, default)
+    
+    def keys(self):
+        return self._fields
+    
+    def __contains__(self, clave):
+        return clave in self._fields
+    
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(zip(self._fields, self))
+
+
+_clases_registro: Dict[Tuple[str, ...], Any] = {}
+
+
+def _clase_registro(columnas: Tuple[str, ...]):
+    """Devuelve (y cachea) la clase de registro para un conjunto de columnas, o None si no es posible"""
+    if columnas not in _clases_registro:
+        try:
+            base = namedtuple('Registro', columnas)
+        except ValueError:
+            # Nombres de columna repetidos o que no son identificadores válidos
+            _clases_registro[columnas] = None
+        else:
+            _clases_registro[columnas] = type('Registro', (_RegistroBase, base), {'__slots__': ()})
+    return _clases_registro[columnas]
+
+
+# Paginación por clave (keyset): el cursor codifica los valores de orden de la fila frontera
+PAGINA_SIGUIENTE = 'siguiente'
+PAGINA_ANTERIOR = 'anterior'
+TAMANO_PAGINA = 50
+
+
+def codificar_cursor(valores: List[Any]) -> str:
+    """Codifica los valores de orden de una fila como token opaco"""
+    datos = json.dumps(list(valores), separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(datos).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(cursor: str) -> List[Any]:
+    """Recupera los valores de orden de un token de cursor"""
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno).decode('utf-8'))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Cursor de paginación no válido: {cursor!r}") from e
+    if not isinstance(valores, list) or not all(
+            valor is None or isinstance(valor, (str, int, float)) for valor in valores):
+        raise ValueError(f"Cursor de paginación no válido: {cursor!r}")
+    return valores
+
+
+def paginar_por_clave(db_manager: 'DatabaseManager', consulta_base: str, where_clauses: List[str],
+                      params: List[Any], columnas_orden: List[str], cursor: Optional[str] = None,
+                      tamano: int = TAMANO_PAGINA, direccion: str = PAGINA_SIGUIENTE,
+                      descendente: bool = False, row_mode: str = ROW_DICT) -> Dict[str, Any]:
+    """Obtiene una página de consulta_base ordenada por columnas_orden usando un cursor keyset.
+
+    Devuelve {'filas', 'siguiente', 'anterior'}; los tokens son None cuando no
+    hay más filas en ese sentido. Las columnas de orden deben aparecer en el
+    resultado con el nombre que queda tras el alias (p. ej. 'f.id' -> 'id'),
+    así que row_mode debe ser ROW_DICT o ROW_RECORD.
+    """
+    if direccion not in (PAGINA_SIGUIENTE, PAGINA_ANTERIOR):
+        raise ValueError(f"Dirección de paginación no válida: {direccion!r}")
+    tamano = max(1, int(tamano))
+    hacia_atras = direccion == PAGINA_ANTERIOR
+
+    clausulas = list(where_clauses)
+    valores = list(params)
+    # Al retroceder se recorre el orden inverso y después se da la vuelta a la página
+    orden_desc = descendente != hacia_atras
+    if cursor:
+        frontera = decodificar_cursor(cursor)
+        if len(frontera) != len(columnas_orden):
+            raise ValueError(f"Cursor de paginación no válido: {cursor!r}")
+        operador = '<' if orden_desc else '>'
+        marcadores = ", ".join("?" * len(columnas_orden))
+        clausulas.append(f"({', '.join(columnas_orden)}) {operador} ({marcadores})")
+        valores.extend(frontera)
+
+    where_sql = f"WHERE {' AND '.join(clausulas)}" if clausulas else ""
+    sentido = 'DESC' if orden_desc else 'ASC'
+    order_sql = ", ".join(f"{columna} {sentido}" for columna in columnas_orden)
+    query = f"{consulta_base} {where_sql} ORDER BY {order_sql} LIMIT ?"
+
+    filas = db_manager.execute_query(query, tuple(valores + [tamano + 1]), row_mode=row_mode)
+    hay_mas = len(filas) > tamano
+    filas = filas[:tamano]
+    if hacia_atras:
+        filas.reverse()
+
+    nombres = [columna.split('.')[-1] for columna in columnas_orden]
+
+    def _token(fila) -> str:
+        return codificar_cursor([fila[nombre] for nombre in nombres])
+
+    if not filas:
+        return {'filas': filas, 'siguiente': None, 'anterior': None}
+    if hacia_atras:
+        anterior = _token(filas[0]) if hay_mas else None
+        siguiente = _token(filas[-1])
+    else:
+        siguiente = _token(filas[-1]) if hay_mas else None
+        anterior = _token(filas[0]) if cursor else None
+    return {'filas': filas, 'siguiente': siguiente, 'anterior': anterior}
+
+
+def recorrer_paginas(obtener_pagina: Callable[..., Dict[str, Any]], tamano: int = TAMANO_PAGINA,
+                     **filtros) -> Iterator[Any]:
+    """Recorre todas las filas de un listado paginado, una página en memoria cada vez"""
+    cursor = None
+    while True:
+        pagina = obtener_pagina(cursor=cursor, tamano=tamano, **filtros)
+        yield from pagina['filas']
+        cursor = pagina['siguiente']
+        if not cursor:
+            return
+
+
+class CacheEnMemoria:
+    """Valor cargado bajo demanda y descartado al invalidarlo (seguro entre hilos)"""
+    
+    def __init__(self, cargar: Callable[[], Any]):
+        self._cargar = cargar
+        self._valor: Any = None
+        self._version = 0
+        self._lock = threading.Lock()
+    
+    def obtener(self) -> Any:
+        """Devuelve el valor en memoria, cargándolo si no lo está"""
+        valor = self._valor
+        if valor is not None:
+            return valor
+        with self._lock:
+            version = self._version
+        valor = self._cargar()
+        with self._lock:
+            # Si hubo un cambio mientras se cargaba, esta copia ya no vale para guardarla
+            if version == self._version:
+                self._valor = valor
+        return valor
+    
+    def invalidar(self):
+        """Descarta el valor; la siguiente lectura lo vuelve a cargar"""
+        with self._lock:
+            self._version += 1
+            self._valor = None
+
+
+class CacheMetricas:
+    """Resultados de métricas por clave (métrica, argumentos), válidos mientras no haya escrituras.
+    
+    Cada entrada guarda la generación de la base de datos con la que se calculó;
+    cualquier escritura confirmada incrementa la generación y deja obsoletas todas
+    las entradas. Cada llamada recibe su propia copia del valor guardado, de modo
+    que modificar el resultado no afecta a las siguientes lecturas.
+    """
+    
+    MAXIMO_ENTRADAS = 128
+    
+    def __init__(self, db_manager: 'DatabaseManager'):
+        self.db = db_manager
+        self._entradas: "OrderedDict[Hashable, Tuple[int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def obtener(self, clave: Hashable, calcular: Callable[[], Any]) -> Any:
+        """Devuelve el resultado guardado para clave o lo calcula con calcular()"""
+        # La generación se lee antes de calcular: si hay una escritura mientras
+        # tanto, el resultado queda anotado con la generación antigua y no se reutiliza.
+        # Abrir antes la conexión aplica las migraciones pendientes, que también cuentan
+        # como escritura y dejarían obsoleto el primer resultado
+        self.db.get_connection()
+        generacion = self.db.generacion
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[0] == generacion:
+                self._entradas.move_to_end(clave)
+                return copy.deepcopy(entrada[1])
+        valor = calcular()
+        with self._lock:
+            self._entradas[clave] = (generacion, valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.MAXIMO_ENTRADAS:
+                self._entradas.popitem(last=False)
+        return copy.deepcopy(valor)
+    
+    def limpiar(self):
+        """Descarta todos los resultados guardados"""
+        with self._lock:
+            self._entradas.clear()
+
+
+def metrica_en_cache(nombre: str, por_dia: bool = False):
+    """Decorador para métodos de los managers que guarda su resultado en db.metricas.
+    
+    La clave es (nombre, argumentos con sus valores por defecto). Con por_dia=True
+    incluye además la fecha de hoy, para métricas relativas al día actual.
+    """
+    def decorador(metodo):
+        firma = inspect.signature(metodo)
+        
+        @wraps(metodo)
+        def envoltorio(self, *args, **kwargs):
+            argumentos = firma.bind(self, *args, **kwargs)
+            argumentos.apply_defaults()
+            clave = (nombre,) + tuple(argumentos.arguments.values())[1:]
+            if por_dia:
+                clave += (date.today().isoformat(),)
+            return self.db.metricas.obtener(clave, lambda: metodo(self, *args, **kwargs))
+        return envoltorio
+    return decorador
+
 
 class DatabaseManager:
-    def __init__(self, db_path: str = "presupuestos.db"):
+    # Pragmas que se aplican una sola vez al abrir cada conexión
+    PRAGMAS_CONEXION = {
+        'busy_timeout': 5000,
+    }
+    
+    def __init__(self, db_path: str = "presupuestos.db", perfil_almacenamiento: Optional[str] = None):
+        # No se toca el disco aquí: la configuración se lee y las migraciones se
+        # aplican al abrir la primera conexión
         self.db_path = db_path
-        self.init_database()
+        self.perfil_almacenamiento = perfil_almacenamiento
+        # Una conexión persistente por hilo (sqlite3 no comparte conexiones entre hilos de forma segura)
+        self._local = threading.local()
+        self._conexiones: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._init_lock = threading.Lock()
+        self._inicializada = False
+        self._busqueda_fts: Optional[bool] = None
+        # Se incrementa con cada escritura confirmada; invalida la caché de métricas
+        self._generacion = 0
+        self.metricas = CacheMetricas(self)
+        atexit.register(self.close_all)
     
     def init_database(self):
-        """Inicializa la base de datos con las tablas necesarias"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Tabla de clientes
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS clientes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nombre TEXT NOT NULL,
-                telefono TEXT,
-                email TEXT,
-                direccion TEXT,
-                dni TEXT,
-                fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Tabla de materiales
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS materiales (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nombre TEXT NOT NULL,
-                unidad_medida TEXT NOT NULL,
-                precio_unitario REAL NOT NULL,
-                fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Tabla de presupuestos
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS presupuestos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                cliente_id INTEGER NOT NULL,
-                fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                subtotal REAL NOT NULL,
-                iva REAL NOT NULL,
-                total REAL NOT NULL,
-                iva_habilitado INTEGER DEFAULT 1,
-                estado TEXT DEFAULT 'Pendiente',
-                descuento_global_porcentaje REAL DEFAULT 0,
-                descuento_global_fijo REAL DEFAULT 0,
-                descuento_antes_iva INTEGER DEFAULT 1,
-                FOREIGN KEY (cliente_id) REFERENCES clientes (id)
-            )
-        ''')
-        
-        # Tabla de items de presupuesto
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS presupuesto_items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                presupuesto_id INTEGER NOT NULL,
-                material_id INTEGER,
-                tarea_manual TEXT,
-                cantidad REAL NOT NULL,
-                precio_unitario REAL NOT NULL,
-                subtotal REAL NOT NULL,
-                visible_pdf INTEGER DEFAULT 1,
-                es_tarea_manual INTEGER DEFAULT 0,
-                aplica_iva INTEGER DEFAULT 1,
-                descuento_porcentaje REAL DEFAULT 0,
-                descuento_fijo REAL DEFAULT 0,
-                FOREIGN KEY (presupuesto_id) REFERENCES presupuestos (id),
-                FOREIGN KEY (material_id) REFERENCES materiales (id)
-            )
-        ''')
-        
-        # Tabla de facturas
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS facturas (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                numero_factura TEXT UNIQUE NOT NULL,
-                cliente_id INTEGER NOT NULL,
-                presupuesto_id INTEGER,
-                fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                fecha_vencimiento DATE,
-                subtotal REAL NOT NULL,
-                iva REAL NOT NULL,
-                total REAL NOT NULL,
-                iva_habilitado INTEGER DEFAULT 1,
-                metodo_pago TEXT DEFAULT 'Transferencia',
-                estado_pago TEXT DEFAULT 'No Pagada',
-                notas TEXT,
-                descuento_global_porcentaje REAL DEFAULT 0,
-                descuento_global_fijo REAL DEFAULT 0,
-                descuento_antes_iva INTEGER DEFAULT 1,
-                retencion_irpf REAL DEFAULT NULL,
-                FOREIGN KEY (cliente_id) REFERENCES clientes (id),
-                FOREIGN KEY (presupuesto_id) REFERENCES presupuestos (id)
-            )
-        ''')
-        
-        # Tabla de items de factura
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS factura_items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                factura_id INTEGER NOT NULL,
-                material_id INTEGER,
-                tarea_manual TEXT,
-                cantidad REAL NOT NULL,
-                precio_unitario REAL NOT NULL,
-                subtotal REAL NOT NULL,
-                visible_pdf INTEGER DEFAULT 1,
-                es_tarea_manual INTEGER DEFAULT 0,
-                aplica_iva INTEGER DEFAULT 1,
-                descuento_porcentaje REAL DEFAULT 0,
-                descuento_fijo REAL DEFAULT 0,
-                cuota_iva REAL DEFAULT 0,
-                FOREIGN KEY (factura_id) REFERENCES facturas (id),
-                FOREIGN KEY (material_id) REFERENCES materiales (id)
-            )
-        ''')
-        
-        # Actualizar tabla existente si no tiene las nuevas columnas
-        self.update_existing_tables(cursor)
-        
-        conn.commit()
-        conn.close()
+        """Inicializa la base de datos aplicando las migraciones pendientes"""
+        aplicar_migraciones(self)
+    
+    def _ensure_initialized(self):
+        """Aplica las migraciones pendientes la primera vez que se abre la base de datos"""
+        if self._inicializada:
+            return
+        with self._init_lock:
+            if not self._inicializada:
+                self.init_database()
+                self._inicializada = True
     
-    def update_existing_tables(self, cursor):
-        """Actualiza tablas existentes para agregar nuevas columnas"""
+    def _open_connection(self) -> sqlite3.Connection:
+        """Abre una nueva conexión y le aplica los pragmas configurados"""
+        if self.perfil_almacenamiento is None:
+            self.perfil_almacenamiento = cargar_perfil_almacenamiento()
+        # check_same_thread=False solo para poder cerrarla desde close_all();
+        # cada conexión se usa únicamente desde el hilo que la abrió
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        pragmas = dict(self.PRAGMAS_CONEXION)
+        pragmas.update(PERFILES_ALMACENAMIENTO[self.perfil_almacenamiento])
+        for pragma, valor in pragmas.items():
+            try:
+                conn.execute(f"PRAGMA {pragma} = {valor}")
+            except sqlite3.Error as e:
+                print(f"No se pudo aplicar PRAGMA {pragma}: {e}")
+        with self._lock:
+            self._conexiones.append(conn)
+        return conn
+    
+    def get_connection(self) -> sqlite3.Connection:
+        """Obtiene la conexión persistente del hilo actual, abriéndola si hace falta"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open_connection()
+            self._local.conn = conn
+            try:
+                self._ensure_initialized()
+            except Exception:
+                self.close()
+                raise
+        return conn
+    
+    def set_storage_profile(self, perfil: str):
+        """Cambia el perfil de almacenamiento; las conexiones se reabren con los nuevos pragmas"""
+        if perfil not in PERFILES_ALMACENAMIENTO:
+            raise ValueError(f"Perfil de almacenamiento desconocido: {perfil}")
+        self.perfil_almacenamiento = perfil
+        self.close_all()
+    
+    def health_check(self) -> bool:
+        """Comprueba que la conexión del hilo actual responde; si no, la reabre"""
+        try:
+            self.get_connection().execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error as e:
+            print(f"Conexión a la base de datos no válida, reabriendo: {e}")
+            self.close()
         try:
-            # Verificar si la tabla presupuesto_items existe y tiene las columnas necesarias
-            cursor.execute("PRAGMA table_info(presupuesto_items)")
-            columns = [column[1] for column in cursor.fetchall()]
-            
-            # Verificar si material_id permite NULL
-            cursor.execute("PRAGMA table_info(presupuesto_items)")
-            column_info = cursor.fetchall()
-            material_id_nullable = True
-            for col in column_info:
-                if col[1] == 'material_id':
-                    material_id_nullable = col[3] == 0  # 0 = nullable, 1 = not null
-            
-            # Si material_id no permite NULL, necesitamos recrear la tabla
-            if not material_id_nullable or 'tarea_manual' not in columns or 'visible_pdf' not in columns or 'es_tarea_manual' not in columns or 'aplica_iva' not in columns:
-                print("Recreando tabla presupuesto_items para soportar nuevas funcionalidades...")
-                
-                # Crear tabla temporal con la estructura correcta
-                cursor.execute('''
-                    CREATE TABLE presupuesto_items_new (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        presupuesto_id INTEGER NOT NULL,
-                        material_id INTEGER,
-                        tarea_manual TEXT,
-                        cantidad REAL NOT NULL,
-                        precio_unitario REAL NOT NULL,
-                        subtotal REAL NOT NULL,
-                        visible_pdf INTEGER DEFAULT 1,
-                        es_tarea_manual INTEGER DEFAULT 0,
-                        aplica_iva INTEGER DEFAULT 1,
-                        descuento_porcentaje REAL DEFAULT 0,
-                        descuento_fijo REAL DEFAULT 0,
-                        FOREIGN KEY (presupuesto_id) REFERENCES presupuestos (id),
-                        FOREIGN KEY (material_id) REFERENCES materiales (id)
-                    )
-                ''')
-                
-                # Copiar datos existentes
-                cursor.execute('''
-                    INSERT INTO presupuesto_items_new 
-                    (id, presupuesto_id, material_id, cantidad, precio_unitario, subtotal, visible_pdf, es_tarea_manual, aplica_iva, descuento_porcentaje, descuento_fijo)
-                    SELECT id, presupuesto_id, material_id, cantidad, precio_unitario, subtotal, 
-                           COALESCE(visible_pdf, 1), COALESCE(es_tarea_manual, 0), 1, 0, 0
-                    FROM presupuesto_items
-                ''')
-                
-                # Eliminar tabla antigua y renombrar la nueva
-                cursor.execute("DROP TABLE presupuesto_items")
-                cursor.execute("ALTER TABLE presupuesto_items_new RENAME TO presupuesto_items")
-                
-                print("Tabla presupuesto_items actualizada correctamente")
-            
-            # Verificar si la tabla presupuestos tiene la columna iva_habilitado
-            cursor.execute("PRAGMA table_info(presupuestos)")
-            presupuestos_columns = [column[1] for column in cursor.fetchall()]
-            
-            if 'iva_habilitado' not in presupuestos_columns:
-                print("Agregando columna iva_habilitado a la tabla presupuestos...")
-                cursor.execute("ALTER TABLE presupuestos ADD COLUMN iva_habilitado INTEGER DEFAULT 1")
-                print("Columna iva_habilitado agregada correctamente")
-            
-            # Verificar si la tabla clientes tiene la columna dni
-            cursor.execute("PRAGMA table_info(clientes)")
-            clientes_columns = [column[1] for column in cursor.fetchall()]
-            
-            if 'dni' not in clientes_columns:
-                print("Agregando columna dni a la tabla clientes...")
-                cursor.execute("ALTER TABLE clientes ADD COLUMN dni TEXT")
-                print("Columna dni agregada correctamente")
-            
-            # Verificar si la tabla presupuestos tiene la columna estado
-            if 'estado' not in presupuestos_columns:
-                print("Agregando columna estado a la tabla presupuestos...")
-                cursor.execute("ALTER TABLE presupuestos ADD COLUMN estado TEXT DEFAULT 'Pendiente'")
-                print("Columna estado agregada correctamente")
-            
-            # Verificar y agregar nuevas columnas de descuentos a presupuestos
-            if 'descuento_global_porcentaje' not in presupuestos_columns:
-                print("Agregando columnas de descuentos a la tabla presupuestos...")
-                cursor.execute("ALTER TABLE presupuestos ADD COLUMN descuento_global_porcentaje REAL DEFAULT 0")
-                cursor.execute("ALTER TABLE presupuestos ADD COLUMN descuento_global_fijo REAL DEFAULT 0")
-                cursor.execute("ALTER TABLE presupuestos ADD COLUMN descuento_antes_iva INTEGER DEFAULT 1")
-                print("Columnas de descuentos agregadas correctamente")
-            
-            # Verificar si la tabla factura_items existe y tiene las columnas necesarias
-            cursor.execute("PRAGMA table_info(factura_items)")
-            factura_items_columns = [column[1] for column in cursor.fetchall()]
-            
-            if factura_items_columns and ('aplica_iva' not in factura_items_columns or 'descuento_porcentaje' not in factura_items_columns):
-                print("Agregando nuevas columnas a la tabla factura_items...")
-                try:
-                    cursor.execute("ALTER TABLE factura_items ADD COLUMN aplica_iva INTEGER DEFAULT 1")
-                except:
-                    pass  # Columna ya existe
-                try:
-                    cursor.execute("ALTER TABLE factura_items ADD COLUMN descuento_porcentaje REAL DEFAULT 0")
-                except:
-                    pass  # Columna ya existe
-                try:
-                    cursor.execute("ALTER TABLE factura_items ADD COLUMN descuento_fijo REAL DEFAULT 0")
-                except:
-                    pass  # Columna ya existe
-                print("Columnas agregadas a factura_items correctamente")
-            
-            # Agregar columna cuota_iva a factura_items
-            if factura_items_columns and 'cuota_iva' not in factura_items_columns:
-                print("Agregando columna cuota_iva a la tabla factura_items...")
-                try:
-                    cursor.execute("ALTER TABLE factura_items ADD COLUMN cuota_iva REAL DEFAULT 0")
-                except:
-                    pass
-                print("Columna cuota_iva agregada correctamente")
-            
-            # Verificar y agregar nuevas columnas de descuentos a facturas
-            cursor.execute("PRAGMA table_info(facturas)")
-            facturas_columns = [column[1] for column in cursor.fetchall()]
-            
-            if 'descuento_global_porcentaje' not in facturas_columns:
-                print("Agregando columnas de descuentos a la tabla facturas...")
-                try:
-                    cursor.execute("ALTER TABLE facturas ADD COLUMN descuento_global_porcentaje REAL DEFAULT 0")
-                except:
-                    pass
-                try:
-                    cursor.execute("ALTER TABLE facturas ADD COLUMN descuento_global_fijo REAL DEFAULT 0")
-                except:
-                    pass
-                try:
-                    cursor.execute("ALTER TABLE facturas ADD COLUMN descuento_antes_iva INTEGER DEFAULT 1")
-                except:
-                    pass
-                print("Columnas de descuentos agregadas a facturas correctamente")
-            
-            # Agregar columna retencion_irpf a facturas
-            if 'retencion_irpf' not in facturas_columns:
-                print("Agregando columna retencion_irpf a la tabla facturas...")
-                try:
-                    cursor.execute("ALTER TABLE facturas ADD COLUMN retencion_irpf REAL DEFAULT NULL")
-                except:
-                    pass
-                print("Columna retencion_irpf agregada correctamente")
-            
-        except Exception as e:
-            print(f"Error actualizando tabla: {e}")
-            # Si hay error, recrear la tabla
+            self.get_connection().execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error as e:
+            print(f"Error reabriendo la conexión a la base de datos: {e}")
+            return False
+    
+    def close(self):
+        """Cierra la conexión del hilo actual"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+        with self._lock:
+            if conn in self._conexiones:
+                self._conexiones.remove(conn)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+    
+    def close_all(self):
+        """Cierra todas las conexiones abiertas (al cerrar la aplicación)"""
+        with self._lock:
+            conexiones = self._conexiones
+            self._conexiones = []
+        for conn in conexiones:
             try:
-                cursor.execute("DROP TABLE IF EXISTS presupuesto_items")
-                cursor.execute('''
-                    CREATE TABLE presupuesto_items (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        presupuesto_id INTEGER NOT NULL,
-                        material_id INTEGER,
-                        tarea_manual TEXT,
-                        cantidad REAL NOT NULL,
-                        precio_unitario REAL NOT NULL,
-                        subtotal REAL NOT NULL,
-                        visible_pdf INTEGER DEFAULT 1,
-                        es_tarea_manual INTEGER DEFAULT 0,
-                        aplica_iva INTEGER DEFAULT 1,
-                        descuento_porcentaje REAL DEFAULT 0,
-                        descuento_fijo REAL DEFAULT 0,
-                        FOREIGN KEY (presupuesto_id) REFERENCES presupuestos (id),
-                        FOREIGN KEY (material_id) REFERENCES materiales (id)
-                    )
-                ''')
-                print("Tabla presupuesto_items recreada")
-            except Exception as e2:
-                print(f"Error recreando tabla: {e2}")
-    
-    def get_connection(self):
-        """Obtiene una conexión a la base de datos"""
-        return sqlite3.connect(self.db_path)
-    
-    def execute_query(self, query: str, params: tuple = ()) -> List[Dict[str, Any]]:
-        """Ejecuta una consulta y devuelve los resultados como lista de diccionarios"""
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+    
+    def _in_transaction(self) -> bool:
+        return getattr(self._local, 'tx_depth', 0) > 0
+    
+    @contextmanager
+    def transaction(self):
+        """Agrupa varias escrituras en una única transacción con un solo commit.
+        
+        Uso: ``with db.transaction(): ...``. Dentro del bloque, execute_update no
+        hace commit; si se produce una excepción se deshace todo. Las transacciones
+        anidadas se unen a la exterior.
+        """
         conn = self.get_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        profundidad = getattr(self._local, 'tx_depth', 0)
+        if profundidad == 0 and not conn.in_transaction:
+            conn.execute("BEGIN")
+        self._local.tx_depth = profundidad + 1
+        try:
+            yield self
+        except BaseException:
+            self._local.tx_depth = profundidad
+            if profundidad == 0:
+                conn.rollback()
+            raise
+        self._local.tx_depth = profundidad
+        if profundidad == 0:
+            conn.commit()
+            self._marcar_escritura()
+    
+    @property
+    def generacion(self) -> int:
+        """Contador de escrituras confirmadas por este manager"""
+        return self._generacion
+    
+    def _marcar_escritura(self):
+        with self._lock:
+            self._generacion += 1
+    
+    def tiene_busqueda_fts(self) -> bool:
+        """Indica si la base de datos tiene los índices de búsqueda FTS5 (se comprueba una vez)"""
+        if self._busqueda_fts is None:
+            nombres = [tabla_fts for tabla_fts, _, _ in TABLAS_FTS]
+            marcadores = ", ".join("?" for _ in nombres)
+            result = self.execute_query(
+                f"SELECT COUNT(*) as total FROM sqlite_master WHERE type = 'table' AND name IN ({marcadores})",
+                tuple(nombres)
+            )
+            self._busqueda_fts = bool(result) and result[0]['total'] == len(nombres)
+        return self._busqueda_fts
+    
+    def explain_query_plan(self, query: str, params: tuple = ()) -> List[str]:
+        """Devuelve el plan de ejecución de una consulta (EXPLAIN QUERY PLAN)"""
+        cursor = self.get_connection().execute(f"EXPLAIN QUERY PLAN {query}", params)
+        return [row['detail'] for row in cursor.fetchall()]
+    
+    def execute_query(self, query: str, params: tuple = (), row_mode: str = ROW_DICT) -> List[Any]:
+        """Ejecuta una consulta y devuelve los resultados como lista de diccionarios.
+        
+        Con row_mode=ROW_TUPLE devuelve tuplas y con ROW_RECORD registros compactos
+        de solo lectura (acceso por nombre como un dict), útiles en listados grandes.
+        """
+        cursor = self.get_connection().cursor()
+        if row_mode == ROW_DICT:
+            cursor.execute(query, params)
+            return [dict(row) for row in cursor.fetchall()]
+        
+        cursor.row_factory = None
         cursor.execute(query, params)
-        results = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return results
+        filas = cursor.fetchall()
+        if row_mode == ROW_TUPLE:
+            return filas
+        
+        columnas = tuple(col[0] for col in cursor.description or ())
+        clase = _clase_registro(columnas)
+        if clase is None:
+            return [dict(zip(columnas, fila)) for fila in filas]
+        return [clase._make(fila) for fila in filas]
     
     def execute_update(self, query: str, params: tuple = ()) -> int:
         """Ejecuta una actualización y devuelve el ID del último registro insertado"""
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(query, params)
-        conn.commit()
-        last_id = cursor.lastrowid
-        conn.close()
-        return last_id
+        if self._in_transaction():
+            # El commit lo hace transaction() al salir del bloque
+            return conn.execute(query, params).lastrowid
+        try:
+            cursor = conn.execute(query, params)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        self._marcar_escritura()
+        return cursor.lastrowid
+    
+    def execute_many(self, query: str, params_list: List[tuple]) -> range:
+        """Inserta varias filas con executemany y devuelve el rango de IDs generados.
+        
+        Se ejecuta dentro de una transacción, por lo que los IDs de un INSERT
+        simple sobre una tabla AUTOINCREMENT son consecutivos.
+        """
+        params_list = list(params_list)
+        if not params_list:
+            return range(0)
+        with self.transaction():
+            conn = self.get_connection()
+            conn.executemany(query, params_list)
+            ultimo_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        return range(ultimo_id - len(params_list) + 1, ultimo_id + 1)
 
-# Instancia global de la base de datos
+# Instancia global de la base de datos (perezosa: no abre el archivo hasta la primera consulta)
 db = DatabaseManager()
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+# Permite importar el paquete presupuestos al lanzar pytest desde cualquier directorio
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from presupuestos.contexto import crear_contexto  # noqa: E402
+
+
+@pytest.fixture
+def contexto(tmp_path):
+    """Contexto de aplicación sobre una base de datos temporal"""
+    ctx = crear_contexto(str(tmp_path / 'x.db'))
+    yield ctx
+    ctx.cerrar()
@@ -0,0 +1,44 @@
+"""
+Perfil de almacenamiento: 'safe' por defecto, 'fast' solo si se pide en la configuración.
+"""
+
+import json
+
+import pytest
+
+from presupuestos.utils import DatabaseManager, cargar_perfil_almacenamiento
+
+
+def _config(tmp_path, **claves):
+    ruta = tmp_path / 'config.json'
+    ruta.write_text(json.dumps(claves), encoding='utf-8')
+    return str(ruta)
+
+
+def _journal_mode(db):
+    return db.get_connection().execute("PRAGMA journal_mode").fetchone()[0].lower()
+
+
+def test_safe_por_defecto(tmp_path):
+    assert cargar_perfil_almacenamiento(str(tmp_path / 'no_existe.json')) == 'safe'
+    assert cargar_perfil_almacenamiento(_config(tmp_path, carpeta_pdfs='pdfs')) == 'safe'
+
+
+def test_fast_se_activa_en_la_configuracion(tmp_path):
+    assert cargar_perfil_almacenamiento(_config(tmp_path, perfil_almacenamiento='fast')) == 'fast'
+
+
+def test_perfil_desconocido_es_un_error(tmp_path):
+    with pytest.raises(ValueError):
+        cargar_perfil_almacenamiento(_config(tmp_path, perfil_almacenamiento='rapido'))
+
+
+def test_pragmas_de_cada_perfil(tmp_path):
+    seguro = DatabaseManager(str(tmp_path / 'safe.db'), 'safe')
+    rapido = DatabaseManager(str(tmp_path / 'fast.db'), 'fast')
+    try:
+        assert _journal_mode(seguro) == 'delete'
+        assert _journal_mode(rapido) == 'wal'
+    finally:
+        seguro.close_all()
+        rapido.close_all()
@@ -0,0 +1,43 @@
+"""
+Búsqueda de presupuestos y facturas: el número de factura y el ID se buscan por subcadena.
+"""
+
+import pytest
+
+
+@pytest.fixture
+def documentos(contexto):
+    db = contexto.db
+    db.execute_many("INSERT INTO clientes (nombre) VALUES (?)", [("Ana Gómez",), ("Luis Pérez",)])
+    # Fechas sin '12' ni '2025' para que solo casen número de factura o ID
+    db.execute_many("""
+        INSERT INTO facturas (numero_factura, cliente_id, fecha_creacion, subtotal, iva, total)
+        VALUES (?, ?, ?, 100, 21, 121)
+    """, [(f"F{n:04d}-{anio}", 1 + n % 2, "2023-03-05 10:00:00")
+          for anio in (2024, 2025) for n in range(1, 130)])
+    db.execute_many("""
+        INSERT INTO presupuestos (cliente_id, fecha_creacion, subtotal, iva, total)
+        VALUES (?, '2024-03-05 10:00:00', 100, 21, 121)
+    """, [(1 + n % 2,) for n in range(1, 130)])
+    return contexto
+
+
+@pytest.mark.parametrize('termino', ['12', '2025', '0012-20'])
+def test_numero_de_factura_por_subcadena(documentos, termino):
+    numeros = {f['numero_factura'] for f in documentos.facturas.buscar_facturas(termino)}
+    esperados = {f"F{n:04d}-{anio}" for anio in (2024, 2025) for n in range(1, 130)
+                 if termino in f"F{n:04d}-{anio}"}
+    assert esperados
+    assert numeros == esperados
+    assert documentos.facturas.contar_facturas(termino) == len(esperados)
+
+
+def test_id_de_presupuesto_por_subcadena(documentos):
+    ids = {p['id'] for p in documentos.presupuestos.buscar_presupuestos('12')}
+    assert ids == {n for n in range(1, 130) if '12' in str(n)}
+    assert documentos.presupuestos.contar_presupuestos('12') == len(ids)
+
+
+def test_cliente_sigue_buscandose_por_nombre(documentos):
+    facturas = documentos.facturas.buscar_facturas('gomez')
+    assert facturas and all(f['cliente_nombre'] == 'Ana Gómez' for f in facturas)
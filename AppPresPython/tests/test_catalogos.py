@@ -0,0 +1,85 @@
+"""
+Directorio de clientes y catálogo de materiales en memoria: se reconstruyen tras
+crear, modificar o eliminar, y siguen a la base de datos.
+"""
+
+
+def test_directorio_se_carga_una_vez(contexto):
+    contexto.clientes.crear_cliente("Ana Gómez")
+    directorio = contexto.clientes.directorio()
+    assert contexto.clientes.directorio() is directorio
+
+
+def test_directorio_tras_crear(contexto):
+    assert len(contexto.clientes.directorio()) == 0
+
+    cliente_id = contexto.clientes.crear_cliente("Ana Gómez", dni="12.345.678-Z")
+
+    directorio = contexto.clientes.directorio()
+    assert directorio.cliente(cliente_id)['nombre'] == "Ana Gómez"
+    assert [c['id'] for c in directorio.por_nombre("ana gomez")] == [cliente_id]
+    assert directorio.por_dni("12345678z")['id'] == cliente_id
+
+
+def test_directorio_tras_actualizar(contexto):
+    cliente_id = contexto.clientes.crear_cliente("Ana Gómez", dni="12345678Z")
+    contexto.clientes.directorio()
+
+    assert contexto.clientes.actualizar_cliente(cliente_id, "Ana López", dni="87654321X")
+
+    directorio = contexto.clientes.directorio()
+    assert directorio.cliente(cliente_id)['nombre'] == "Ana López"
+    assert directorio.por_nombre("Ana Gómez") == []
+    assert directorio.por_dni("12345678Z") is None
+    assert directorio.por_dni("87654321X")['id'] == cliente_id
+
+
+def test_directorio_tras_eliminar(contexto):
+    ana = contexto.clientes.crear_cliente("Ana Gómez")
+    luis = contexto.clientes.crear_cliente("Luis Pérez")
+    contexto.clientes.directorio()
+
+    assert contexto.clientes.eliminar_cliente(ana)
+
+    directorio = contexto.clientes.directorio()
+    assert directorio.cliente(ana) is None
+    assert [c['id'] for c in directorio.todos()] == [luis]
+
+
+def test_catalogo_se_carga_una_vez(contexto):
+    contexto.materiales.crear_material("Tornillo", "ud", 0.1)
+    catalogo = contexto.materiales.catalogo()
+    assert contexto.materiales.catalogo() is catalogo
+
+
+def test_catalogo_tras_crear(contexto):
+    assert contexto.materiales.filtrar_materiales("tornillo") == []
+
+    material_id = contexto.materiales.crear_material("Tornillo de acero", "ud", 0.1)
+
+    assert contexto.materiales.catalogo().material(material_id)['precio_unitario'] == 0.1
+    assert [m['id'] for m in contexto.materiales.filtrar_materiales("tornillo")] == [material_id]
+
+
+def test_catalogo_tras_actualizar(contexto):
+    material_id = contexto.materiales.crear_material("Tornillo de acero", "ud", 0.1)
+    contexto.materiales.filtrar_materiales("tornillo")
+
+    assert contexto.materiales.actualizar_material(material_id, "Tuerca de latón", "ud", 0.25)
+
+    assert contexto.materiales.filtrar_materiales("tornillo") == []
+    assert [m['id'] for m in contexto.materiales.filtrar_materiales("laton")] == [material_id]
+    assert contexto.materiales.catalogo().material(material_id)['precio_unitario'] == 0.25
+
+
+def test_catalogo_tras_eliminar(contexto):
+    tornillo = contexto.materiales.crear_material("Tornillo", "ud", 0.1)
+    tuerca = contexto.materiales.crear_material("Tuerca", "ud", 0.2)
+    contexto.materiales.catalogo()
+
+    assert contexto.materiales.eliminar_material(tornillo)
+
+    catalogo = contexto.materiales.catalogo()
+    assert catalogo.material(tornillo) is None
+    assert [m['id'] for m in catalogo.todos()] == [tuerca]
+    assert contexto.materiales.filtrar_materiales("tor") == []
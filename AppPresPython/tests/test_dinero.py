@@ -0,0 +1,60 @@
+"""
+Aritmética en céntimos: redondeo comercial y totales exactos al céntimo.
+"""
+
+import random
+
+from presupuestos.dinero import (a_centimos, a_euros, formatear_truncado, importe_linea,
+                                 porcentaje_centimos, prorratear_centimos)
+from presupuestos.totales import calcular_totales
+
+
+def test_redondeo_mitad_hacia_arriba():
+    assert a_centimos(0.005) == 1
+    assert a_centimos(1.005) == 101
+    assert a_centimos(2.675) == 268
+    assert a_centimos(-1.005) == -101
+    assert a_centimos(10) == 1000
+
+
+def test_importe_de_linea_sin_error_de_coma_flotante():
+    assert importe_linea(3, 0.1) == 0.3
+    assert importe_linea(0.5, 0.15) == 0.08
+    assert a_euros(a_centimos(0.1) + a_centimos(0.2)) == 0.3
+
+
+def test_porcentajes_y_prorrateo():
+    assert porcentaje_centimos(1000, 21) == 210
+    assert porcentaje_centimos(1050, 21) == 221
+    assert prorratear_centimos(1000, 1, 3) == 333
+    assert prorratear_centimos(1000, 2, 3) == 667
+    assert prorratear_centimos(1000, 5, 0) == 0
+
+
+def test_formato_truncado():
+    assert formatear_truncado(1.999) == '1.99'
+    assert formatear_truncado(0.1 + 0.2) == '0.30'
+    assert formatear_truncado(5) == '5.00'
+
+
+def test_totales_en_centimos_exactos():
+    items = [{'cantidad': 1, 'precio_unitario': precio} for precio in (0.1, 0.2, 0.3, 0.7, 1.1, 2.3)]
+    totales = calcular_totales(items, iva_habilitado=False)
+    assert totales['subtotal'] == 4.7
+    assert totales['total'] == 4.7
+
+
+def test_totales_no_dependen_del_orden_de_los_items():
+    aleatorio = random.Random(12)
+    for _ in range(200):
+        items = [
+            {'cantidad': aleatorio.choice([1, 3, 0.5]), 'precio_unitario': round(aleatorio.uniform(0, 100), 2),
+             'descuento_porcentaje': aleatorio.choice([0, 7.5]), 'iva_porcentaje': aleatorio.choice([21.0, 10.0])}
+            for _ in range(aleatorio.randint(1, 10))
+        ]
+        barajados = aleatorio.sample(items, len(items))
+        argumentos = (aleatorio.choice([0, 10]), 0, aleatorio.random() < 0.5, True, aleatorio.choice([None, 15.0]))
+        totales = calcular_totales(items, *argumentos)
+        assert totales == calcular_totales(barajados, *argumentos)
+        for clave in ('subtotal', 'descuento_global', 'iva', 'retencion_irpf', 'total'):
+            assert round(totales[clave], 2) == totales[clave]
@@ -0,0 +1,42 @@
+"""
+execute_many: inserción en lote y rango de IDs generados.
+"""
+
+
+def test_devuelve_los_ids_de_las_filas_insertadas(contexto):
+    db = contexto.db
+    db.execute_update("INSERT INTO clientes (nombre) VALUES ('Previo')")
+    nombres = [f"Cliente {n}" for n in range(50)]
+
+    ids = db.execute_many("INSERT INTO clientes (nombre) VALUES (?)", [(nombre,) for nombre in nombres])
+
+    assert ids == range(2, 52)
+    filas = db.execute_query("SELECT id, nombre FROM clientes WHERE id >= 2 ORDER BY id")
+    assert [(fila['id'], fila['nombre']) for fila in filas] == list(zip(ids, nombres))
+
+
+def test_lista_vacia_no_inserta(contexto):
+    db = contexto.db
+    assert db.execute_many("INSERT INTO clientes (nombre) VALUES (?)", []) == range(0)
+    assert db.execute_query("SELECT COUNT(*) as total FROM clientes")[0]['total'] == 0
+
+
+def test_dentro_de_una_transaccion_exterior(contexto):
+    db = contexto.db
+    with db.transaction():
+        primero = db.execute_update("INSERT INTO clientes (nombre) VALUES ('Ana')")
+        ids = db.execute_many("INSERT INTO clientes (nombre) VALUES (?)", [("Luis",), ("Eva",)])
+    assert list(ids) == [primero + 1, primero + 2]
+
+
+def test_items_del_presupuesto_en_orden(contexto):
+    cliente_id = contexto.clientes.crear_cliente("Ana")
+    items = [
+        {'tarea_manual': f"Tarea {n}", 'es_tarea_manual': 1, 'cantidad': n + 1, 'precio_unitario': 10.0}
+        for n in range(5)
+    ]
+    presupuesto_id = contexto.presupuestos.crear_presupuesto(cliente_id, items)
+
+    guardado = contexto.presupuestos.obtener_presupuesto_por_id(presupuesto_id)
+    assert [item['tarea_manual'] for item in guardado['items']] == [item['tarea_manual'] for item in items]
+    assert [item['subtotal'] for item in guardado['items']] == [10.0, 20.0, 30.0, 40.0, 50.0]
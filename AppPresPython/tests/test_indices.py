@@ -0,0 +1,29 @@
+"""
+Comprueba con EXPLAIN QUERY PLAN que las consultas críticas usan sus índices.
+"""
+
+
+def _usa_indice(plan, indice):
+    return any(indice in detalle for detalle in plan)
+
+
+def test_items_de_factura_por_factura(contexto):
+    plan = contexto.db.explain_query_plan(
+        "SELECT * FROM factura_items WHERE factura_id = ?", (1,)
+    )
+    assert _usa_indice(plan, 'idx_factura_items_factura'), plan
+
+
+def test_facturas_vencidas(contexto):
+    planes = []
+    consultar = contexto.db.execute_query
+
+    def espiar(query, params=(), *args, **kwargs):
+        planes.append(contexto.db.explain_query_plan(query, params))
+        return consultar(query, params, *args, **kwargs)
+
+    contexto.db.execute_query = espiar
+    contexto.facturas.obtener_facturas_vencidas()
+
+    assert planes
+    assert any(_usa_indice(plan, 'idx_facturas_estado_vencimiento') for plan in planes), planes
@@ -0,0 +1,123 @@
+"""
+Caché de métricas: se invalida con cada escritura confirmada, las métricas por día
+caducan al cambiar la fecha y cada llamada recibe su propia copia del resultado.
+"""
+
+from datetime import date
+
+import pytest
+
+from presupuestos import utils
+from presupuestos.utils import metrica_en_cache
+
+
+class ManagerDePrueba:
+    """Manager mínimo que cuenta cuántas veces se calcula cada métrica"""
+
+    def __init__(self, db):
+        self.db = db
+        self.calculos = 0
+
+    @metrica_en_cache('prueba_total')
+    def total(self, minimo: int = 0):
+        self.calculos += 1
+        filas = self.db.execute_query("SELECT COUNT(*) AS n FROM clientes WHERE id > ?", (minimo,))
+        return {'clientes': filas[0]['n'], 'detalle': [minimo]}
+
+    @metrica_en_cache('prueba_hoy', por_dia=True)
+    def hoy(self):
+        self.calculos += 1
+        return {'calculos': self.calculos}
+
+
+@pytest.fixture
+def manager(contexto):
+    return ManagerDePrueba(contexto.db)
+
+
+def _insertar_cliente(db, nombre='Ana'):
+    return db.execute_update("INSERT INTO clientes (nombre) VALUES (?)", (nombre,))
+
+
+def _transaccion(db):
+    with db.transaction():
+        _insertar_cliente(db, 'Ana')
+        _insertar_cliente(db, 'Luis')
+
+
+def test_lecturas_no_cambian_la_generacion(contexto, manager):
+    manager.total()
+    generacion = contexto.db.generacion
+    manager.total()
+    contexto.db.execute_query("SELECT * FROM clientes")
+    assert contexto.db.generacion == generacion
+    assert manager.calculos == 1
+
+
+def test_primera_metrica_no_caduca_por_las_migraciones(manager):
+    # La base de datos se crea (y migra) en la primera consulta de la métrica
+    manager.total()
+    manager.total()
+    assert manager.calculos == 1
+
+
+@pytest.mark.parametrize('escribir', [
+    lambda db: _insertar_cliente(db),
+    lambda db: db.execute_many("INSERT INTO clientes (nombre) VALUES (?)", [('Ana',), ('Luis',)]),
+    lambda db: _transaccion(db),
+], ids=['execute_update', 'execute_many', 'transaction'])
+def test_escritura_incrementa_generacion_e_invalida(contexto, manager, escribir):
+    assert manager.total()['clientes'] == 0
+    generacion = contexto.db.generacion
+
+    escribir(contexto.db)
+
+    assert contexto.db.generacion == generacion + 1
+    assert manager.total()['clientes'] > 0
+    assert manager.calculos == 2
+
+
+def test_transaccion_revertida_no_invalida(contexto, manager):
+    manager.total()
+    generacion = contexto.db.generacion
+    with pytest.raises(RuntimeError):
+        with contexto.db.transaction():
+            _insertar_cliente(contexto.db)
+            raise RuntimeError("fallo")
+    assert contexto.db.generacion == generacion
+    assert manager.total()['clientes'] == 0
+    assert manager.calculos == 1
+
+
+def test_metrica_real_se_recalcula_tras_escribir(contexto):
+    assert contexto.presupuestos.obtener_estadisticas_presupuestos()['total_emitidos'] == 0
+    cliente_id = _insertar_cliente(contexto.db)
+    contexto.db.execute_update(
+        "INSERT INTO presupuestos (cliente_id, subtotal, iva, total) VALUES (?, 100, 21, 121)", (cliente_id,))
+    assert contexto.presupuestos.obtener_estadisticas_presupuestos()['total_emitidos'] == 1
+
+
+def test_metrica_por_dia_caduca_al_cambiar_la_fecha(manager, monkeypatch):
+    class Fecha(date):
+        actual = date(2025, 3, 31)
+
+        @classmethod
+        def today(cls):
+            return cls.actual
+
+    monkeypatch.setattr(utils, 'date', Fecha)
+    assert manager.hoy() == {'calculos': 1}
+    assert manager.hoy() == {'calculos': 1}
+
+    Fecha.actual = date(2025, 4, 1)
+    assert manager.hoy() == {'calculos': 2}
+    assert manager.hoy() == {'calculos': 2}
+
+
+def test_modificar_el_resultado_no_altera_la_cache(manager):
+    resultado = manager.total()
+    resultado['clientes'] = 99
+    resultado['detalle'].append('cambiado')
+
+    assert manager.total() == {'clientes': 0, 'detalle': [0]}
+    assert manager.calculos == 1
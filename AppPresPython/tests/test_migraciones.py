@@ -0,0 +1,148 @@
+"""
+Migraciones: una base de datos de una versión antigua (sin user_version) llega al esquema actual.
+"""
+
+import sqlite3
+
+from presupuestos import migraciones
+from presupuestos.migraciones import INDICES, MIGRACIONES, VERSION_ESQUEMA
+from presupuestos.utils import DatabaseManager
+
+ESQUEMA_ANTIGUO = """
+    CREATE TABLE clientes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, nombre TEXT NOT NULL, telefono TEXT, email TEXT,
+        direccion TEXT, fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE materiales (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, nombre TEXT NOT NULL, unidad_medida TEXT NOT NULL,
+        precio_unitario REAL NOT NULL, fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE presupuestos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, cliente_id INTEGER NOT NULL,
+        fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        subtotal REAL NOT NULL, iva REAL NOT NULL, total REAL NOT NULL
+    );
+    CREATE TABLE presupuesto_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, presupuesto_id INTEGER NOT NULL,
+        material_id INTEGER NOT NULL, cantidad REAL NOT NULL, precio_unitario REAL NOT NULL,
+        subtotal REAL NOT NULL
+    );
+    CREATE TABLE facturas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, numero_factura TEXT UNIQUE NOT NULL,
+        cliente_id INTEGER NOT NULL, presupuesto_id INTEGER,
+        fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP, fecha_vencimiento DATE,
+        subtotal REAL NOT NULL, iva REAL NOT NULL, total REAL NOT NULL, iva_habilitado INTEGER DEFAULT 1,
+        metodo_pago TEXT DEFAULT 'Transferencia', estado_pago TEXT DEFAULT 'No Pagada', notas TEXT
+    );
+    CREATE TABLE factura_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, factura_id INTEGER NOT NULL, material_id INTEGER,
+        tarea_manual TEXT, cantidad REAL NOT NULL, precio_unitario REAL NOT NULL, subtotal REAL NOT NULL,
+        visible_pdf INTEGER DEFAULT 1, es_tarea_manual INTEGER DEFAULT 0
+    );
+    INSERT INTO clientes (nombre) VALUES ('Ana');
+    INSERT INTO materiales (nombre, unidad_medida, precio_unitario) VALUES ('Cable', 'm', 2.5);
+    INSERT INTO presupuestos (cliente_id, fecha_creacion, subtotal, iva, total)
+        VALUES (1, '2023-05-10 09:00:00', 25, 5.25, 30.25);
+    INSERT INTO presupuesto_items (presupuesto_id, material_id, cantidad, precio_unitario, subtotal)
+        VALUES (1, 1, 10, 2.5, 25);
+    INSERT INTO facturas (numero_factura, cliente_id, fecha_creacion, subtotal, iva, total)
+        VALUES ('F0001-2023', 1, '2023-05-11 09:00:00', 25, 5.25, 30.25);
+    INSERT INTO factura_items (factura_id, material_id, cantidad, precio_unitario, subtotal)
+        VALUES (1, 1, 10, 2.5, 25);
+"""
+
+
+def _base_antigua(ruta):
+    conn = sqlite3.connect(ruta)
+    conn.executescript(ESQUEMA_ANTIGUO)
+    conn.close()
+
+
+def _base_actual(ruta):
+    db = DatabaseManager(ruta)
+    db.execute_query("SELECT 1")
+    db.close_all()
+
+
+def _columnas(db, tabla):
+    return {fila['name']: fila for fila in db.execute_query(f"PRAGMA table_info({tabla})")}
+
+
+def test_base_antigua_llega_a_la_version_actual(tmp_path):
+    ruta = str(tmp_path / 'antigua.db')
+    _base_antigua(ruta)
+    db = DatabaseManager(ruta)
+    try:
+        assert db.execute_query("PRAGMA user_version")[0]['user_version'] == VERSION_ESQUEMA
+
+        aplicadas = {fila['nombre'] for fila in db.execute_query("SELECT nombre FROM schema_migraciones")}
+        assert aplicadas == {f"{numero:03d}_{nombre}" for numero, nombre, _ in MIGRACIONES}
+
+        # Columnas añadidas y presupuesto_items reconstruida con material_id opcional
+        assert 'dni' in _columnas(db, 'clientes')
+        assert 'retencion_irpf' in _columnas(db, 'facturas')
+        items = _columnas(db, 'presupuesto_items')
+        assert items['material_id']['notnull'] == 0
+        assert {'tarea_manual', 'visible_pdf', 'es_tarea_manual', 'aplica_iva'} <= set(items)
+
+        indices = {fila['name'] for fila in db.execute_query("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert {nombre for nombre, _, _ in INDICES} <= indices
+    finally:
+        db.close_all()
+
+
+def test_los_datos_se_conservan(tmp_path):
+    ruta = str(tmp_path / 'antigua.db')
+    _base_antigua(ruta)
+    db = DatabaseManager(ruta)
+    try:
+        item = db.execute_query("SELECT * FROM presupuesto_items")[0]
+        assert (item['presupuesto_id'], item['material_id'], item['cantidad'], item['subtotal']) == (1, 1, 10, 25)
+        assert (item['visible_pdf'], item['es_tarea_manual'], item['aplica_iva']) == (1, 0, 1)
+
+        presupuesto = db.execute_query("SELECT * FROM presupuestos")[0]
+        assert presupuesto['estado'] == 'Pendiente'
+        assert presupuesto['total'] == 30.25
+
+        resumen = db.execute_query("SELECT tipo, cantidad FROM resumen_mensual ORDER BY tipo")
+        assert [(fila['tipo'], fila['cantidad']) for fila in resumen] == [('factura', 1), ('presupuesto', 1)]
+    finally:
+        db.close_all()
+
+
+def test_base_al_dia_no_repite_migraciones(tmp_path, monkeypatch):
+    ruta = str(tmp_path / 'x.db')
+    _base_actual(ruta)
+
+    ejecutadas = []
+    monkeypatch.setattr(migraciones, 'MIGRACIONES', [
+        (numero, nombre, lambda cursor, nombre=nombre: ejecutadas.append(nombre))
+        for numero, nombre, _ in MIGRACIONES
+    ])
+    db = DatabaseManager(ruta)
+    try:
+        db.execute_query("SELECT COUNT(*) FROM clientes")
+    finally:
+        db.close_all()
+    assert ejecutadas == []
+
+
+def test_version_intermedia_aplica_solo_los_pasos_pendientes(tmp_path, monkeypatch):
+    ruta = str(tmp_path / 'x.db')
+    _base_actual(ruta)
+    conn = sqlite3.connect(ruta)
+    conn.execute(f"PRAGMA user_version = {VERSION_ESQUEMA - 1}")
+    conn.close()
+
+    ejecutadas = []
+    monkeypatch.setattr(migraciones, 'MIGRACIONES', [
+        (numero, nombre, lambda cursor, nombre=nombre: ejecutadas.append(nombre))
+        for numero, nombre, _ in MIGRACIONES
+    ])
+    db = DatabaseManager(ruta)
+    try:
+        db.execute_query("SELECT 1")
+        assert db.execute_query("PRAGMA user_version")[0]['user_version'] == VERSION_ESQUEMA
+    finally:
+        db.close_all()
+    assert ejecutadas == [MIGRACIONES[-1][1]]
@@ -0,0 +1,90 @@
+"""
+Paginación por cursor (keyset) de los cuatro listados: recorrido completo hacia
+delante y hacia atrás con empates en la clave de orden, y cursores no válidos.
+"""
+
+import base64
+import json
+
+import pytest
+
+from presupuestos.utils import PAGINA_ANTERIOR, codificar_cursor, recorrer_paginas
+
+TAMANO = 7
+
+
+@pytest.fixture
+def datos(contexto):
+    db = contexto.db
+    # Nombres y fechas repetidos: el desempate lo hace el id
+    db.execute_many("INSERT INTO clientes (nombre) VALUES (?)",
+                    [(f"Cliente {n % 6}",) for n in range(40)])
+    db.execute_many("INSERT INTO materiales (nombre, unidad_medida, precio_unitario) VALUES (?, 'ud', 1)",
+                    [(f"Material {n % 5}",) for n in range(40)])
+    db.execute_many("""
+        INSERT INTO presupuestos (cliente_id, fecha_creacion, subtotal, iva, total)
+        VALUES (?, ?, 10, 2.1, 12.1)
+    """, [(1 + n % 3, f"2024-0{1 + n % 4}-01 10:00:00") for n in range(40)])
+    db.execute_many("""
+        INSERT INTO facturas (numero_factura, cliente_id, fecha_creacion, subtotal, iva, total)
+        VALUES (?, ?, ?, 10, 2.1, 12.1)
+    """, [(f"F{n:04d}-2024", 1 + n % 3, f"2024-0{1 + n % 4}-01 10:00:00") for n in range(40)])
+    return contexto
+
+
+LISTADOS = {
+    'clientes': (lambda ctx: ctx.clientes.listar_clientes_pagina,
+                 "SELECT id FROM clientes ORDER BY nombre, id"),
+    'materiales': (lambda ctx: ctx.materiales.listar_materiales_pagina,
+                   "SELECT id FROM materiales ORDER BY nombre, id"),
+    'presupuestos': (lambda ctx: ctx.presupuestos.listar_presupuestos_pagina,
+                     "SELECT id FROM presupuestos ORDER BY fecha_creacion DESC, id DESC"),
+    'facturas': (lambda ctx: ctx.facturas.listar_facturas_pagina,
+                 "SELECT id FROM facturas ORDER BY fecha_creacion DESC, id DESC"),
+}
+
+
+def _ids(pagina):
+    return [fila['id'] for fila in pagina['filas']]
+
+
+@pytest.mark.parametrize('listado', sorted(LISTADOS))
+def test_recorrido_hacia_delante_y_hacia_atras(datos, listado):
+    obtener, consulta = LISTADOS[listado]
+    listar = obtener(datos)
+    esperado = [fila['id'] for fila in datos.db.execute_query(consulta)]
+
+    paginas = [listar(tamano=TAMANO)]
+    assert paginas[0]['anterior'] is None
+    while paginas[-1]['siguiente']:
+        paginas.append(listar(cursor=paginas[-1]['siguiente'], tamano=TAMANO))
+    assert [fila for pagina in paginas for fila in _ids(pagina)] == esperado
+    assert len(paginas) == -(-len(esperado) // TAMANO)
+
+    # Desde la última página, 'anterior' devuelve exactamente las páginas ya vistas
+    pagina = paginas[-1]
+    for vista in reversed(paginas[:-1]):
+        pagina = listar(cursor=pagina['anterior'], tamano=TAMANO, direccion=PAGINA_ANTERIOR)
+        assert _ids(pagina) == _ids(vista)
+    assert pagina['anterior'] is None
+
+    assert [fila['id'] for fila in recorrer_paginas(listar, tamano=TAMANO)] == esperado
+
+
+@pytest.mark.parametrize('cursor', [
+    'no es base64 válido!',
+    base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+    base64.urlsafe_b64encode(b'no es json').decode(),
+    codificar_cursor(['Cliente 1']),
+    codificar_cursor(['Cliente 1', 3, 'sobra']),
+    base64.urlsafe_b64encode(json.dumps({'nombre': 'x', 'id': 1}).encode()).decode(),
+    codificar_cursor([['Cliente 1'], {'id': 3}]),
+])
+def test_cursor_no_valido_se_rechaza(datos, cursor):
+    with pytest.raises(ValueError):
+        datos.clientes.listar_clientes_pagina(cursor=cursor, tamano=TAMANO)
+
+
+def test_direccion_no_valida_se_rechaza(datos):
+    with pytest.raises(ValueError):
+        datos.facturas.listar_facturas_pagina(tamano=TAMANO, direccion='arriba')
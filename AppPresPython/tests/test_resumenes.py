@@ -0,0 +1,220 @@
+"""
+Resumen mensual: los triggers lo mantienen igual que una reconstrucción completa, las
+lecturas por rango coinciden con agregar las tablas y las estadísticas coinciden con
+las consultas originales (incluidos los documentos sin estado).
+"""
+
+import random
+from datetime import date
+
+import pytest
+
+from presupuestos.resumenes import (_tramos, estadisticas_resumen, leer_resumen,
+                                    reconstruir_resumen_mensual)
+
+ESTADOS_FACTURA = ['Pagada', 'No Pagada', None]
+ESTADOS_PRESUPUESTO = ['Pendiente', 'Aprobado', 'Rechazado', None]
+
+
+def _fecha(aleatorio):
+    return f"2024-{aleatorio.randint(1, 6):02d}-{aleatorio.randint(1, 28):02d} 10:00:00"
+
+
+def _cargar(contexto, aleatorio, cantidad=300):
+    db = contexto.db
+    db.execute_update("INSERT INTO clientes (nombre) VALUES ('Ana')")
+    db.execute_many("""
+        INSERT INTO facturas (numero_factura, cliente_id, fecha_creacion, subtotal, iva, total, estado_pago,
+                              descuento_global_porcentaje, descuento_global_fijo, retencion_irpf)
+        VALUES (?, 1, ?, ?, 0, ?, ?, ?, ?, ?)
+    """, [(f"F{n:04d}", _fecha(aleatorio), subtotal := round(aleatorio.uniform(1, 900), 2),
+           round(subtotal * 1.21, 2), aleatorio.choice(ESTADOS_FACTURA), aleatorio.choice([0, 5, None]),
+           aleatorio.choice([0, 2.5]), aleatorio.choice([None, 15.0])) for n in range(cantidad)])
+    db.execute_many("""
+        INSERT INTO presupuestos (cliente_id, fecha_creacion, subtotal, iva, total, estado)
+        VALUES (1, ?, ?, 0, ?, ?)
+    """, [(_fecha(aleatorio), subtotal := round(aleatorio.uniform(1, 900), 2), round(subtotal * 1.21, 2),
+           aleatorio.choice(ESTADOS_PRESUPUESTO)) for _ in range(cantidad)])
+
+
+def _modificar(contexto, aleatorio, cambios=300):
+    db = contexto.db
+    for _ in range(cambios):
+        tabla = aleatorio.choice(['facturas', 'presupuestos'])
+        columna_estado, estados = (('estado_pago', ESTADOS_FACTURA) if tabla == 'facturas'
+                                   else ('estado', ESTADOS_PRESUPUESTO))
+        fila_id = aleatorio.randint(1, 300)
+        operacion = aleatorio.random()
+        if operacion < 0.3:
+            db.execute_update(f"UPDATE {tabla} SET {columna_estado} = ? WHERE id = ?",
+                              (aleatorio.choice(estados), fila_id))
+        elif operacion < 0.6:
+            db.execute_update(f"UPDATE {tabla} SET total = ? WHERE id = ?",
+                              (round(aleatorio.uniform(0, 2000), 2), fila_id))
+        elif operacion < 0.8:
+            db.execute_update(f"UPDATE {tabla} SET fecha_creacion = ? WHERE id = ?", (_fecha(aleatorio), fila_id))
+        else:
+            db.execute_update(f"DELETE FROM {tabla} WHERE id = ?", (fila_id,))
+
+
+def _resumen(db):
+    return db.execute_query("SELECT * FROM resumen_mensual ORDER BY tipo, mes, estado")
+
+
+def test_triggers_mantienen_el_resumen_igual_a_reconstruirlo(contexto):
+    aleatorio = random.Random(21)
+    _cargar(contexto, aleatorio)
+    _modificar(contexto, aleatorio)
+
+    mantenido = _resumen(contexto.db)
+    reconstruir_resumen_mensual(contexto.db)
+    assert mantenido == _resumen(contexto.db)
+
+
+def test_bajas_no_acumulan_error_de_redondeo(contexto):
+    db = contexto.db
+    db.execute_update("INSERT INTO clientes (nombre) VALUES ('Ana')")
+    ids = db.execute_many("""
+        INSERT INTO facturas (numero_factura, cliente_id, fecha_creacion, subtotal, iva, total)
+        VALUES (?, 1, '2024-03-05', ?, 0, ?)
+    """, [(f"F{n}", total, total) for n, total in enumerate([0.1, 0.2, 0.3, 0.7, 1.1, 2.3])])
+    for factura_id in list(ids)[:5]:
+        db.execute_update("DELETE FROM facturas WHERE id = ?", (factura_id,))
+
+    assert estadisticas_resumen(db, 'factura')['suma_total'] == 2.3
+    assert db.execute_query("SELECT suma_total FROM resumen_mensual")[0]['suma_total'] == 230
+
+
+@pytest.mark.parametrize('inicio, fin, esperado', [
+    (None, None, (True, None, None, [])),
+    ('2024-03-01', '2024-05-31', (True, '2024-03', '2024-06', [])),
+    ('2024-03-01', None, (True, '2024-03', None, [])),
+    (None, '2024-05-31', (True, None, '2024-06', [])),
+    ('2024-03-15', '2024-05-10', (True, '2024-04', '2024-05',
+                                  [(date(2024, 3, 15), date(2024, 4, 1)), (date(2024, 5, 1), date(2024, 5, 11))])),
+    ('2024-03-02', '2024-03-31', (False, None, None, [(date(2024, 3, 2), date(2024, 4, 1))])),
+    ('2024-03-01', '2024-03-30', (False, None, None, [(date(2024, 3, 1), date(2024, 3, 31))])),
+    ('2024-12-15', '2025-01-31', (True, '2025-01', '2025-02', [(date(2024, 12, 15), date(2025, 1, 1))])),
+    ('2024-02-01', '2024-02-29', (True, '2024-02', '2024-03', [])),
+])
+def test_tramos_en_los_limites_de_mes(inicio, fin, esperado):
+    assert _tramos(inicio, fin) == esperado
+
+
+def test_lecturas_por_rango_coinciden_con_agregar_la_tabla(contexto):
+    aleatorio = random.Random(22)
+    _cargar(contexto, aleatorio)
+    _modificar(contexto, aleatorio, 100)
+    db = contexto.db
+
+    limites = [None, '2024-01-01', '2024-02-29', '2024-03-01', '2024-03-15', '2024-03-31', '2024-06-30']
+    for inicio in limites:
+        for fin in limites:
+            clausulas, params = ["fecha_creacion IS NOT NULL"], []
+            if inicio:
+                clausulas.append("fecha_creacion >= ?")
+                params.append(inicio)
+            if fin:
+                clausulas.append("fecha_creacion < date(?, '+1 day')")
+                params.append(fin)
+            esperado = db.execute_query(f"""
+                SELECT strftime('%Y-%m', fecha_creacion) as mes, COALESCE(estado_pago, 'No Pagada') as estado,
+                       COUNT(*) as cantidad, ROUND(SUM(total), 2) as suma_total,
+                       MIN(total) as minimo_total, MAX(total) as maximo_total
+                FROM facturas WHERE {' AND '.join(clausulas)}
+                GROUP BY 1, 2 ORDER BY 1, 2
+            """, tuple(params))
+            # Los días sueltos y los meses completos de un mismo mes salen en filas separadas
+            agrupado = {}
+            for fila in leer_resumen(db, 'factura', inicio, fin):
+                grupo = agrupado.setdefault((fila['mes'], fila['estado']), [0, 0, [], []])
+                grupo[0] += fila['cantidad']
+                grupo[1] += fila['suma_total']
+                grupo[2].append(fila['minimo_total'])
+                grupo[3].append(fila['maximo_total'])
+            obtenido = [{'mes': mes, 'estado': estado, 'cantidad': cantidad, 'suma_total': round(suma, 2),
+                         'minimo_total': min(minimos), 'maximo_total': max(maximos)}
+                        for (mes, estado), (cantidad, suma, minimos, maximos) in sorted(agrupado.items())]
+            assert obtenido == esperado, (inicio, fin)
+
+
+def _estadisticas_originales(db, fecha_inicio=None, fecha_fin=None):
+    """Consultas de estadísticas de facturas anteriores al resumen mensual"""
+    clausulas, params = [], []
+    if fecha_inicio:
+        clausulas.append("DATE(f.fecha_creacion) >= ?")
+        params.append(fecha_inicio)
+    if fecha_fin:
+        clausulas.append("DATE(f.fecha_creacion) <= ?")
+        params.append(fecha_fin)
+    where_sql = "WHERE " + " AND ".join(clausulas) if clausulas else ""
+    estados = {fila['estado_pago']: fila['cantidad'] for fila in db.execute_query(f"""
+        SELECT COALESCE(estado_pago, 'No Pagada') as estado_pago, COUNT(*) as cantidad
+        FROM facturas f {where_sql} GROUP BY COALESCE(estado_pago, 'No Pagada')
+    """, tuple(params))}
+    valores = db.execute_query(f"""
+        SELECT
+            COALESCE(SUM(CASE WHEN estado_pago = 'Pagada' THEN total ELSE 0 END), 0) as total_facturado,
+            COALESCE(SUM(CASE WHEN estado_pago = 'No Pagada' THEN total ELSE 0 END), 0) as total_pendiente_cobro,
+            COALESCE(AVG(total), 0) as promedio_factura,
+            COALESCE(MAX(total), 0) as factura_max,
+            COALESCE(MIN(total), 0) as factura_min,
+            COALESCE(SUM(descuento_global_porcentaje * total / 100), 0) +
+            COALESCE(SUM(descuento_global_fijo), 0) as total_descuentos,
+            COALESCE(SUM(retencion_irpf * subtotal / 100), 0) as total_retencion_irpf
+        FROM facturas f {where_sql}
+    """, tuple(params))[0]
+    mensual = db.execute_query(f"""
+        SELECT strftime('%Y-%m', f.fecha_creacion) as mes, COUNT(*) as cantidad,
+            COALESCE(SUM(CASE WHEN estado_pago = 'Pagada' THEN total ELSE 0 END), 0) as valor_pagado,
+            COALESCE(SUM(CASE WHEN estado_pago = 'No Pagada' THEN total ELSE 0 END), 0) as valor_pendiente,
+            COALESCE(estado_pago, 'No Pagada') as estado_pago
+        FROM facturas f {where_sql}
+        GROUP BY strftime('%Y-%m', f.fecha_creacion), COALESCE(estado_pago, 'No Pagada')
+        ORDER BY mes
+    """, tuple(params))
+    return dict(valores, total_emitidas=sum(estados.values()), pagadas=estados.get('Pagada', 0),
+                no_pagadas=estados.get('No Pagada', 0), evolucion_mensual=mensual)
+
+
+@pytest.mark.parametrize('rango', [(None, None), ('2024-02-10', '2024-05-20'), ('2024-03-01', '2024-03-31')])
+def test_estadisticas_de_facturas_coinciden_con_las_originales(contexto, rango):
+    aleatorio = random.Random(23)
+    _cargar(contexto, aleatorio)
+    _modificar(contexto, aleatorio)
+    db = contexto.db
+    # Hay facturas sin estado en el rango: cuentan como 'No Pagada' pero no suman a lo pendiente
+    assert db.execute_query("SELECT COUNT(*) as n FROM facturas WHERE estado_pago IS NULL")[0]['n']
+
+    obtenido = contexto.facturas.obtener_estadisticas_facturas(*rango)
+    esperado = _estadisticas_originales(db, *rango)
+    cantidad = esperado['total_emitidas']
+
+    for clave in ('total_emitidas', 'pagadas', 'no_pagadas'):
+        assert obtenido[clave] == esperado[clave], clave
+    for clave in ('total_facturado', 'total_pendiente_cobro', 'promedio_factura', 'factura_max', 'factura_min'):
+        assert obtenido[clave] == pytest.approx(esperado[clave], abs=0.005), clave
+    # Descuentos y retenciones se redondean al céntimo por factura
+    for clave in ('total_descuentos', 'total_retencion_irpf'):
+        assert obtenido[clave] == pytest.approx(esperado[clave], abs=0.005 * cantidad), clave
+
+    for fila, original in zip(obtenido['evolucion_mensual'], esperado['evolucion_mensual']):
+        assert (fila['mes'], fila['estado_pago'], fila['cantidad']) == \
+            (original['mes'], original['estado_pago'], original['cantidad'])
+        assert fila['valor_pagado'] == pytest.approx(original['valor_pagado'], abs=0.005)
+        assert fila['valor_pendiente'] == pytest.approx(original['valor_pendiente'], abs=0.005)
+    assert len(obtenido['evolucion_mensual']) == len(esperado['evolucion_mensual'])
+
+
+def test_evolucion_mensual_excluye_de_lo_pendiente_las_facturas_sin_estado(contexto):
+    db = contexto.db
+    db.execute_update("INSERT INTO clientes (nombre) VALUES ('Ana')")
+    hoy = date.today().strftime('%Y-%m-%d')
+    db.execute_many("""
+        INSERT INTO facturas (numero_factura, cliente_id, fecha_creacion, subtotal, iva, total, estado_pago)
+        VALUES (?, 1, ?, ?, 0, ?, ?)
+    """, [('F1', hoy, 100, 100, 'No Pagada'), ('F2', hoy, 40, 40, None), ('F3', hoy, 10, 10, 'Pagada')])
+
+    mes = contexto.facturas.obtener_evolucion_facturacion_mensual()[-1]
+    assert (mes['cantidad_facturas'], mes['facturacion_total']) == (3, 150)
+    assert (mes['facturacion_pendiente'], mes['facturacion_pagada']) == (100, 10)
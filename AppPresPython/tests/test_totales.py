@@ -0,0 +1,219 @@
+"""
+Motor de totales: el cálculo por lotes y el acumulador coinciden con el cálculo de un
+documento, y los resultados coinciden con las fórmulas originales (en coma flotante)
+salvo el redondeo al céntimo.
+"""
+
+import random
+
+import pytest
+
+from presupuestos.totales import IVA_GENERAL, AcumuladorTotales, calcular_totales, calcular_totales_lote
+
+CLAVES_IMPORTE = ('subtotal', 'descuentos_items', 'descuento_global', 'iva', 'total')
+
+
+def _item(aleatorio, con_tipos=False):
+    item = {
+        'cantidad': aleatorio.choice([1, 2, 3, 0.5, 2.75, 12]),
+        'precio_unitario': round(aleatorio.uniform(0.01, 500), 2),
+        'aplica_iva': aleatorio.random() < 0.8,
+    }
+    descuento = aleatorio.random()
+    if descuento < 0.3:
+        item['descuento_porcentaje'] = aleatorio.choice([5, 12.5, 33])
+    elif descuento < 0.5:
+        item['descuento_fijo'] = aleatorio.choice([1.5, 10, 1000])
+    if con_tipos:
+        item['iva_porcentaje'] = aleatorio.choice([21.0, 10.0, 4.0, 0.0])
+    return item
+
+
+def _documento(aleatorio, con_tipos=False, con_irpf=False):
+    documento = {
+        'items': [_item(aleatorio, con_tipos) for _ in range(aleatorio.randint(0, 8))],
+        'descuento_antes_iva': aleatorio.random() < 0.5,
+        'iva_habilitado': aleatorio.random() < 0.9,
+    }
+    global_ = aleatorio.random()
+    if global_ < 0.3:
+        documento['descuento_global_porcentaje'] = aleatorio.choice([5, 10, 7.5])
+    elif global_ < 0.5:
+        documento['descuento_global_fijo'] = aleatorio.choice([3, 25.5, 5000])
+    if con_irpf and aleatorio.random() < 0.5:
+        documento['retencion_irpf'] = aleatorio.choice([7.0, 15.0])
+    return documento
+
+
+def _argumentos(documento):
+    return (documento.get('descuento_global_porcentaje', 0), documento.get('descuento_global_fijo', 0),
+            documento['descuento_antes_iva'], documento['iva_habilitado'], documento.get('retencion_irpf'))
+
+
+# -- Fórmulas originales (coma flotante), como referencia ----------------------------
+
+def _lineas_referencia(items):
+    for item in items:
+        bruto = item['cantidad'] * item['precio_unitario']
+        descuento = 0.0
+        if item.get('descuento_porcentaje', 0) > 0:
+            descuento = bruto * (item['descuento_porcentaje'] / 100)
+        elif item.get('descuento_fijo', 0) > 0:
+            descuento = min(item['descuento_fijo'], bruto)
+        yield item, bruto - descuento, descuento
+
+
+def _referencia_presupuesto(items, porcentaje=0, fijo=0, antes_iva=True, iva_habilitado=True, _irpf=None):
+    if items and not any(item.get('aplica_iva', True) for item in items):
+        iva_habilitado = False
+    subtotal = descuentos = iva_base = 0.0
+    for item, neto, descuento in _lineas_referencia(items):
+        subtotal += neto
+        descuentos += descuento
+        if item.get('aplica_iva', True) and iva_habilitado:
+            iva_base += neto * (IVA_GENERAL / 100)
+    descuento_global = 0.0
+    if antes_iva:
+        if porcentaje > 0:
+            descuento_global = subtotal * (porcentaje / 100)
+        elif fijo > 0:
+            descuento_global = min(fijo, subtotal)
+        iva = iva_base * ((subtotal - descuento_global) / subtotal) if subtotal > 0 else 0.0
+        total = subtotal - descuento_global + iva
+    else:
+        iva = iva_base
+        if porcentaje > 0:
+            descuento_global = (subtotal + iva) * (porcentaje / 100)
+        elif fijo > 0:
+            descuento_global = min(fijo, subtotal + iva)
+        total = subtotal + iva - descuento_global
+    return {'subtotal': subtotal, 'descuentos_items': descuentos, 'descuento_global': descuento_global,
+            'iva': iva, 'total': total}
+
+
+def _referencia_factura(items, porcentaje=0, fijo=0, antes_iva=True, iva_habilitado=True, irpf=None):
+    if items and not any(item.get('aplica_iva', True) for item in items):
+        iva_habilitado = False
+    subtotal = descuentos = 0.0
+    bases = {}
+    for item, neto, descuento in _lineas_referencia(items):
+        subtotal += neto
+        descuentos += descuento
+        tipo = float(item.get('iva_porcentaje', IVA_GENERAL))
+        if item.get('aplica_iva', True) and iva_habilitado and tipo > 0:
+            bases[tipo] = bases.get(tipo, 0.0) + neto
+    descuento_global = 0.0
+    if porcentaje > 0:
+        descuento_global = subtotal * (porcentaje / 100)
+    elif fijo > 0:
+        descuento_global = min(fijo, subtotal)
+    base_imponible = subtotal - descuento_global
+    factor = (base_imponible / subtotal if subtotal > 0 else 0) if antes_iva else 1
+    iva = sum(base * factor * (tipo / 100) for tipo, base in bases.items())
+    retencion = base_imponible * (irpf / 100) if irpf else 0.0
+    return {'subtotal': subtotal, 'descuentos_items': descuentos, 'descuento_global': descuento_global,
+            'iva': iva, 'retencion_irpf': retencion, 'total': base_imponible + iva - retencion}
+
+
+def _tolerancia(documento):
+    # Cada línea, descuento y cuota se redondea al céntimo una vez
+    return 0.01 * (len(documento['items']) + 4)
+
+
+# -- Cálculo por lotes ----------------------------------------------------------------
+
+@pytest.mark.parametrize('descuento_sobre_total', [False, True])
+def test_lote_coincide_con_documento_a_documento(descuento_sobre_total):
+    aleatorio = random.Random(11)
+    documentos = [_documento(aleatorio, con_tipos=True, con_irpf=True) for _ in range(300)]
+
+    lote = calcular_totales_lote(documentos, descuento_sobre_total=descuento_sobre_total)
+
+    assert lote == [calcular_totales(documento['items'], *_argumentos(documento),
+                                     descuento_sobre_total=descuento_sobre_total)
+                    for documento in documentos]
+
+
+def test_lote_vacio_y_documento_sin_items():
+    assert calcular_totales_lote([]) == []
+    assert calcular_totales_lote([{'items': []}])[0]['total'] == 0
+
+
+def test_presupuestos_coinciden_con_la_formula_original(contexto):
+    aleatorio = random.Random(12)
+    for _ in range(300):
+        documento = _documento(aleatorio)
+        obtenido = contexto.presupuestos.calcular_totales_completo(documento['items'], *_argumentos(documento)[:4])
+        esperado = _referencia_presupuesto(documento['items'], *_argumentos(documento))
+        for clave in CLAVES_IMPORTE:
+            assert obtenido[clave] == pytest.approx(esperado[clave], abs=_tolerancia(documento)), (documento, clave)
+
+
+def test_facturas_coinciden_con_la_formula_original(contexto):
+    aleatorio = random.Random(13)
+    for _ in range(300):
+        documento = _documento(aleatorio, con_tipos=True, con_irpf=True)
+        obtenido = contexto.facturas.calcular_totales_completo(documento['items'], *_argumentos(documento))
+        esperado = _referencia_factura(documento['items'], *_argumentos(documento))
+        for clave in CLAVES_IMPORTE + ('retencion_irpf',):
+            assert obtenido[clave] == pytest.approx(esperado[clave], abs=_tolerancia(documento)), (documento, clave)
+
+
+def test_descuento_despues_de_iva_segun_tipo_de_documento():
+    items = [{'cantidad': 1, 'precio_unitario': 100.0}]
+    # Presupuestos: el descuento global se aplica sobre subtotal + IVA
+    presupuesto = calcular_totales(items, 10, 0, False, True, descuento_sobre_total=True)
+    assert (presupuesto['descuento_global'], presupuesto['iva'], presupuesto['total']) == (12.1, 21.0, 108.9)
+    # Facturas: sobre el subtotal y el IVA no se prorratea
+    factura = calcular_totales(items, 10, 0, False, True, retencion_irpf=15.0)
+    assert (factura['descuento_global'], factura['base_imponible'], factura['iva']) == (10.0, 90.0, 21.0)
+    assert (factura['retencion_irpf'], factura['total']) == (13.5, 97.5)
+
+
+# -- Acumulador del editor --------------------------------------------------------------
+
+@pytest.mark.parametrize('descuento_sobre_total', [False, True])
+def test_acumulador_coincide_con_recalcular_tras_cada_cambio(descuento_sobre_total):
+    aleatorio = random.Random(13)
+    acumulador = AcumuladorTotales(descuento_sobre_total=descuento_sobre_total)
+    items = []
+    for _ in range(500):
+        operacion = aleatorio.random()
+        if operacion < 0.5 or not items:
+            item = _item(aleatorio, con_tipos=True)
+            items.append(item)
+            acumulador.agregar(item)
+        elif operacion < 0.75:
+            acumulador.eliminar(items.pop(aleatorio.randrange(len(items))))
+        else:
+            item = aleatorio.choice(items)
+            item.update(_item(aleatorio, con_tipos=True))
+            item.pop('descuento_porcentaje' if aleatorio.random() < 0.5 else 'descuento_fijo', None)
+            acumulador.reemplazar(item)
+
+        argumentos = _argumentos(_documento(aleatorio, con_irpf=True))
+        assert len(acumulador) == len(items)
+        assert acumulador.totales(*argumentos) == calcular_totales(
+            items, *argumentos, descuento_sobre_total=descuento_sobre_total)
+
+
+def test_acumulador_quita_tipos_sin_lineas_del_desglose():
+    acumulador = AcumuladorTotales()
+    general = {'cantidad': 1, 'precio_unitario': 100.0}
+    reducido = {'cantidad': 1, 'precio_unitario': 50.0, 'iva_porcentaje': 10.0}
+    acumulador.reiniciar([general, reducido])
+    assert set(acumulador.totales()['iva_breakdown']) == {21.0, 10.0}
+
+    acumulador.eliminar(reducido)
+    assert set(acumulador.totales()['iva_breakdown']) == {21.0}
+    assert acumulador.totales() == calcular_totales([general])
+
+
+def test_acumulador_agregar_dos_veces_el_mismo_item():
+    acumulador = AcumuladorTotales()
+    item = {'cantidad': 2, 'precio_unitario': 10.0}
+    acumulador.agregar(item)
+    item['cantidad'] = 3
+    acumulador.agregar(item)
+    assert len(acumulador) == 1
+    assert acumulador.totales()['subtotal'] == 30.0
@@ -0,0 +1,73 @@
+"""
+db.transaction(): commit único al salir y rollback completo ante una excepción.
+"""
+
+import sqlite3
+
+import pytest
+
+
+def _clientes(db):
+    return [fila['nombre'] for fila in db.execute_query("SELECT nombre FROM clientes ORDER BY id")]
+
+
+def test_confirma_al_salir_del_bloque(contexto):
+    db = contexto.db
+    with db.transaction():
+        db.execute_update("INSERT INTO clientes (nombre) VALUES ('Ana')")
+        db.execute_update("INSERT INTO clientes (nombre) VALUES ('Luis')")
+
+    # Visible desde otra conexión: el commit se ha hecho
+    otra = sqlite3.connect(db.db_path)
+    try:
+        assert otra.execute("SELECT COUNT(*) FROM clientes").fetchone()[0] == 2
+    finally:
+        otra.close()
+
+
+def test_excepcion_deshace_todas_las_escrituras(contexto):
+    db = contexto.db
+    db.execute_update("INSERT INTO clientes (nombre) VALUES ('Previo')")
+
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.execute_update("INSERT INTO clientes (nombre) VALUES ('Ana')")
+            db.execute_update("UPDATE clientes SET nombre = 'Cambiado' WHERE nombre = 'Previo'")
+            raise RuntimeError("fallo a mitad")
+
+    assert _clientes(db) == ['Previo']
+    assert not db.get_connection().in_transaction
+
+
+def test_error_de_sqlite_deshace_la_cabecera(contexto):
+    db = contexto.db
+    with pytest.raises(sqlite3.IntegrityError):
+        with db.transaction():
+            db.execute_update("INSERT INTO clientes (nombre) VALUES ('Ana')")
+            db.execute_update("INSERT INTO clientes (nombre) VALUES (NULL)")
+
+    assert _clientes(db) == []
+
+
+def test_transaccion_anidada_se_une_a_la_exterior(contexto):
+    db = contexto.db
+    with pytest.raises(ValueError):
+        with db.transaction():
+            db.execute_update("INSERT INTO clientes (nombre) VALUES ('Ana')")
+            with db.transaction():
+                db.execute_update("INSERT INTO clientes (nombre) VALUES ('Luis')")
+            # El bloque interior no ha confirmado nada por su cuenta
+            raise ValueError("fallo tras el bloque interior")
+
+    assert _clientes(db) == []
+
+
+def test_escritura_tras_rollback_funciona(contexto):
+    db = contexto.db
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.execute_update("INSERT INTO clientes (nombre) VALUES ('Ana')")
+            raise RuntimeError()
+
+    db.execute_update("INSERT INTO clientes (nombre) VALUES ('Luis')")
+    assert _clientes(db) == ['Luis']
@@ -12,8 +12,15 @@ from presupuestos.clientes import cliente_manager
 from presupuestos.materiales import material_manager
 from presupuestos.presupuestos import presupuesto_manager
 from presupuestos.facturas import factura_manager
-from presupuestos.utils import db
+from presupuestos.utils import db, ROW_RECORD
+from presupuestos.dinero import importe_linea
+from presupuestos.totales import AcumuladorTotales
 from presupuestos.pdf_generator import PDFGenerator
+from .tree_sync import SincronizadorFilas
+from .virtual_tree import ListaVirtual
+from .busqueda_async import ProgramadorBusquedas
+from .combo_ids import ComboPorId
+from .cronometro import Cronometro
 from presupuestos.email_sender import email_sender
 
 
@@ -31,48 +38,45 @@ MESES_NOMBRES = {
     '11': 'Noviembre',
     '12': 'Diciembre'
 }
-try:
-    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-    from matplotlib.figure import Figure
-    MATPLOTLIB_AVAILABLE = True
-except ImportError as e:
-    MATPLOTLIB_AVAILABLE = False
-    import sys
-    import os
-    current_python = sys.executable
-    
-    # Verificar si estamos en el venv
-    # __file__ está en ui/app.py, necesitamos ir dos niveles arriba
-    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    venv_python = os.path.join(project_root, 'venv', 'Scripts', 'python.exe')
-    is_venv = 'venv' in current_python.lower() or os.path.exists(venv_python)
-    
-    if not is_venv:
-        print(f"⚠️ ADVERTENCIA: No estás usando el Python del entorno virtual.")
-        print(f"Python actual: {current_python}")
-        print(f"Para usar el venv, ejecuta desde la terminal:")
-        print(f"  .\\venv\\Scripts\\python.exe main.py")
-        print(f"O usa el script: .\\scripts\\iniciar_app.ps1")
-    else:
-        print(f"⚠️ Error: matplotlib no está disponible en este intérprete.")
-        print(f"Python actual: {current_python}")
-        print(f"Por favor ejecuta: .\\venv\\Scripts\\python.exe -m pip install matplotlib")
-    
-    print(f"Error detallado: {e}")
-    
-    # Crear clases dummy para evitar errores
-    class FigureCanvasTkAgg:
-        def __init__(self, *args, **kwargs):
-            pass
-        def get_tk_widget(self):
-            return None
-        def draw(self):
-            pass
-    class Figure:
-        def __init__(self, *args, **kwargs):
-            pass
-        def add_subplot(self, *args, **kwargs):
-            return None
+# matplotlib es lo más lento de importar: se carga al abrir la pestaña de Métricas
+MATPLOTLIB_AVAILABLE = None
+FigureCanvasTkAgg = None
+Figure = None
+
+
+def _importar_matplotlib() -> bool:
+    """Importa matplotlib la primera vez que se necesita e indica si está disponible"""
+    global MATPLOTLIB_AVAILABLE, FigureCanvasTkAgg, Figure
+    if MATPLOTLIB_AVAILABLE is not None:
+        return MATPLOTLIB_AVAILABLE
+    try:
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+        MATPLOTLIB_AVAILABLE = True
+    except ImportError as e:
+        MATPLOTLIB_AVAILABLE = False
+        import sys
+        current_python = sys.executable
+        
+        # Verificar si estamos en el venv
+        # __file__ está en ui/app.py, necesitamos ir dos niveles arriba
+        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        venv_python = os.path.join(project_root, 'venv', 'Scripts', 'python.exe')
+        is_venv = 'venv' in current_python.lower() or os.path.exists(venv_python)
+        
+        if not is_venv:
+            print(f"⚠️ ADVERTENCIA: No estás usando el Python del entorno virtual.")
+            print(f"Python actual: {current_python}")
+            print(f"Para usar el venv, ejecuta desde la terminal:")
+            print(f"  .\\venv\\Scripts\\python.exe main.py")
+            print(f"O usa el script: .\\scripts\\iniciar_app.ps1")
+        else:
+            print(f"⚠️ Error: matplotlib no está disponible en este intérprete.")
+            print(f"Python actual: {current_python}")
+            print(f"Por favor ejecuta: .\\venv\\Scripts\\python.exe -m pip install matplotlib")
+        
+        print(f"Error detallado: {e}")
+    return MATPLOTLIB_AVAILABLE
 
 def _get_project_root():
     """Raíz del proyecto (donde está main.py)."""
@@ -85,8 +89,9 @@ def _get_default_logo_path():
 
 
 class AppPresupuestos:
-    def __init__(self, root):
+    def __init__(self, root, cronometro=None):
         self.root = root
+        self.cronometro = cronometro or Cronometro()
         self.root.title("Sistema de Gestión de Presupuestos")
         self.root.geometry("1200x800")
         self.root.minsize(900, 600)
@@ -106,6 +111,15 @@ class AppPresupuestos:
         self.plantilla_config = self.cargar_configuracion_plantilla()
         self.pdf_generator = PDFGenerator(self.plantilla_config)
         
+        # Búsquedas mientras se escribe: con debounce y fuera del hilo de Tk
+        self.busquedas = ProgramadorBusquedas(self.root)
+        
+        # Métricas: consultas en su propio hilo de trabajo, un panel por clave
+        self.cargas_metricas = ProgramadorBusquedas(self.root, retardo_ms=0)
+        # Filtro y generación de la base de datos que muestra cada panel de métricas
+        self._vistas_metricas = {}
+        self._metricas_cargando = set()
+        
         # Contenedor principal
         main_container = ttk.Frame(root)
         main_container.pack(fill='both', expand=True, padx=0, pady=0)
@@ -117,27 +131,67 @@ class AppPresupuestos:
         self.notebook = ttk.Notebook(main_container)
         self.notebook.pack(fill='both', expand=True, padx=12, pady=(0, 12))
         
-        # Crear las pestañas
-        self.create_clientes_tab()
-        self.create_materiales_tab()
-        self.create_presupuestos_tab()
-        self.create_ver_presupuestos_tab()
-        self.create_facturacion_tab()
-        self.create_metricas_tab()
-        
-        # Cargar datos iniciales
-        self.refresh_clientes()
-        self.refresh_materiales()
-        self.refresh_presupuestos()
-        self.refresh_facturas()
+        # Las pestañas se añaden vacías; cada una se construye y carga sus datos
+        # la primera vez que se abre
+        self._pestanas_pendientes = {}
+        self._efectos_aplicados = False
+        for atributo, titulo, construir, cargar in (
+            ('clientes_frame', "Gestión de Clientes", self.create_clientes_tab, self.refresh_clientes),
+            ('materiales_frame', "Gestión de Materiales", self.create_materiales_tab, self.refresh_materiales),
+            ('presupuestos_frame', "Crear Presupuesto", self.create_presupuestos_tab, self.cargar_pestana_presupuestos),
+            ('ver_presupuestos_frame', "Ver Presupuestos", self.create_ver_presupuestos_tab, self.refresh_presupuestos),
+            ('facturacion_frame', "Facturación", self.create_facturacion_tab, self.refresh_facturas),
+            ('metricas_frame', "Métricas", self.create_metricas_tab, None),
+        ):
+            marco = ttk.Frame(self.notebook)
+            setattr(self, atributo, marco)
+            self.notebook.add(marco, text=titulo)
+            self._pestanas_pendientes[str(marco)] = (construir, cargar)
+        self.cronometro.fase("ventana principal")
+        
+        self._construir_pestana(self.notebook.select())
+        self.notebook.bind('<<NotebookTabChanged>>', self._on_pestana_cambiada)
+        self.root.after_idle(lambda: self.cronometro.fase("primera pintura"))
         
         # Apply hover effects
-        from .styles import apply_hover_effects
-        self.root.after(500, lambda: apply_hover_effects(self.root))
+        self.root.after(500, self._aplicar_efectos_hover)
         
         # Configurar evento de cierre para guardar configuración
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
     
+    def _on_pestana_cambiada(self, event=None):
+        """Construye la pestaña seleccionada si aún no se había abierto"""
+        self._construir_pestana(self.notebook.select())
+    
+    def _construir_pestana(self, marco_id):
+        """Construye el contenido de una pestaña pendiente y carga sus datos"""
+        pendiente = self._pestanas_pendientes.pop(str(marco_id), None)
+        if pendiente is None:
+            return
+        construir, cargar = pendiente
+        construir()
+        if cargar:
+            cargar()
+        if self._efectos_aplicados:
+            from .styles import apply_hover_effects
+            apply_hover_effects(self.root.nametowidget(marco_id))
+        self.cronometro.fase(f"pestaña {self.notebook.tab(marco_id, 'text')}")
+    
+    def _aplicar_efectos_hover(self):
+        """Efectos hover en los widgets ya creados; las pestañas posteriores los reciben al construirse"""
+        from .styles import apply_hover_effects
+        apply_hover_effects(self.root)
+        self._efectos_aplicados = True
+    
+    def _pestana_construida(self, marco) -> bool:
+        """Indica si el contenido de la pestaña ya se ha construido"""
+        return str(marco) not in self._pestanas_pendientes
+    
+    def cargar_pestana_presupuestos(self):
+        """Carga los combos de clientes y materiales de la pestaña Crear Presupuesto"""
+        self.actualizar_combo_clientes()
+        self.actualizar_combo_materiales()
+    
     def _get_logo_path_for_app(self):
         """Ruta del logo: plantilla si el usuario configuró uno, si no logo por defecto (Noemí)."""
         logo_cfg = self.plantilla_config.get('logo', {})
@@ -226,8 +280,6 @@ class AppPresupuestos:
     
     def create_clientes_tab(self):
         """Crea la pestaña de gestión de clientes"""
-        self.clientes_frame = ttk.Frame(self.notebook)
-        self.notebook.add(self.clientes_frame, text="Gestión de Clientes")
         
         # Frame principal con scroll
         main_frame = ttk.Frame(self.clientes_frame)
@@ -280,7 +332,8 @@ class AppPresupuestos:
         
         # Treeview para mostrar clientes
         columns = ('ID', 'Nombre', 'Teléfono', 'Email', 'Dirección', 'DNI')
-        self.clientes_tree = ttk.Treeview(main_frame, columns=columns, show='headings', height=15)
+        self.clientes_tree = ListaVirtual(main_frame, formatear=self.fila_cliente,
+                                          columns=columns, show='headings', height=15)
         
         for col in columns:
             self.clientes_tree.heading(col, text=col)
@@ -298,8 +351,6 @@ class AppPresupuestos:
     
     def create_materiales_tab(self):
         """Crea la pestaña de gestión de materiales"""
-        self.materiales_frame = ttk.Frame(self.notebook)
-        self.notebook.add(self.materiales_frame, text="Gestión de Materiales")
         
         # Frame principal
         main_frame = ttk.Frame(self.materiales_frame)
@@ -344,7 +395,8 @@ class AppPresupuestos:
         
         # Treeview para mostrar materiales
         columns = ('ID', 'Nombre', 'Unidad', 'Precio Unitario')
-        self.materiales_tree = ttk.Treeview(main_frame, columns=columns, show='headings', height=15)
+        self.materiales_tree = ListaVirtual(main_frame, formatear=self.fila_material,
+                                            columns=columns, show='headings', height=15)
         
         for col in columns:
             self.materiales_tree.heading(col, text=col)
@@ -362,8 +414,6 @@ class AppPresupuestos:
     
     def create_presupuestos_tab(self):
         """Crea la pestaña de creación de presupuestos"""
-        self.presupuestos_frame = ttk.Frame(self.notebook)
-        self.notebook.add(self.presupuestos_frame, text="Crear Presupuesto")
         
         # Frame principal con scrollbar
         main_frame = ttk.Frame(self.presupuestos_frame)
@@ -416,6 +466,7 @@ class AppPresupuestos:
         self.cliente_var = tk.StringVar()
         self.cliente_combo = ttk.Combobox(cliente_frame, textvariable=self.cliente_var, width=40, state='readonly', style='TCombobox')
         self.cliente_combo.pack(side='left', padx=(0, 10))
+        self.combo_clientes = ComboPorId(self.cliente_combo, self.etiqueta_cliente)
         
         # Frame para agregar materiales
         material_frame = ttk.LabelFrame(scrollable_frame, text="Agregar Material", padding=10)
@@ -474,6 +525,7 @@ class AppPresupuestos:
         # Treeview para items
         columns = ('Visible', 'IVA', 'Tipo', 'Descripción', 'Cantidad', 'Precio Unit.', 'Desc. %', 'Desc. €', 'Subtotal')
         self.items_tree = ttk.Treeview(items_list_frame, columns=columns, show='headings', height=10)
+        self.items_tree_sync = SincronizadorFilas(self.items_tree)
         
         for col in columns:
             self.items_tree.heading(col, text=col)
@@ -588,14 +640,14 @@ class AppPresupuestos:
         
         # Lista para almacenar items del presupuesto
         self.presupuesto_items = []
-        self.materiales_data = {}  # Para almacenar datos de materiales
+        # Totales acumulados línea a línea (se actualizan al añadir/editar/eliminar items)
+        self.acumulador_presupuesto = AcumuladorTotales(presupuesto_manager.iva_porcentaje,
+                                                        descuento_sobre_total=True)
         
         self.actualizar_label_carpeta_pdfs()
     
     def create_ver_presupuestos_tab(self):
         """Crea la pestaña para ver presupuestos existentes"""
-        self.ver_presupuestos_frame = ttk.Frame(self.notebook)
-        self.notebook.add(self.ver_presupuestos_frame, text="Ver Presupuestos")
         
         # Canvas y scrollbar para permitir desplazamiento
         canvas = tk.Canvas(self.ver_presupuestos_frame, bg=self.palette["app_bg"], highlightthickness=0)
@@ -694,7 +746,8 @@ class AppPresupuestos:
         tree_container.pack(fill='both', expand=True)
 
         columns = ('ID', 'Cliente', 'Fecha', 'Subtotal', 'IVA', 'Total', 'Estado')
-        self.presupuestos_tree = ttk.Treeview(tree_container, columns=columns, show='headings', height=18)
+        self.presupuestos_tree = ListaVirtual(tree_container, formatear=self.fila_presupuesto,
+                                              columns=columns, show='headings', height=18)
         
         for col in columns:
             self.presupuestos_tree.heading(col, text=col)
@@ -852,36 +905,61 @@ class AppPresupuestos:
     
     def buscar_clientes(self, event=None):
         termino = self.busqueda_entry.get().strip()
-        if termino:
-            clientes = cliente_manager.buscar_clientes(termino)
-        else:
-            clientes = cliente_manager.obtener_clientes()
-        
-        self.actualizar_tree_clientes(clientes)
+        contar, cargar = self._origen_clientes(termino)
+        # Al teclear se espera a que el usuario pare; el botón busca al instante
+        self._buscar_en_segundo_plano(self.clientes_tree, 'clientes', contar, cargar, ('clientes', termino),
+                                      retardo_ms=None if event is not None else 0)
     
     def refresh_clientes(self):
-        clientes = cliente_manager.obtener_clientes()
-        self.actualizar_tree_clientes(clientes)
-        self.actualizar_combo_clientes()
+        self.actualizar_tree_clientes()
+        # Los combos de otras pestañas solo existen si ya se han abierto
+        if self._pestana_construida(self.presupuestos_frame):
+            self.actualizar_combo_clientes()
+        if self._pestana_construida(self.facturacion_frame):
+            self.actualizar_combo_clientes_factura()
+    
+    def _origen_clientes(self, termino: str):
+        """Funciones (contar, cargar) del listado paginado de clientes"""
+        def cargar(desplazamiento, limite):
+            if termino:
+                return cliente_manager.buscar_clientes(termino, row_mode=ROW_RECORD,
+                                                       limite=limite, desplazamiento=desplazamiento)
+            return cliente_manager.obtener_clientes(row_mode=ROW_RECORD, limite=limite,
+                                                    desplazamiento=desplazamiento)
+        
+        return (lambda: cliente_manager.contar_clientes(termino)), cargar
+    
+    def actualizar_tree_clientes(self, termino: str = ''):
+        """Enlaza el listado virtual de clientes con la consulta paginada"""
+        contar, cargar = self._origen_clientes(termino)
+        self.clientes_tree.cargar_origen(contar, cargar, clave_origen=('clientes', termino))
+    
+    def _buscar_en_segundo_plano(self, tree, clave, contar, cargar, clave_origen, retardo_ms=None):
+        """Consulta el total y la primera página fuera del hilo de Tk y después enlaza el listado"""
+        tamano = tree.tamano_pagina
+        self.busquedas.programar(
+            clave,
+            lambda: (contar(), cargar(0, tamano)),
+            lambda resultado: tree.cargar_origen(contar, cargar, clave_origen,
+                                                 total=resultado[0], primera_pagina=resultado[1]),
+            retardo_ms=retardo_ms
+        )
     
-    def actualizar_tree_clientes(self, clientes):
-        for item in self.clientes_tree.get_children():
-            self.clientes_tree.delete(item)
-        
-        for cliente in clientes:
-            self.clientes_tree.insert('', 'end', values=(
-                cliente['id'],
-                cliente['nombre'],
-                cliente['telefono'] or '',
-                cliente['email'] or '',
-                cliente['direccion'] or '',
-                cliente['dni'] or ''
-            ))
+    def fila_cliente(self, cliente):
+        return cliente['id'], (
+            cliente['id'],
+            cliente['nombre'],
+            cliente['telefono'] or '',
+            cliente['email'] or '',
+            cliente['direccion'] or '',
+            cliente['dni'] or ''
+        )
+    
+    def etiqueta_cliente(self, cliente):
+        return f"{cliente['id']} - {cliente['nombre']}"
     
     def actualizar_combo_clientes(self):
-        clientes = cliente_manager.obtener_clientes()
-        cliente_names = [f"{c['id']} - {c['nombre']}" for c in clientes]
-        self.cliente_combo['values'] = cliente_names
+        self.combo_clientes.cargar(cliente_manager.directorio().todos())
     
     # Métodos para gestión de materiales
     def agregar_material(self):
@@ -969,35 +1047,43 @@ class AppPresupuestos:
     
     def buscar_materiales(self, event=None):
         termino = self.material_busqueda_entry.get().strip()
-        if termino:
-            materiales = material_manager.buscar_materiales(termino)
-        else:
-            materiales = material_manager.obtener_materiales()
-        
-        self.actualizar_tree_materiales(materiales)
+        contar, cargar = self._origen_materiales(termino)
+        self._buscar_en_segundo_plano(self.materiales_tree, 'materiales', contar, cargar, ('materiales', termino),
+                                      retardo_ms=None if event is not None else 0)
     
     def refresh_materiales(self):
-        materiales = material_manager.obtener_materiales()
-        self.actualizar_tree_materiales(materiales)
-        self.actualizar_combo_materiales()
-    
-    def actualizar_tree_materiales(self, materiales):
-        for item in self.materiales_tree.get_children():
-            self.materiales_tree.delete(item)
-        
-        for material in materiales:
-            self.materiales_tree.insert('', 'end', values=(
-                material['id'],
-                material['nombre'],
-                material['unidad_medida'],
-                f"€{material['precio_unitario']:.2f}"
-            ))
+        self.actualizar_tree_materiales()
+        if self._pestana_construida(self.presupuestos_frame):
+            self.actualizar_combo_materiales()
+    
+    def _origen_materiales(self, termino: str):
+        """Funciones (contar, cargar) del listado paginado de materiales"""
+        def cargar(desplazamiento, limite):
+            if termino:
+                return material_manager.buscar_materiales(termino, row_mode=ROW_RECORD,
+                                                          limite=limite, desplazamiento=desplazamiento)
+            return material_manager.obtener_materiales(row_mode=ROW_RECORD, limite=limite,
+                                                       desplazamiento=desplazamiento)
+        
+        return (lambda: material_manager.contar_materiales(termino)), cargar
+    
+    def actualizar_tree_materiales(self, termino: str = ''):
+        """Enlaza el listado virtual de materiales con la consulta paginada"""
+        contar, cargar = self._origen_materiales(termino)
+        self.materiales_tree.cargar_origen(contar, cargar, clave_origen=('materiales', termino))
+    
+    def fila_material(self, material):
+        return material['id'], (
+            material['id'],
+            material['nombre'],
+            material['unidad_medida'],
+            f"€{material['precio_unitario']:.2f}"
+        )
     
     def actualizar_combo_materiales(self):
-        materiales = material_manager.obtener_materiales()
+        materiales = material_manager.catalogo().todos()
         material_names = [f"{m['id']} - {m['nombre']} ({m['unidad_medida']})" for m in materiales]
         self.material_combo['values'] = material_names
-        self.materiales_data = {m['id']: m for m in materiales}
         # Cargar materiales más utilizados
         self.cargar_materiales_mas_utilizados()
     
@@ -1038,13 +1124,8 @@ class AppPresupuestos:
         if ' - ' in termino_original:
             termino_original = termino_original.split(' - ', 1)[1].split(' (')[0]
         
-        termino = termino_original.lower()
-        if not termino:
-            # Si no hay término, mostrar todos
-            materiales = material_manager.obtener_materiales()
-        else:
-            # Buscar materiales
-            materiales = material_manager.buscar_materiales(termino)
+        # Filtrado en memoria sobre el catálogo (sin término devuelve todos)
+        materiales = material_manager.filtrar_materiales(termino_original)
         
         # Actualizar combo con materiales filtrados
         material_names = [f"{m['id']} - {m['nombre']} ({m['unidad_medida']})" for m in materiales]
@@ -1097,7 +1178,10 @@ class AppPresupuestos:
             # Obtener ID del material seleccionado
             material_text = self.material_var.get()
             material_id = int(material_text.split(' - ')[0])
-            material = self.materiales_data[material_id]
+            material = material_manager.catalogo().material(material_id)
+            if material is None:
+                messagebox.showerror("Error", "El material seleccionado ya no existe")
+                return
             
             # Crear item
             item = {
@@ -1107,7 +1191,7 @@ class AppPresupuestos:
                 'unidad_medida': material['unidad_medida'],
                 'cantidad': cantidad,
                 'precio_unitario': material['precio_unitario'],
-                'subtotal': cantidad * material['precio_unitario'],
+                'subtotal': importe_linea(cantidad, material['precio_unitario']),
                 'visible_pdf': 1,
                 'es_tarea_manual': 0,
                 'aplica_iva': True,
@@ -1116,6 +1200,7 @@ class AppPresupuestos:
             }
             
             self.presupuesto_items.append(item)
+            self.acumulador_presupuesto.agregar(item)
             self.actualizar_tree_items()
             self.calcular_totales()
             
@@ -1157,7 +1242,7 @@ class AppPresupuestos:
                 'unidad_medida': 'unidad',
                 'cantidad': cantidad,
                 'precio_unitario': precio,
-                'subtotal': cantidad * precio,
+                'subtotal': importe_linea(cantidad, precio),
                 'visible_pdf': 1,
                 'es_tarea_manual': 1,
                 'aplica_iva': True,
@@ -1166,6 +1251,7 @@ class AppPresupuestos:
             }
             
             self.presupuesto_items.append(item)
+            self.acumulador_presupuesto.agregar(item)
             self.actualizar_tree_items()
             self.calcular_totales()
             
@@ -1187,7 +1273,7 @@ class AppPresupuestos:
         
         if messagebox.askyesno("Confirmar", "¿Está seguro de que desea eliminar este item?"):
             index = self.items_tree.index(selection[0])
-            del self.presupuesto_items[index]
+            self.acumulador_presupuesto.eliminar(self.presupuesto_items.pop(index))
             self.actualizar_tree_items()
             self.calcular_totales()
     
@@ -1227,41 +1313,44 @@ class AppPresupuestos:
             item['visible_pdf'] = 0
         self.actualizar_tree_items()
     
+    def valores_fila_item(self, item):
+        """Valores de la fila de un item en los Treeview de presupuesto y factura"""
+        # Determinar el tipo y descripción
+        if item.get('es_tarea_manual', 0):
+            tipo = "Tarea"
+            descripcion = item.get('tarea_manual', 'Tarea manual')
+        else:
+            tipo = "Material"
+            descripcion = f"{item['material_nombre']} ({item['unidad_medida']})"
+        
+        # Checkbox de visibilidad e IVA
+        visible = "✓" if item.get('visible_pdf', 1) else "✗"
+        aplica_iva = "✓" if item.get('aplica_iva', True) else "✗"
+        
+        # Calcular descuentos
+        descuento_pct = item.get('descuento_porcentaje', 0)
+        descuento_fijo = item.get('descuento_fijo', 0)
+        
+        descuento_pct_text = f"{descuento_pct:.1f}%" if descuento_pct > 0 else ""
+        descuento_fijo_text = f"€{descuento_fijo:.2f}" if descuento_fijo > 0 else ""
+        
+        return (
+            visible,
+            aplica_iva,
+            tipo,
+            descripcion,
+            f"{item['cantidad']:.2f}",
+            f"€{item['precio_unitario']:.2f}",
+            descuento_pct_text,
+            descuento_fijo_text,
+            f"€{item['subtotal']:.2f}"
+        )
+    
     def actualizar_tree_items(self):
-        for item in self.items_tree.get_children():
-            self.items_tree.delete(item)
-        
-        for i, item in enumerate(self.presupuesto_items):
-            # Determinar el tipo y descripción
-            if item.get('es_tarea_manual', 0):
-                tipo = "Tarea"
-                descripcion = item.get('tarea_manual', 'Tarea manual')
-            else:
-                tipo = "Material"
-                descripcion = f"{item['material_nombre']} ({item['unidad_medida']})"
-            
-            # Checkbox de visibilidad e IVA
-            visible = "✓" if item.get('visible_pdf', 1) else "✗"
-            aplica_iva = "✓" if item.get('aplica_iva', True) else "✗"
-            
-            # Calcular descuentos
-            descuento_pct = item.get('descuento_porcentaje', 0)
-            descuento_fijo = item.get('descuento_fijo', 0)
-            
-            descuento_pct_text = f"{descuento_pct:.1f}%" if descuento_pct > 0 else ""
-            descuento_fijo_text = f"€{descuento_fijo:.2f}" if descuento_fijo > 0 else ""
-            
-            self.items_tree.insert('', 'end', values=(
-                visible,
-                aplica_iva,
-                tipo,
-                descripcion,
-                f"{item['cantidad']:.2f}",
-                f"€{item['precio_unitario']:.2f}",
-                descuento_pct_text,
-                descuento_fijo_text,
-                f"€{item['subtotal']:.2f}"
-            ))
+        # Solo se insertan/borran/actualizan las filas que cambian (clave: identidad del item)
+        self.items_tree_sync.sincronizar(
+            (id(item), self.valores_fila_item(item)) for item in self.presupuesto_items
+        )
         
         # Actualizar contador de items
         total_items = len(self.presupuesto_items)
@@ -1288,13 +1377,16 @@ class AppPresupuestos:
         except ValueError:
             descuento_fijo = 0
         
+        # Resincronizar si la lista de items se modificó fuera del acumulador
+        if len(self.acumulador_presupuesto) != len(self.presupuesto_items):
+            self.acumulador_presupuesto.reiniciar(self.presupuesto_items)
+        
         # Verificar si hay items con IVA habilitado
-        items_con_iva = [item for item in self.presupuesto_items if item.get('aplica_iva', True)]
-        iva_realmente_habilitado = len(items_con_iva) > 0 and self.iva_habilitado_var.get()
+        lineas_con_iva = self.acumulador_presupuesto.lineas_con_iva
+        iva_realmente_habilitado = lineas_con_iva > 0 and self.iva_habilitado_var.get()
         
-        # Calcular totales usando el nuevo método del backend
-        totales = presupuesto_manager.calcular_totales_completo(
-            self.presupuesto_items,
+        # Totales a partir de los agregados, sin recorrer los items
+        totales = self.acumulador_presupuesto.totales(
             descuento_porcentaje,
             descuento_fijo,
             self.descuento_antes_iva_var.get(),
@@ -1325,7 +1417,7 @@ class AppPresupuestos:
         else:
             self.iva_label.config(foreground='#6c6f80')
             # Si ningún item tiene IVA, desactivar el checkbox
-            if len(items_con_iva) == 0 and self.presupuesto_items:
+            if lineas_con_iva == 0 and self.presupuesto_items:
                 self.iva_checkbox.config(state='disabled')
             else:
                 self.iva_checkbox.config(state='normal')
@@ -1413,6 +1505,7 @@ class AppPresupuestos:
                 self.presupuesto_items[item_index]['aplica_iva'] = aplica_iva_var.get()
                 self.presupuesto_items[item_index]['descuento_porcentaje'] = descuento_pct
                 self.presupuesto_items[item_index]['descuento_fijo'] = descuento_fijo
+                self.acumulador_presupuesto.reemplazar(self.presupuesto_items[item_index])
                 
                 # Actualizar visualización
                 self.actualizar_tree_items()
@@ -1437,8 +1530,10 @@ class AppPresupuestos:
         
         try:
             # Obtener ID del cliente
-            cliente_text = self.cliente_var.get()
-            cliente_id = int(cliente_text.split(' - ')[0])
+            cliente_id = self.combo_clientes.id_seleccionado()
+            if cliente_id is None:
+                messagebox.showwarning("Advertencia", "Seleccione un cliente")
+                return
             
             # Obtener estado del IVA
             iva_habilitado = self.iva_habilitado_var.get()
@@ -1608,6 +1703,7 @@ class AppPresupuestos:
         self.tarea_precio_entry.delete(0, tk.END)
         self.iva_habilitado_var.set(True)  # Resetear IVA a habilitado por defecto
         self.presupuesto_items.clear()
+        self.acumulador_presupuesto.reiniciar()
         self.actualizar_tree_items()
         self.calcular_totales()
     
@@ -1622,10 +1718,8 @@ class AppPresupuestos:
             return
         
         try:
-            # Obtener ID del cliente
-            cliente_text = self.cliente_var.get()
-            cliente_id = int(cliente_text.split(' - ')[0])
-            cliente = cliente_manager.obtener_cliente_por_id(cliente_id)
+            # Obtener el cliente del directorio en memoria
+            cliente = cliente_manager.directorio().cliente(self.combo_clientes.id_seleccionado())
             
             if not cliente:
                 messagebox.showerror("Error", "No se pudo obtener la información del cliente")
@@ -1691,36 +1785,46 @@ class AppPresupuestos:
             messagebox.showerror("Error", f"Error al generar vista previa:\n{str(e)}\n\nDetalles:\n{error_details}")
     
     def refresh_presupuestos(self):
+        if not self._pestana_construida(self.ver_presupuestos_frame):
+            # Se cargará al abrir la pestaña
+            return
         if hasattr(self, 'presupuesto_mes_combo') and hasattr(self, 'presupuesto_anio_combo'):
             self.cargar_filtros_fecha_presupuestos(mantener_seleccion=True)
         self.buscar_presupuestos()
     
-    def actualizar_tree_presupuestos(self, presupuestos):
-        for item in self.presupuestos_tree.get_children():
-            self.presupuestos_tree.delete(item)
-        
-        for presupuesto in presupuestos:
-            fecha = presupuesto['fecha_creacion'][:10]  # Solo la fecha
-            estado = presupuesto.get('estado', 'Pendiente')
-            
-            # Color del estado
-            item = self.presupuestos_tree.insert('', 'end', values=(
-                presupuesto['id'],
-                presupuesto['cliente_nombre'],
-                fecha,
-                f"€{presupuesto['subtotal']:.2f}",
-                f"€{presupuesto['iva']:.2f}",
-                f"€{presupuesto['total']:.2f}",
-                estado
-            ))
-            
-            # Colorear según el estado
-            if estado == 'Aprobado':
-                self.presupuestos_tree.set(item, 'Estado', '✅ Aprobado')
-            elif estado == 'Rechazado':
-                self.presupuestos_tree.set(item, 'Estado', '❌ Rechazado')
-            else:
-                self.presupuestos_tree.set(item, 'Estado', '⏳ Pendiente')
+    def actualizar_tree_presupuestos(self, termino: str = '', anio=None, mes=None, estado=None):
+        """Enlaza el listado virtual de presupuestos con la consulta paginada"""
+        def cargar(desplazamiento, limite):
+            return presupuesto_manager.buscar_presupuestos(termino, anio=anio, mes=mes, row_mode=ROW_RECORD,
+                                                           estado=estado, limite=limite,
+                                                           desplazamiento=desplazamiento)
+        
+        self.presupuestos_tree.cargar_origen(
+            lambda: presupuesto_manager.contar_presupuestos(termino, anio, mes, estado),
+            cargar, clave_origen=('presupuestos', termino, anio, mes, estado)
+        )
+    
+    def fila_presupuesto(self, presupuesto):
+        fecha = presupuesto['fecha_creacion'][:10]  # Solo la fecha
+        estado = presupuesto.get('estado', 'Pendiente')
+        
+        # Icono según el estado
+        if estado == 'Aprobado':
+            estado_texto = '✅ Aprobado'
+        elif estado == 'Rechazado':
+            estado_texto = '❌ Rechazado'
+        else:
+            estado_texto = '⏳ Pendiente'
+        
+        return presupuesto['id'], (
+            presupuesto['id'],
+            presupuesto['cliente_nombre'],
+            fecha,
+            f"€{presupuesto['subtotal']:.2f}",
+            f"€{presupuesto['iva']:.2f}",
+            f"€{presupuesto['total']:.2f}",
+            estado_texto
+        )
     
     def ver_detalle_presupuesto(self, event=None):
         selection = self.presupuestos_tree.selection()
@@ -1958,23 +2062,9 @@ class AppPresupuestos:
         anio_param = self._obtener_anio_desde_combo(getattr(self, 'presupuesto_anio_filtro_var', None))
         mes_param = self._obtener_mes_desde_combo(getattr(self, 'presupuesto_mes_filtro_var', None))
         
-        if termino:
-            presupuestos = presupuesto_manager.buscar_presupuestos(
-                termino,
-                anio=anio_param,
-                mes=mes_param
-            )
-        else:
-            presupuestos = presupuesto_manager.obtener_presupuestos(
-                anio=anio_param,
-                mes=mes_param
-            )
-        
-        # Aplicar filtro de estado
-        if estado_filtro != "Todos":
-            presupuestos = [p for p in presupuestos if p.get('estado', 'Pendiente') == estado_filtro]
-        
-        self.actualizar_tree_presupuestos(presupuestos)
+        # El estado se filtra en SQL para que el listado pueda paginarse
+        estado = estado_filtro if estado_filtro != "Todos" else None
+        self.actualizar_tree_presupuestos(termino, anio_param, mes_param, estado)
     
     def limpiar_busqueda_presupuestos(self):
         """Limpia la búsqueda y muestra todos los presupuestos"""
@@ -2163,10 +2253,13 @@ class AppPresupuestos:
     def guardar_configuracion(self):
         """Guarda la configuración en el archivo JSON"""
         try:
-            config = {
-                'carpeta_pdfs': self.carpeta_pdfs,
-                'carpeta_facturas': self.carpeta_facturas
-            }
+            # Conservar el resto de claves (p. ej. perfil_almacenamiento)
+            config = {}
+            if os.path.exists(self.config_file):
+                with open(self.config_file, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+            config['carpeta_pdfs'] = self.carpeta_pdfs
+            config['carpeta_facturas'] = self.carpeta_facturas
             with open(self.config_file, 'w', encoding='utf-8') as f:
                 json.dump(config, f, indent=2, ensure_ascii=False)
         except Exception as e:
@@ -2519,7 +2612,8 @@ class AppPresupuestos:
                 self.plantilla_config['margenes'] = {key: var.get() for key, var in vars_margenes.items()}
                 if not isinstance(self.plantilla_config.get('opciones_pdf'), dict):
                     self.plantilla_config['opciones_pdf'] = {}
-                self.plantilla_config['opciones_pdf']['mostrar_registro_mercantil'] = bool(self.config_mostrar_registro_var.get())
+                if hasattr(self, 'config_mostrar_registro_var'):
+                    self.plantilla_config['opciones_pdf']['mostrar_registro_mercantil'] = bool(self.config_mostrar_registro_var.get())
                 
                 # Guardar archivo
                 self.guardar_configuracion_plantilla()
@@ -2589,8 +2683,6 @@ class AppPresupuestos:
     
     def create_facturacion_tab(self):
         """Crea la pestaña de facturación"""
-        self.facturacion_frame = ttk.Frame(self.notebook)
-        self.notebook.add(self.facturacion_frame, text="Facturación")
         
         # Crear notebook interno para crear y ver facturas
         self.facturacion_notebook = ttk.Notebook(self.facturacion_frame)
@@ -2663,6 +2755,7 @@ class AppPresupuestos:
         self.factura_cliente_combo = ttk.Combobox(cliente_frame, textvariable=self.factura_cliente_var, width=40, state='readonly')
         self.factura_cliente_combo.grid(row=0, column=1, padx=(0, 10), pady=8, sticky='ew')
         self.factura_cliente_combo.bind('<<ComboboxSelected>>', self.on_cliente_select_factura)
+        self.combo_clientes_factura = ComboPorId(self.factura_cliente_combo, self.etiqueta_cliente)
         
         # Datos del cliente (editables)
         self.factura_cliente_info_frame = ttk.LabelFrame(cliente_frame, text="Datos del Cliente (Editable)", padding=10)
@@ -2809,6 +2902,7 @@ class AppPresupuestos:
         # Treeview para items
         columns = ('Visible', 'IVA', 'Tipo', 'Descripción', 'Cantidad', 'Precio Unit.', 'Desc. %', 'Desc. €', 'Subtotal')
         self.factura_items_tree = ttk.Treeview(items_list_frame, columns=columns, show='headings', height=8)
+        self.factura_items_tree_sync = SincronizadorFilas(self.factura_items_tree)
         
         for col in columns:
             self.factura_items_tree.heading(col, text=col)
@@ -2930,6 +3024,7 @@ class AppPresupuestos:
         
         # Lista para almacenar items de la factura
         self.factura_items = []
+        self.acumulador_factura = AcumuladorTotales(factura_manager.iva_porcentaje)
         
         # Actualizar combo de clientes y materiales
         self.actualizar_combo_clientes_factura()
@@ -3047,7 +3142,8 @@ class AppPresupuestos:
         
         # Treeview para facturas
         columns = ('ID', 'Nº Factura', 'Cliente', 'Fecha', 'Vencimiento', 'Total', 'Estado Pago')
-        self.facturas_tree = ttk.Treeview(main_frame, columns=columns, show='headings', height=18)
+        self.facturas_tree = ListaVirtual(main_frame, formatear=self.fila_factura,
+                                          columns=columns, show='headings', height=18)
         
         for col in columns:
             self.facturas_tree.heading(col, text=col)
@@ -3099,13 +3195,11 @@ class AppPresupuestos:
     
     def actualizar_combo_clientes_factura(self):
         """Actualiza el combo de clientes para facturas"""
-        clientes = cliente_manager.obtener_clientes()
-        cliente_names = [f"{c['id']} - {c['nombre']}" for c in clientes]
-        self.factura_cliente_combo['values'] = cliente_names
+        self.combo_clientes_factura.cargar(cliente_manager.directorio().todos())
     
     def actualizar_combo_materiales_factura(self):
         """Actualiza el combo de materiales para facturas"""
-        materiales = material_manager.obtener_materiales()
+        materiales = material_manager.catalogo().todos()
         material_names = [f"{m['id']} - {m['nombre']} ({m['unidad_medida']})" for m in materiales]
         self.factura_material_combo['values'] = material_names
         # Cargar materiales más utilizados para facturas
@@ -3148,13 +3242,8 @@ class AppPresupuestos:
         if ' - ' in termino_original:
             termino_original = termino_original.split(' - ', 1)[1].split(' (')[0]
         
-        termino = termino_original.lower()
-        if not termino:
-            # Si no hay término, mostrar todos
-            materiales = material_manager.obtener_materiales()
-        else:
-            # Buscar materiales
-            materiales = material_manager.buscar_materiales(termino)
+        # Filtrado en memoria sobre el catálogo (sin término devuelve todos)
+        materiales = material_manager.filtrar_materiales(termino_original)
         
         # Actualizar combo con materiales filtrados
         material_names = [f"{m['id']} - {m['nombre']} ({m['unidad_medida']})" for m in materiales]
@@ -3189,9 +3278,7 @@ class AppPresupuestos:
             return
         
         try:
-            cliente_text = self.factura_cliente_var.get()
-            cliente_id = int(cliente_text.split(' - ')[0])
-            cliente = cliente_manager.obtener_cliente_por_id(cliente_id)
+            cliente = cliente_manager.directorio().cliente(self.combo_clientes_factura.id_seleccionado())
             
             if cliente:
                 # Poblar Entry widgets con información del cliente
@@ -3230,7 +3317,10 @@ class AppPresupuestos:
             # Obtener material
             material_text = self.factura_material_var.get()
             material_id = int(material_text.split(' - ')[0])
-            material = self.materiales_data[material_id]
+            material = material_manager.catalogo().material(material_id)
+            if material is None:
+                messagebox.showerror("Error", "El material seleccionado ya no existe")
+                return
             
             # Crear item
             item = {
@@ -3240,7 +3330,7 @@ class AppPresupuestos:
                 'unidad_medida': material['unidad_medida'],
                 'cantidad': cantidad,
                 'precio_unitario': material['precio_unitario'],
-                'subtotal': cantidad * material['precio_unitario'],
+                'subtotal': importe_linea(cantidad, material['precio_unitario']),
                 'visible_pdf': 1,
                 'es_tarea_manual': 0,
                 'aplica_iva': True,
@@ -3249,6 +3339,7 @@ class AppPresupuestos:
             }
             
             self.factura_items.append(item)
+            self.acumulador_factura.agregar(item)
             self.actualizar_tree_items_factura()
             self.calcular_totales_factura()
             
@@ -3291,7 +3382,7 @@ class AppPresupuestos:
                 'unidad_medida': 'unidad',
                 'cantidad': cantidad,
                 'precio_unitario': precio,
-                'subtotal': cantidad * precio,
+                'subtotal': importe_linea(cantidad, precio),
                 'visible_pdf': 1,
                 'es_tarea_manual': 1,
                 'aplica_iva': True,
@@ -3300,6 +3391,7 @@ class AppPresupuestos:
             }
             
             self.factura_items.append(item)
+            self.acumulador_factura.agregar(item)
             self.actualizar_tree_items_factura()
             self.calcular_totales_factura()
             
@@ -3315,40 +3407,10 @@ class AppPresupuestos:
     
     def actualizar_tree_items_factura(self):
         """Actualiza el tree view de items de la factura"""
-        for item in self.factura_items_tree.get_children():
-            self.factura_items_tree.delete(item)
-        
-        for item in self.factura_items:
-            # Determinar tipo y descripción
-            if item.get('es_tarea_manual', 0):
-                tipo = "Tarea"
-                descripcion = item.get('tarea_manual', 'Tarea manual')
-            else:
-                tipo = "Material"
-                descripcion = f"{item['material_nombre']} ({item['unidad_medida']})"
-            
-            # Checkbox de visibilidad e IVA
-            visible = "✓" if item.get('visible_pdf', 1) else "✗"
-            aplica_iva = "✓" if item.get('aplica_iva', True) else "✗"
-            
-            # Calcular descuentos
-            descuento_pct = item.get('descuento_porcentaje', 0)
-            descuento_fijo = item.get('descuento_fijo', 0)
-            
-            descuento_pct_text = f"{descuento_pct:.1f}%" if descuento_pct > 0 else ""
-            descuento_fijo_text = f"€{descuento_fijo:.2f}" if descuento_fijo > 0 else ""
-            
-            self.factura_items_tree.insert('', 'end', values=(
-                visible,
-                aplica_iva,
-                tipo,
-                descripcion,
-                f"{item['cantidad']:.2f}",
-                f"€{item['precio_unitario']:.2f}",
-                descuento_pct_text,
-                descuento_fijo_text,
-                f"€{item['subtotal']:.2f}"
-            ))
+        # Solo se insertan/borran/actualizan las filas que cambian (clave: identidad del item)
+        self.factura_items_tree_sync.sincronizar(
+            (id(item), self.valores_fila_item(item)) for item in self.factura_items
+        )
         
         # Actualizar contador
         total_items = len(self.factura_items)
@@ -3376,9 +3438,13 @@ class AppPresupuestos:
         except ValueError:
             descuento_fijo = 0
         
+        # Resincronizar si la lista de items se modificó fuera del acumulador
+        if len(self.acumulador_factura) != len(self.factura_items):
+            self.acumulador_factura.reiniciar(self.factura_items)
+        
         # Verificar si hay items con IVA habilitado
-        items_con_iva = [item for item in self.factura_items if item.get('aplica_iva', True)]
-        iva_realmente_habilitado = len(items_con_iva) > 0 and self.factura_iva_habilitado_var.get()
+        lineas_con_iva = self.acumulador_factura.lineas_con_iva
+        iva_realmente_habilitado = lineas_con_iva > 0 and self.factura_iva_habilitado_var.get()
         
         # Obtener retención IRPF
         try:
@@ -3386,9 +3452,8 @@ class AppPresupuestos:
         except ValueError:
             retencion_irpf = None
         
-        # Calcular totales usando el nuevo método del backend
-        totales = factura_manager.calcular_totales_completo(
-            self.factura_items,
+        # Totales a partir de los agregados, sin recorrer los items
+        totales = self.acumulador_factura.totales(
             descuento_porcentaje,
             descuento_fijo,
             self.factura_descuento_antes_iva_var.get(),
@@ -3424,7 +3489,7 @@ class AppPresupuestos:
         else:
             self.factura_iva_label.config(foreground='#6c6f80')
             # Si ningún item tiene IVA, desactivar el checkbox
-            if len(items_con_iva) == 0 and self.factura_items:
+            if lineas_con_iva == 0 and self.factura_items:
                 self.factura_iva_checkbox.config(state='disabled')
             else:
                 self.factura_iva_checkbox.config(state='normal')
@@ -3512,6 +3577,7 @@ class AppPresupuestos:
                 self.factura_items[item_index]['aplica_iva'] = aplica_iva_var.get()
                 self.factura_items[item_index]['descuento_porcentaje'] = descuento_pct
                 self.factura_items[item_index]['descuento_fijo'] = descuento_fijo
+                self.acumulador_factura.reemplazar(self.factura_items[item_index])
                 
                 # Actualizar visualización
                 self.actualizar_tree_items_factura()
@@ -3558,7 +3624,7 @@ class AppPresupuestos:
         
         if messagebox.askyesno("Confirmar", "¿Está seguro de que desea eliminar este item?"):
             index = self.factura_items_tree.index(selection[0])
-            del self.factura_items[index]
+            self.acumulador_factura.eliminar(self.factura_items.pop(index))
             self.actualizar_tree_items_factura()
             self.calcular_totales_factura()
     
@@ -3590,8 +3656,10 @@ class AppPresupuestos:
         
         try:
             # Obtener ID del cliente
-            cliente_text = self.factura_cliente_var.get()
-            cliente_id = int(cliente_text.split(' - ')[0])
+            cliente_id = self.combo_clientes_factura.id_seleccionado()
+            if cliente_id is None:
+                messagebox.showwarning("Advertencia", "Seleccione un cliente")
+                return
             
             # Obtener otros datos
             numero_factura = self.numero_factura_var.get().strip()
@@ -3619,7 +3687,7 @@ class AppPresupuestos:
                 retencion_irpf = None
             
             # Validar que el cliente tenga NIF/NIE
-            cliente = cliente_manager.obtener_cliente_por_id(cliente_id)
+            cliente = cliente_manager.directorio().cliente(cliente_id)
             if not cliente or not cliente.get('dni') or not cliente.get('dni').strip():
                 if not messagebox.askyesno("Advertencia", 
                     "El cliente no tiene NIF/NIE/IVA Intracomunitario. ¿Desea continuar de todas formas?"):
@@ -3669,6 +3737,7 @@ class AppPresupuestos:
         self.factura_iva_habilitado_var.set(True)
         self.retencion_irpf_var.set("")
         self.factura_items.clear()
+        self.acumulador_factura.reiniciar()
         self.actualizar_tree_items_factura()
         self.calcular_totales_factura()
         self.generar_numero_factura_auto()
@@ -3715,21 +3784,32 @@ class AppPresupuestos:
         presupuestos_tree.pack(side='left', fill='both', expand=True)
         scrollbar.pack(side='right', fill='y')
         
-        # Cargar presupuestos
-        presupuestos = presupuesto_manager.obtener_presupuestos()
-        for p in presupuestos:
-            presupuestos_tree.insert('', 'end', values=(
-                p['id'],
-                p['cliente_nombre'],
-                p['fecha_creacion'][:10],
-                f"€{p['total']:.2f}",
-                p.get('estado', 'Pendiente')
-            ))
-        
         # Botones
         button_frame = ttk.Frame(dialog)
         button_frame.pack(fill='x', pady=(10, 0))
         
+        # Cargar presupuestos por páginas (cursor keyset), del más reciente al más antiguo
+        paginacion = {'cursor': None}
+        
+        def cargar_mas():
+            pagina = presupuesto_manager.listar_presupuestos_pagina(cursor=paginacion['cursor'], tamano=100,
+                                                                    row_mode=ROW_RECORD)
+            for p in pagina['filas']:
+                presupuestos_tree.insert('', 'end', values=(
+                    p['id'],
+                    p['cliente_nombre'],
+                    p['fecha_creacion'][:10],
+                    f"€{p['total']:.2f}",
+                    p.get('estado', 'Pendiente')
+                ))
+            paginacion['cursor'] = pagina['siguiente']
+            if not pagina['siguiente']:
+                cargar_mas_btn.config(state='disabled')
+        
+        cargar_mas_btn = ttk.Button(button_frame, text="⬇️ Cargar más", command=cargar_mas)
+        cargar_mas_btn.pack(side='left')
+        cargar_mas()
+        
         def importar():
             selection = presupuestos_tree.selection()
             if not selection:
@@ -3743,7 +3823,10 @@ class AppPresupuestos:
                 # Cargar datos del presupuesto
                 # Seleccionar cliente
                 cliente_id = presupuesto['cliente_id']
-                self.factura_cliente_var.set(f"{cliente_id} - {presupuesto['cliente_nombre']}")
+                if not self.combo_clientes_factura.seleccionar(cliente_id):
+                    # El combo puede no tener aún un cliente creado después de cargarlo
+                    self.actualizar_combo_clientes_factura()
+                    self.combo_clientes_factura.seleccionar(cliente_id)
                 self.on_cliente_select_factura()
                 
                 # Poblar Entry widgets con datos del cliente del presupuesto (sobrescribir si hay datos en el presupuesto)
@@ -3756,6 +3839,7 @@ class AppPresupuestos:
                 
                 # Cargar items
                 self.factura_items = presupuesto['items'].copy()
+                self.acumulador_factura.reiniciar(self.factura_items)
                 self.actualizar_tree_items_factura()
                 
                 # Cargar IVA
@@ -3789,9 +3873,8 @@ class AppPresupuestos:
         
         try:
             # Obtener datos
-            cliente_text = self.factura_cliente_var.get()
-            cliente_id = int(cliente_text.split(' - ')[0])
-            cliente = cliente_manager.obtener_cliente_por_id(cliente_id)
+            cliente_id = self.combo_clientes_factura.id_seleccionado()
+            cliente = cliente_manager.directorio().cliente(cliente_id)
             
             if not cliente:
                 messagebox.showerror("Error", "No se pudo obtener la información del cliente")
@@ -4044,34 +4127,35 @@ class AppPresupuestos:
             self.cargar_filtros_fecha_facturas(mantener_seleccion=True)
         self.buscar_facturas()
     
-    def actualizar_tree_facturas(self, facturas):
-        """Actualiza el treeview de facturas"""
-        for item in self.facturas_tree.get_children():
-            self.facturas_tree.delete(item)
-        
-        for factura in facturas:
-            fecha = factura['fecha_creacion'][:10]
-            fecha_venc = factura.get('fecha_vencimiento', '')
-            if fecha_venc and len(fecha_venc) > 10:
-                fecha_venc = fecha_venc[:10]
-            
-            estado = factura.get('estado_pago', 'No Pagada')
-            
-            item = self.facturas_tree.insert('', 'end', values=(
-                factura['id'],
-                factura.get('numero_factura', f"F{factura['id']:04d}"),
-                factura['cliente_nombre'],
-                fecha,
-                fecha_venc or 'N/A',
-                f"€{factura['total']:.2f}",
-                estado
-            ))
-            
-            # Colorear según estado
-            if estado == 'Pagada':
-                self.facturas_tree.set(item, 'Estado Pago', '✅ Pagada')
-            else:
-                self.facturas_tree.set(item, 'Estado Pago', '❌ No Pagada')
+    def actualizar_tree_facturas(self, termino: str = '', anio=None, mes=None, estado_pago=None):
+        """Enlaza el listado virtual de facturas con la consulta paginada"""
+        def cargar(desplazamiento, limite):
+            return factura_manager.buscar_facturas(termino, anio=anio, mes=mes, row_mode=ROW_RECORD,
+                                                   estado_pago=estado_pago, limite=limite,
+                                                   desplazamiento=desplazamiento)
+        
+        self.facturas_tree.cargar_origen(
+            lambda: factura_manager.contar_facturas(termino, anio, mes, estado_pago),
+            cargar, clave_origen=('facturas', termino, anio, mes, estado_pago)
+        )
+    
+    def fila_factura(self, factura):
+        fecha = factura['fecha_creacion'][:10]
+        fecha_venc = factura.get('fecha_vencimiento', '')
+        if fecha_venc and len(fecha_venc) > 10:
+            fecha_venc = fecha_venc[:10]
+        
+        estado = factura.get('estado_pago', 'No Pagada')
+        
+        return factura['id'], (
+            factura['id'],
+            factura.get('numero_factura', f"F{factura['id']:04d}"),
+            factura['cliente_nombre'],
+            fecha,
+            fecha_venc or 'N/A',
+            f"€{factura['total']:.2f}",
+            '✅ Pagada' if estado == 'Pagada' else '❌ No Pagada'
+        )
     
     def buscar_facturas(self, event=None):
         """Busca facturas por término"""
@@ -4080,23 +4164,9 @@ class AppPresupuestos:
         anio_param = self._obtener_anio_desde_combo(getattr(self, 'factura_anio_filtro_var', None))
         mes_param = self._obtener_mes_desde_combo(getattr(self, 'factura_mes_filtro_var', None))
         
-        if termino:
-            facturas = factura_manager.buscar_facturas(
-                termino,
-                anio=anio_param,
-                mes=mes_param
-            )
-        else:
-            facturas = factura_manager.obtener_facturas(
-                anio=anio_param,
-                mes=mes_param
-            )
-        
-        # Aplicar filtro de estado
-        if estado_filtro != "Todos":
-            facturas = [f for f in facturas if f.get('estado_pago', 'No Pagada') == estado_filtro]
-        
-        self.actualizar_tree_facturas(facturas)
+        # El estado se filtra en SQL para que el listado pueda paginarse
+        estado_pago = estado_filtro if estado_filtro != "Todos" else None
+        self.actualizar_tree_facturas(termino, anio_param, mes_param, estado_pago)
     
     def limpiar_busqueda_facturas(self):
         """Limpia la búsqueda de facturas"""
@@ -4803,10 +4873,8 @@ class AppPresupuestos:
 
     def create_metricas_tab(self):
         """Crea la pestaña de métricas con estadísticas de presupuestos y facturas"""
-        self.metricas_frame = ttk.Frame(self.notebook)
-        self.notebook.add(self.metricas_frame, text="Métricas")
         
-        if not MATPLOTLIB_AVAILABLE:
+        if not _importar_matplotlib():
             error_frame = ttk.Frame(self.metricas_frame)
             error_frame.pack(fill='both', expand=True, padx=20, pady=20)
             
@@ -4842,6 +4910,10 @@ También puedes configurar tu IDE para usar el Python del venv:
                      foreground='#ef4444').pack(expand=True, padx=20, pady=20)
             return
         
+        # Indicador de carga mientras se consultan las métricas en segundo plano
+        self.metricas_estado_label = ttk.Label(self.metricas_frame, text="", foreground='#6c6f80')
+        self.metricas_estado_label.pack(anchor='e', padx=20, pady=(6, 0))
+        
         # Frame principal con scrollbar
         main_frame = ttk.Frame(self.metricas_frame)
         main_frame.pack(fill='both', expand=True, padx=10, pady=10)
@@ -5344,6 +5416,67 @@ También puedes configurar tu IDE para usar el Python del venv:
                 meses.append(f"{nombre_mes} {año} ({mes})")
         return meses
     
+    def _cargar_panel_metricas(self, panel, filtro, consulta, mostrar):
+        """Consulta en segundo plano los datos de un panel de métricas y los muestra al llegar.
+        
+        Si el panel ya muestra ese filtro sin escrituras posteriores no se consulta
+        nada. Una carga nueva del mismo panel descarta la que estuviera en curso.
+        """
+        clave = (filtro, db.generacion)
+        if self._vistas_metricas.get(panel) == clave:
+            self.cargas_metricas.cancelar(panel)
+            self._marcar_carga_metricas(panel, False)
+            return
+        
+        def consultar():
+            try:
+                return consulta(), None
+            except Exception as e:
+                return None, e
+        
+        def aplicar(resultado):
+            datos, error = resultado
+            self._marcar_carga_metricas(panel, False)
+            if error is not None:
+                print(f"Error cargando las métricas '{panel}': {error}")
+                return
+            mostrar(datos)
+            self._vistas_metricas[panel] = clave
+        
+        if panel not in self._vistas_metricas:
+            self._dibujar_cargando(panel)
+        self._marcar_carga_metricas(panel, True)
+        self.cargas_metricas.programar(panel, consultar, aplicar, retardo_ms=0)
+    
+    def _marcar_carga_metricas(self, panel, cargando):
+        """Anota los paneles pendientes y muestra el indicador de carga mientras quede alguno"""
+        if cargando:
+            self._metricas_cargando.add(panel)
+        else:
+            self._metricas_cargando.discard(panel)
+        if hasattr(self, 'metricas_estado_label'):
+            pendientes = len(self._metricas_cargando)
+            self.metricas_estado_label.config(text=f"⏳ Cargando métricas ({pendientes})..." if pendientes else "")
+    
+    def _dibujar_cargando(self, panel):
+        """Marcador en el gráfico de un panel que aún no tiene datos"""
+        graficos = {
+            'presupuestos': 'presupuestos',
+            'facturas': 'facturas',
+            'top_clientes': 'clientes',
+            'top_materiales': 'materiales',
+            'evolucion': 'evolucion',
+        }
+        if panel not in graficos:
+            return
+        ax = getattr(self, f"ax_{graficos[panel]}", None)
+        canvas = getattr(self, f"canvas_{graficos[panel]}", None)
+        if ax is None or canvas is None:
+            return
+        ax.clear()
+        ax.text(0.5, 0.5, 'Cargando...', ha='center', va='center', fontsize=12, color='#6c6f80')
+        canvas.draw_idle()
+    
     def on_mes_changed_presupuestos(self, event=None):
         """Maneja el cambio de mes en el filtro de presupuestos"""
         self.actualizar_metricas_presupuestos()
@@ -5387,8 +5520,16 @@ También puedes configurar tu IDE para usar el Python del venv:
                     else:
                         fecha_fin = f"{año}-02-28"
         
-        # Obtener estadísticas
-        stats = presupuesto_manager.obtener_estadisticas_presupuestos(fecha_inicio, fecha_fin)
+        def consulta():
+            return (presupuesto_manager.obtener_estadisticas_presupuestos(fecha_inicio, fecha_fin),
+                    presupuesto_manager.obtener_tasa_conversion_presupuestos(fecha_inicio, fecha_fin))
+        
+        self._cargar_panel_metricas('presupuestos', (fecha_inicio, fecha_fin), consulta,
+                                    self._mostrar_metricas_presupuestos)
+    
+    def _mostrar_metricas_presupuestos(self, datos):
+        """Muestra las métricas y el gráfico de presupuestos ya consultados"""
+        stats, conversion = datos
         
         total = stats['total_emitidos']
         pendientes = stats['pendientes']
@@ -5418,7 +5559,6 @@ También puedes configurar tu IDE para usar el Python del venv:
         self.promedio_presupuesto_label.config(text=f"Promedio por Presupuesto: €{promedio:.2f}")
         
         # Tasa de conversión
-        conversion = presupuesto_manager.obtener_tasa_conversion_presupuestos(fecha_inicio, fecha_fin)
         tasa = conversion.get('tasa_conversion', 0) or 0
         self.tasa_conversion_label.config(text=f"Tasa Conversión: {tasa:.1f}%")
         
@@ -5485,8 +5625,16 @@ También puedes configurar tu IDE para usar el Python del venv:
                     else:
                         fecha_fin = f"{año}-02-28"
         
-        # Obtener estadísticas
-        stats = factura_manager.obtener_estadisticas_facturas(fecha_inicio, fecha_fin)
+        def consulta():
+            return (factura_manager.obtener_estadisticas_facturas(fecha_inicio, fecha_fin),
+                    factura_manager.obtener_dias_promedio_cobro(fecha_inicio, fecha_fin))
+        
+        self._cargar_panel_metricas('facturas', (fecha_inicio, fecha_fin), consulta,
+                                    self._mostrar_metricas_facturas)
+    
+    def _mostrar_metricas_facturas(self, datos):
+        """Muestra las métricas y el gráfico de facturas ya consultados"""
+        stats, dias_promedio = datos
         
         total = stats['total_emitidas']
         no_pagadas = stats['no_pagadas']
@@ -5505,7 +5653,6 @@ También puedes configurar tu IDE para usar el Python del venv:
         total_facturado = stats.get('total_facturado', 0) or 0
         pendiente_cobro = stats.get('total_pendiente_cobro', 0) or 0
         promedio = stats.get('promedio_factura', 0) or 0
-        dias_promedio = factura_manager.obtener_dias_promedio_cobro(fecha_inicio, fecha_fin)
         
         self.total_facturado_label.config(text=f"Total Facturado: €{total_facturado:.2f}")
         self.pendiente_cobro_label.config(text=f"Pendiente de Cobro: €{pendiente_cobro:.2f}")
@@ -5554,14 +5701,23 @@ También puedes configurar tu IDE para usar el Python del venv:
         fecha_inicio_anterior = primer_dia_mes_anterior.strftime("%Y-%m-%d")
         fecha_fin_anterior = ultimo_dia_mes_anterior.strftime("%Y-%m-%d")
         
+        def consulta():
+            return (factura_manager.obtener_estadisticas_facturas(fecha_inicio_mes, fecha_fin_mes),
+                    factura_manager.obtener_estadisticas_facturas(fecha_inicio_anterior, fecha_fin_anterior))
+        
+        self._cargar_panel_metricas('dashboard', (fecha_inicio_mes, fecha_fin_mes), consulta,
+                                    self._mostrar_dashboard_financiero)
+    
+    def _mostrar_dashboard_financiero(self, datos):
+        """Muestra los KPIs del mes actual frente al anterior"""
+        stats_actual, stats_anterior = datos
+        
         # Estadísticas mes actual
-        stats_actual = factura_manager.obtener_estadisticas_facturas(fecha_inicio_mes, fecha_fin_mes)
         facturacion_actual = stats_actual.get('total_facturado', 0) or 0
         pendiente_actual = stats_actual.get('total_pendiente_cobro', 0) or 0
         promedio_actual = stats_actual.get('promedio_factura', 0) or 0
         
         # Estadísticas mes anterior
-        stats_anterior = factura_manager.obtener_estadisticas_facturas(fecha_inicio_anterior, fecha_fin_anterior)
         facturacion_anterior = stats_anterior.get('total_facturado', 0) or 0
         
         # Calcular comparación
@@ -5580,9 +5736,18 @@ También puedes configurar tu IDE para usar el Python del venv:
     
     def actualizar_analisis_cobranza(self):
         """Actualiza el análisis de cobranza con facturas vencidas y próximas"""
-        # Facturas vencidas
-        vencidas_data = factura_manager.obtener_facturas_vencidas()
+        def consulta():
+            return (factura_manager.obtener_facturas_vencidas(),
+                    factura_manager.obtener_facturas_proximas_vencer(30))
+        
+        self._cargar_panel_metricas('cobranza', (datetime.now().strftime("%Y-%m-%d"),), consulta,
+                                    self._mostrar_analisis_cobranza)
+    
+    def _mostrar_analisis_cobranza(self, datos):
+        """Rellena las tablas de facturas vencidas y próximas a vencer"""
+        vencidas_data, proximas_data = datos
         
+        # Facturas vencidas
         # Limpiar tabla
         for item in self.facturas_vencidas_tree.get_children():
             self.facturas_vencidas_tree.delete(item)
@@ -5602,8 +5767,6 @@ También puedes configurar tu IDE para usar el Python del venv:
         self.monto_total_vencido_label.config(text=f"Monto Total Vencido: €{monto_total_vencido:.2f}")
         
         # Facturas próximas a vencer
-        proximas_data = factura_manager.obtener_facturas_proximas_vencer(30)
-        
         # Limpiar tabla
         for item in self.facturas_proximas_tree.get_children():
             self.facturas_proximas_tree.delete(item)
@@ -5648,8 +5811,12 @@ También puedes configurar tu IDE para usar el Python del venv:
                     else:
                         fecha_fin = f"{año}-02-28"
         
-        top_clientes = factura_manager.obtener_top_clientes_facturas(fecha_inicio, fecha_fin, 10)
-        
+        self._cargar_panel_metricas('top_clientes', (fecha_inicio, fecha_fin),
+                                    lambda: factura_manager.obtener_top_clientes_facturas(fecha_inicio, fecha_fin, 10),
+                                    self._mostrar_top_clientes)
+    
+    def _mostrar_top_clientes(self, top_clientes):
+        """Rellena la tabla y el gráfico de top clientes"""
         # Limpiar tabla
         for item in self.top_clientes_tree.get_children():
             self.top_clientes_tree.delete(item)
@@ -5707,8 +5874,12 @@ También puedes configurar tu IDE para usar el Python del venv:
                     else:
                         fecha_fin = f"{año}-02-28"
         
-        top_materiales = material_manager.obtener_top_materiales(fecha_inicio, fecha_fin, 10)
-        
+        self._cargar_panel_metricas('top_materiales', (fecha_inicio, fecha_fin),
+                                    lambda: material_manager.obtener_top_materiales(fecha_inicio, fecha_fin, 10),
+                                    self._mostrar_top_materiales)
+    
+    def _mostrar_top_materiales(self, top_materiales):
+        """Rellena las tablas y el gráfico de top materiales"""
         # Limpiar tablas
         for item in self.top_materiales_ingresos_tree.get_children():
             self.top_materiales_ingresos_tree.delete(item)
@@ -5757,10 +5928,8 @@ También puedes configurar tu IDE para usar el Python del venv:
         
         self.canvas_materiales.draw()
     
-    def actualizar_comparaciones_temporales(self):
-        """Actualiza las comparaciones temporales con gráfico de evolución"""
-        evolucion = factura_manager.obtener_evolucion_facturacion_mensual(12)
-        
+    def _mostrar_evolucion_facturacion(self, evolucion):
+        """Dibuja la evolución mensual de facturación de los últimos 12 meses"""
         self.ax_evolucion.clear()
         
         if evolucion:
@@ -5795,6 +5964,13 @@ También puedes configurar tu IDE para usar el Python del venv:
             self.ax_evolucion.grid(True, alpha=0.3)
         
         self.canvas_evolucion.draw()
+
+    def actualizar_comparaciones_temporales(self):
+        """Actualiza las comparaciones temporales con gráfico de evolución"""
+        # La evolución no depende del mes elegido: solo se recarga si hay cambios
+        self._cargar_panel_metricas('evolucion', (datetime.now().strftime("%Y-%m-%d"),),
+                                    lambda: factura_manager.obtener_evolucion_facturacion_mensual(12),
+                                    self._mostrar_evolucion_facturacion)
         
         # Actualizar descuentos
         mes_seleccionado = self.mes_filtro_facturas_var.get()
@@ -5820,8 +5996,15 @@ También puedes configurar tu IDE para usar el Python del venv:
                     else:
                         fecha_fin = f"{año}-02-28"
         
-        stats_facturas = factura_manager.obtener_estadisticas_facturas(fecha_inicio, fecha_fin)
-        stats_presupuestos = presupuesto_manager.obtener_estadisticas_presupuestos(fecha_inicio, fecha_fin)
+        def consulta():
+            return (factura_manager.obtener_estadisticas_facturas(fecha_inicio, fecha_fin),
+                    presupuesto_manager.obtener_estadisticas_presupuestos(fecha_inicio, fecha_fin))
+        
+        self._cargar_panel_metricas('descuentos', (fecha_inicio, fecha_fin), consulta, self._mostrar_descuentos)
+    
+    def _mostrar_descuentos(self, datos):
+        """Muestra el total y el promedio de descuentos aplicados"""
+        stats_facturas, stats_presupuestos = datos
         
         total_descuentos_facturas = stats_facturas.get('total_descuentos', 0) or 0
         total_descuentos_presupuestos = stats_presupuestos.get('total_descuentos', 0) or 0
@@ -5846,6 +6029,7 @@ También puedes configurar tu IDE para usar el Python del venv:
             # Guardar configuración antes de cerrar
             self.guardar_configuracion()
             self.guardar_configuracion_plantilla()
+            db.close_all()
             self.root.destroy()
         except Exception as e:
             print(f"Error al cerrar la aplicación: {e}")
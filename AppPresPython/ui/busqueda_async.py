@@ -0,0 +1,128 @@
+"""
+Búsquedas en segundo plano para los campos que filtran mientras se escribe.
+
+Cada pulsación reprograma la búsqueda (debounce). Cuando el usuario deja de
+escribir, la consulta se ejecuta en un hilo de trabajo y su resultado se
+aplica en el hilo de Tk mediante after(). Si entretanto llega una búsqueda
+más nueva para el mismo campo, la antigua se salta o su resultado se descarta.
+
+La pestaña de Métricas usa otra instancia (sin retardo) para cargar sus
+paneles: la clave es el panel y un filtro nuevo anula la carga anterior.
+"""
+
+import queue
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+Consulta = Callable[[], Any]
+Aplicador = Callable[[Any], None]
+
+
+class ProgramadorBusquedas:
+    """Programa búsquedas por clave (una por campo) con debounce y descarte de resultados obsoletos"""
+
+    RETARDO_MS = 250
+    INTERVALO_SONDEO_MS = 20
+
+    def __init__(self, root, retardo_ms: int = RETARDO_MS):
+        self.root = root
+        self.retardo_ms = retardo_ms
+        self._generaciones: Dict[Hashable, int] = {}
+        self._temporizadores: Dict[Hashable, str] = {}
+        self._lock = threading.Lock()
+        self._tareas: "queue.Queue" = queue.Queue()
+        self._resultados: "queue.Queue" = queue.Queue()
+        self._en_curso = 0
+        self._sondeo: Optional[str] = None
+        # Un solo hilo: las búsquedas se atienden en orden y cada una usa la
+        # conexión a la base de datos propia de ese hilo
+        self._hilo = threading.Thread(target=self._trabajar, name='busquedas', daemon=True)
+        self._hilo.start()
+
+    def programar(self, clave: Hashable, consulta: Consulta, aplicar: Aplicador,
+                  retardo_ms: Optional[int] = None):
+        """Ejecuta consulta() en segundo plano tras retardo_ms y llama a aplicar(resultado) en Tk.
+
+        Una nueva llamada con la misma clave anula la anterior si aún no ha
+        terminado: su resultado ya no se aplicará.
+        """
+        generacion = self._siguiente_generacion(clave)
+        self._cancelar_temporizador(clave)
+        retardo = self.retardo_ms if retardo_ms is None else retardo_ms
+        self._temporizadores[clave] = self.root.after(
+            retardo, lambda: self._lanzar(clave, generacion, consulta, aplicar)
+        )
+
+    def cancelar(self, clave: Hashable):
+        """Descarta la búsqueda pendiente o en curso de esa clave"""
+        self._siguiente_generacion(clave)
+        self._cancelar_temporizador(clave)
+
+    # -- Hilo de Tk ------------------------------------------------------
+
+    def _siguiente_generacion(self, clave: Hashable) -> int:
+        with self._lock:
+            generacion = self._generaciones.get(clave, 0) + 1
+            self._generaciones[clave] = generacion
+        return generacion
+
+    def _vigente(self, clave: Hashable, generacion: int) -> bool:
+        with self._lock:
+            return self._generaciones.get(clave) == generacion
+
+    def _cancelar_temporizador(self, clave: Hashable):
+        temporizador = self._temporizadores.pop(clave, None)
+        if temporizador:
+            try:
+                self.root.after_cancel(temporizador)
+            except Exception:
+                pass
+
+    def _lanzar(self, clave: Hashable, generacion: int, consulta: Consulta, aplicar: Aplicador):
+        self._temporizadores.pop(clave, None)
+        if not self._vigente(clave, generacion):
+            return
+        self._en_curso += 1
+        self._tareas.put((clave, generacion, consulta, aplicar))
+        if self._sondeo is None:
+            self._sondeo = self.root.after(self.INTERVALO_SONDEO_MS, self._sondear)
+
+    def _sondear(self):
+        """Aplica en el hilo de Tk los resultados que ya ha dejado el hilo de trabajo"""
+        self._sondeo = None
+        while True:
+            try:
+                clave, generacion, aplicar, resultado, error = self._resultados.get_nowait()
+            except queue.Empty:
+                break
+            self._en_curso -= 1
+            if aplicar is None or not self._vigente(clave, generacion):
+                continue
+            if error is not None:
+                print(f"Error en la búsqueda '{clave}': {error}")
+                continue
+            try:
+                aplicar(resultado)
+            except Exception as e:
+                print(f"Error mostrando los resultados de '{clave}': {e}")
+
+        if self._en_curso > 0:
+            try:
+                self._sondeo = self.root.after(self.INTERVALO_SONDEO_MS, self._sondear)
+            except Exception:
+                # La ventana ya se ha cerrado
+                self._sondeo = None
+
+    # -- Hilo de trabajo -----------------------------------------------------
+
+    def _trabajar(self):
+        while True:
+            clave, generacion, consulta, aplicar = self._tareas.get()
+            if not self._vigente(clave, generacion):
+                # Ya hay una búsqueda más nueva: ni siquiera se consulta
+                self._resultados.put((clave, generacion, None, None, None))
+                continue
+            try:
+                self._resultados.put((clave, generacion, aplicar, consulta(), None))
+            except Exception as e:
+                self._resultados.put((clave, generacion, aplicar, None, e))
@@ -0,0 +1,44 @@
+"""
+Combobox de solo lectura enlazado a los IDs de sus opciones.
+
+Las opciones se muestran como texto ("id - nombre") pero la selección se
+lee y se fija por ID, sin volver a interpretar el texto mostrado.
+"""
+
+from tkinter import ttk
+from typing import Any, Callable, Dict, List, Optional
+
+
+class ComboPorId:
+    """Guarda el ID de cada opción de un ttk.Combobox y traduce selección <-> ID"""
+
+    def __init__(self, combo: ttk.Combobox, etiqueta: Callable[[Dict[str, Any]], str], campo_id: str = 'id'):
+        self.combo = combo
+        self.etiqueta = etiqueta
+        self.campo_id = campo_id
+        self._ids: List[Any] = []
+        self._posiciones: Dict[Any, int] = {}
+
+    def cargar(self, registros: List[Dict[str, Any]]):
+        """Sustituye las opciones conservando la selección actual si sigue existiendo"""
+        seleccionado = self.id_seleccionado()
+        self._ids = [registro[self.campo_id] for registro in registros]
+        self._posiciones = {id_: posicion for posicion, id_ in enumerate(self._ids)}
+        self.combo['values'] = [self.etiqueta(registro) for registro in registros]
+        if seleccionado is not None and not self.seleccionar(seleccionado):
+            self.combo.set('')
+
+    def id_seleccionado(self) -> Optional[Any]:
+        """ID de la opción elegida (None si no hay ninguna)"""
+        posicion = self.combo.current()
+        if 0 <= posicion < len(self._ids):
+            return self._ids[posicion]
+        return None
+
+    def seleccionar(self, id_: Any) -> bool:
+        """Selecciona la opción de ese ID; devuelve False si no está entre las opciones"""
+        posicion = self._posiciones.get(id_)
+        if posicion is None:
+            return False
+        self.combo.current(posicion)
+        return True
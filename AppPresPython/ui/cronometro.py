@@ -0,0 +1,27 @@
+"""
+Cronómetro de fases para medir el arranque de la aplicación.
+
+Solo imprime en modo depuración (``python main.py --debug``); si no, sus
+llamadas no hacen nada.
+"""
+
+import time
+from typing import Optional
+
+
+class Cronometro:
+    """Imprime el tiempo de cada fase y el acumulado desde el inicio"""
+
+    def __init__(self, activo: bool = False, inicio: Optional[float] = None):
+        self.activo = activo
+        self.inicio = time.perf_counter() if inicio is None else inicio
+        self._ultima = self.inicio
+
+    def fase(self, nombre: str):
+        """Anota el final de una fase"""
+        if not self.activo:
+            return
+        ahora = time.perf_counter()
+        print(f"[arranque] {nombre}: {(ahora - self._ultima) * 1000:.0f} ms "
+              f"(total {(ahora - self.inicio) * 1000:.0f} ms)")
+        self._ultima = ahora
@@ -330,7 +330,7 @@ def _bind_tab_transitions(root_widget):
     try:
         for w in root_widget.winfo_children():
             if w.winfo_class() == "TNotebook":
-                w.bind("<<NotebookTabChanged>>", _on_tab_changed)
+                w.bind("<<NotebookTabChanged>>", _on_tab_changed, add="+")
                 break
     except Exception:
         pass
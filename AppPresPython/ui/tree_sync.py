@@ -0,0 +1,67 @@
+"""
+Sincronización incremental de filas de un ttk.Treeview.
+
+En lugar de borrar y reinsertar todas las filas, se compara la lista deseada
+(clave estable + valores) con lo que ya muestra el Treeview y solo se hacen
+las llamadas a Tk necesarias: insertar, borrar, mover o actualizar valores.
+"""
+
+from tkinter import ttk
+from typing import Dict, Hashable, Iterable, List, Sequence, Tuple
+
+
+class SincronizadorFilas:
+    """Mantiene las filas de primer nivel de un Treeview alineadas con una lista por clave"""
+
+    def __init__(self, tree: ttk.Treeview):
+        self.tree = tree
+        self._valores: Dict[str, Tuple] = {}
+        self._orden: List[str] = []
+
+    def sincronizar(self, filas: Iterable[Tuple[Hashable, Sequence]]) -> int:
+        """Aplica la lista de filas (clave, valores) y devuelve el número de cambios en Tk"""
+        deseadas = [(str(clave), tuple(valores)) for clave, valores in filas]
+        claves = {clave for clave, _ in deseadas}
+        cambios = 0
+
+        # Si el Treeview se vació por otra vía, olvidar el estado guardado
+        if self._orden and not self.tree.get_children():
+            self._valores.clear()
+            self._orden = []
+
+        sobrantes = [clave for clave in self._orden if clave not in claves]
+        if sobrantes:
+            self.tree.delete(*sobrantes)
+            for clave in sobrantes:
+                del self._valores[clave]
+            cambios += len(sobrantes)
+
+        orden = [clave for clave in self._orden if clave in claves]
+        for posicion, (clave, valores) in enumerate(deseadas):
+            if clave not in self._valores:
+                self.tree.insert('', posicion, iid=clave, values=valores)
+                orden.insert(posicion, clave)
+                self._valores[clave] = valores
+                cambios += 1
+                continue
+
+            if orden[posicion] != clave:
+                self.tree.move(clave, '', posicion)
+                orden.remove(clave)
+                orden.insert(posicion, clave)
+                cambios += 1
+
+            if self._valores[clave] != valores:
+                self.tree.item(clave, values=valores)
+                self._valores[clave] = valores
+                cambios += 1
+
+        self._orden = orden
+        return cambios
+
+    def limpiar(self):
+        """Elimina todas las filas gestionadas"""
+        if self._orden:
+            self.tree.delete(*self._orden)
+        self._valores.clear()
+        self._orden = []
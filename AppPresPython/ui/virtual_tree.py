@@ -0,0 +1,258 @@
+"""
+Treeview virtualizado para listados grandes.
+
+Solo se materializan en Tk las filas de la ventana visible; los datos se
+piden a la base de datos por páginas (desplazamiento + límite) según se
+hace scroll y se guardan unas pocas páginas alrededor como búfer. La barra
+de scroll representa el total de filas del origen, no las filas de Tk.
+"""
+
+from collections import OrderedDict
+from tkinter import ttk
+from typing import Any, Callable, Hashable, List, Optional, Sequence, Tuple
+
+from .tree_sync import SincronizadorFilas
+
+# formatear(fila) -> (clave estable de la fila, valores de las columnas)
+Formateador = Callable[[Any], Tuple[Hashable, Sequence]]
+Contador = Callable[[], int]
+Cargador = Callable[[int, int], List[Any]]
+
+
+class ListaVirtual(ttk.Treeview):
+    """Treeview que muestra una ventana de un origen paginado de filas"""
+
+    TAMANO_PAGINA = 100
+    PAGINAS_EN_BUFER = 8
+    ALTO_FILA_POR_DEFECTO = 20
+
+    def __init__(self, master=None, formatear: Optional[Formateador] = None,
+                 tamano_pagina: int = TAMANO_PAGINA, **kw):
+        self._yscrollcommand = kw.pop('yscrollcommand', None)
+        super().__init__(master, **kw)
+        self.formatear = formatear or (lambda fila: (fila[0], tuple(fila)))
+        self.tamano_pagina = tamano_pagina
+
+        self._sync = SincronizadorFilas(self)
+        self._contar: Optional[Contador] = None
+        self._cargar: Optional[Cargador] = None
+        self._clave_origen: Any = object()
+        self._paginas: "OrderedDict[int, List[Tuple[str, Tuple]]]" = OrderedDict()
+        self._total = 0
+        self._inicio = 0
+        self._filas_visibles = int(self.cget('height') or 10)
+        self._seleccion: set = set()
+        self._render_pendiente = False
+
+        self.bind('<Configure>', self._on_configure, add='+')
+        self.bind('<MouseWheel>', self._on_rueda, add='+')
+        self.bind('<Button-4>', lambda e: self._desplazar(-3), add='+')
+        self.bind('<Button-5>', lambda e: self._desplazar(3), add='+')
+        self.bind('<<TreeviewSelect>>', self._on_seleccion, add='+')
+        for tecla, paso in (('<Up>', -1), ('<Down>', 1), ('<Prior>', 'pagina-'), ('<Next>', 'pagina+'),
+                            ('<Home>', 'inicio'), ('<End>', 'fin')):
+            self.bind(tecla, lambda e, paso=paso: self._on_tecla(paso))
+
+    # -- Configuración -------------------------------------------------
+
+    def configure(self, cnf=None, **kw):
+        # La barra de scroll la gobierna la ventana virtual, no el Treeview
+        if isinstance(cnf, dict) and 'yscrollcommand' in cnf:
+            cnf = dict(cnf)
+            self._yscrollcommand = cnf.pop('yscrollcommand')
+        if 'yscrollcommand' in kw:
+            self._yscrollcommand = kw.pop('yscrollcommand')
+            if not kw and not cnf:
+                self._actualizar_scrollbar()
+                return None
+        return super().configure(cnf, **kw)
+
+    config = configure
+
+    def cargar_origen(self, contar: Contador, cargar: Cargador, clave_origen: Any = None,
+                      total: Optional[int] = None, primera_pagina: Optional[List[Any]] = None):
+        """Enlaza el listado con un origen paginado.
+
+        Si clave_origen coincide con la del origen anterior (p. ej. mismos
+        filtros tras guardar un cambio) se conserva la posición y la selección.
+        total y primera_pagina permiten pasar datos ya consultados (p. ej. en
+        segundo plano) para no repetir esas consultas en el hilo de Tk.
+        """
+        mismo_origen = clave_origen is not None and clave_origen == self._clave_origen
+        self._contar = contar
+        self._cargar = cargar
+        self._clave_origen = clave_origen
+        self._paginas.clear()
+        if primera_pagina is not None:
+            self._paginas[0] = self._formatear_pagina(primera_pagina)
+        self._total = max(0, int((contar() if total is None else total) or 0))
+        if not mismo_origen:
+            self._inicio = 0
+            self._seleccion.clear()
+        self._render()
+
+    def recargar(self):
+        """Vuelve a consultar el origen actual conservando posición y selección"""
+        if self._contar and self._cargar:
+            self.cargar_origen(self._contar, self._cargar, self._clave_origen)
+
+    @property
+    def total(self) -> int:
+        return self._total
+
+    # -- Datos -----------------------------------------------------------
+
+    def _pagina(self, numero: int) -> List[Tuple[str, Tuple]]:
+        pagina = self._paginas.get(numero)
+        if pagina is not None:
+            self._paginas.move_to_end(numero)
+            return pagina
+
+        filas = self._cargar(numero * self.tamano_pagina, self.tamano_pagina) if self._cargar else []
+        pagina = self._formatear_pagina(filas)
+        self._paginas[numero] = pagina
+        while len(self._paginas) > self.PAGINAS_EN_BUFER:
+            self._paginas.popitem(last=False)
+        return pagina
+
+    def _formatear_pagina(self, filas: List[Any]) -> List[Tuple[str, Tuple]]:
+        pagina = []
+        for fila in filas:
+            clave, valores = self.formatear(fila)
+            pagina.append((str(clave), tuple(valores)))
+        return pagina
+
+    def _filas(self, inicio: int, cantidad: int) -> List[Tuple[str, Tuple]]:
+        fin = min(self._total, inicio + cantidad)
+        filas: List[Tuple[str, Tuple]] = []
+        if fin <= inicio:
+            return filas
+        for numero in range(inicio // self.tamano_pagina, (fin - 1) // self.tamano_pagina + 1):
+            base = numero * self.tamano_pagina
+            pagina = self._pagina(numero)
+            filas.extend(pagina[max(0, inicio - base):fin - base])
+        return filas
+
+    # -- Ventana visible ---------------------------------------------------
+
+    def _max_inicio(self) -> int:
+        return max(0, self._total - self._filas_visibles)
+
+    def _render(self):
+        self._render_pendiente = False
+        self._inicio = min(max(0, self._inicio), self._max_inicio())
+        filas = self._filas(self._inicio, self._filas_visibles)
+
+        self._sync.sincronizar(filas)
+        claves = [clave for clave, _ in filas]
+        seleccion = [clave for clave in claves if clave in self._seleccion]
+        if tuple(seleccion) != tuple(self.selection()):
+            self.selection_set(seleccion)
+        # El Treeview nunca desplaza su contenido: la ventana ya es lo visible
+        super().yview_moveto(0)
+        self._actualizar_scrollbar()
+
+    def _programar_render(self):
+        if not self._render_pendiente:
+            self._render_pendiente = True
+            self.after_idle(self._render)
+
+    def _actualizar_scrollbar(self):
+        if not self._yscrollcommand:
+            return
+        if self._total <= 0:
+            self._yscrollcommand(0.0, 1.0)
+            return
+        primero = self._inicio / self._total
+        ultimo = min(1.0, (self._inicio + self._filas_visibles) / self._total)
+        self._yscrollcommand(primero, ultimo)
+
+    def _desplazar(self, filas: int):
+        nuevo = min(max(0, self._inicio + filas), self._max_inicio())
+        if nuevo != self._inicio:
+            self._inicio = nuevo
+            self._programar_render()
+        return 'break'
+
+    def yview(self, *args):
+        """Comando de la barra de scroll expresado sobre el total de filas"""
+        if not args:
+            if self._total <= 0:
+                return (0.0, 1.0)
+            return (self._inicio / self._total,
+                    min(1.0, (self._inicio + self._filas_visibles) / self._total))
+        if args[0] == 'moveto':
+            self._inicio = int(float(args[1]) * self._total)
+            self._programar_render()
+        elif args[0] == 'scroll':
+            cantidad = int(args[1])
+            paso = self._filas_visibles if args[2] == 'pages' else 1
+            self._desplazar(cantidad * paso)
+        return None
+
+    def see(self, item):
+        # Las filas materializadas siempre están a la vista
+        if self.exists(item):
+            return None
+        return super().see(item)
+
+    # -- Eventos -------------------------------------------------------------
+
+    def _on_configure(self, event=None):
+        hijos = self.get_children()
+        caja = self.bbox(hijos[0]) if hijos else None
+        if caja:
+            cabecera, alto_fila = caja[1], caja[3]
+        else:
+            alto_fila = int(ttk.Style(self).lookup('Treeview', 'rowheight') or self.ALTO_FILA_POR_DEFECTO)
+            cabecera = alto_fila
+        visibles = max(1, (self.winfo_height() - cabecera) // max(1, alto_fila))
+        if visibles != self._filas_visibles:
+            self._filas_visibles = visibles
+            self._programar_render()
+
+    def _on_rueda(self, event):
+        if event.delta:
+            pasos = -int(event.delta / 120) if abs(event.delta) >= 120 else (-1 if event.delta > 0 else 1)
+            return self._desplazar(pasos * 3)
+        return 'break'
+
+    def _on_seleccion(self, event=None):
+        if self._render_pendiente:
+            return
+        visibles = set(self.get_children())
+        self._seleccion = (self._seleccion - visibles) | set(self.selection())
+
+    def _on_tecla(self, paso):
+        hijos = self.get_children()
+        if not hijos:
+            return 'break'
+        foco = self.focus()
+        posicion = hijos.index(foco) if foco in hijos else 0
+        actual = self._inicio + posicion
+
+        if paso == 'inicio':
+            destino = 0
+        elif paso == 'fin':
+            destino = self._total - 1
+        elif paso == 'pagina-':
+            destino = actual - self._filas_visibles
+        elif paso == 'pagina+':
+            destino = actual + self._filas_visibles
+        else:
+            destino = actual + paso
+        destino = min(max(0, destino), self._total - 1)
+
+        if destino < self._inicio:
+            self._inicio = destino
+        elif destino >= self._inicio + self._filas_visibles:
+            self._inicio = destino - self._filas_visibles + 1
+        self._render()
+
+        hijos = self.get_children()
+        indice = destino - self._inicio
+        if 0 <= indice < len(hijos):
+            clave = hijos[indice]
+            self.focus(clave)
+            self.selection_set((clave,))
+        return 'break'